@@ -21,10 +21,32 @@ from pathlib import Path
 if str(Path(__file__).parent.parent) not in sys.path:
     sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from utils import json_utils
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+_COMPLEXITIES = ("简单", "中等", "复杂")
+
+
+# 分析任务说明（静态文本，放在消息开头以命中提示词前缀缓存）
+_ANALYSIS_PROMPT = """请深入分析用户问题，并返回以下信息（JSON格式）：
+{
+    "problem_summary": "问题摘要",
+    "root_cause": "根本原因分析",
+    "key_parameters": {
+        "订单号": "如有",
+        "产品名称": "如有",
+        "问题时间": "如有",
+        "其他关键信息": "..."
+    },
+    "affected_areas": ["受影响的功能/模块列表"],
+    "complexity": "复杂度（简单/中等/复杂）",
+    "confidence": "对以上判断的把握程度（0 到 1 之间的数字）",
+    "solution_approach": "建议的解决方向",
+    "analysis_report": "详细分析报告"
+}"""
+
 
 class AnalystAgent(BaseAgent):
     """问题分析师智能体"""
@@ -77,29 +99,10 @@ class AnalystAgent(BaseAgent):
         messages = self._build_messages(
             user_input=user_input,
             conversation_history=conversation_history,
-            context=analysis_context
+            context=analysis_context,
+            instructions=_ANALYSIS_PROMPT
         )
         
-        # 添加分析提示
-        analysis_prompt = """请深入分析用户问题，并返回以下信息（JSON格式）：
-{
-    "problem_summary": "问题摘要",
-    "root_cause": "根本原因分析",
-    "key_parameters": {
-        "订单号": "如有",
-        "产品名称": "如有",
-        "问题时间": "如有",
-        "其他关键信息": "..."
-    },
-    "affected_areas": ["受影响的功能/模块列表"],
-    "complexity": "复杂度（简单/中等/复杂）",
-    "solution_approach": "建议的解决方向",
-    "analysis_report": "详细分析报告"
-}"""
-        
-        from langchain_core.messages import HumanMessage
-        messages.append(HumanMessage(content=analysis_prompt))
-        
         # 调用 LLM
         try:
             response = await self._invoke_llm(messages)
@@ -117,6 +120,7 @@ class AnalystAgent(BaseAgent):
                 "key_parameters": analysis_result.get("key_parameters", {}),
                 "affected_areas": analysis_result.get("affected_areas", []),
                 "complexity": analysis_result.get("complexity", "中等"),
+                "confidence": analysis_result.get("confidence", 0),
                 "solution_approach": analysis_result.get("solution_approach", ""),
                 "analysis_report": analysis_result.get("analysis_report", response)
             }
@@ -124,10 +128,10 @@ class AnalystAgent(BaseAgent):
             state["current_agent"] = self.name
             state["next_agent"] = "solution_expert"
             
-            logger.info(f"{self.name} 分析完成: {analysis_result.get('complexity')}")
+            logger.info("{} 分析完成: {}", self.name, analysis_result.get('complexity'))
             
         except Exception as e:
-            logger.error(f"{self.name} 分析失败: {e}")
+            logger.error("{} 分析失败: {}", self.name, e)
             state["error"] = str(e)
             state["next_agent"] = None
         
@@ -146,6 +150,14 @@ class AnalystAgent(BaseAgent):
             "analysis_report": response
         }
         
+        # 复杂度和置信度决定后续路由（是否由小模型直接作答），回复是 JSON 对象时按原值读取
+        data = json_utils.loads_object(response)
+        if data is not None:
+            if data.get("complexity") in _COMPLEXITIES:
+                result["complexity"] = data["complexity"]
+            if "confidence" in data:
+                result["confidence"] = data["confidence"]
+        
         # 简单的参数提取
         import re
         
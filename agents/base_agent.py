@@ -3,7 +3,7 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional, List
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
+from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, SystemMessage
 
 import sys
 from pathlib import Path
@@ -90,37 +90,38 @@ class BaseAgent(ABC):
             )
             return response.content
         except Exception as e:
-            logger.error(f"{self.name} LLM调用失败: {e}")
+            logger.error("{} LLM调用失败: {}", self.name, e)
             raise
     
     def _build_messages(
         self,
         user_input: str,
         conversation_history: Optional[List[Dict[str, str]]] = None,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[Dict[str, Any]] = None,
+        instructions: Optional[str] = None
     ) -> List[BaseMessage]:
         """
         构建消息列表
         
+        按 [系统提示词 + 任务说明][对话历史][上下文信息][用户输入] 排列：不变的部分在前，
+        每次调用的前缀逐字节相同，可以命中服务商的提示词前缀缓存（DeepSeek/OpenAI 自动启用），
+        每轮都会变化的上下文放在后面。
+        
         Args:
             user_input: 用户输入
             conversation_history: 对话历史
             context: 上下文信息
+            instructions: 任务说明（静态文本，如输出格式要求）
             
         Returns:
             消息列表
         """
         messages = []
         
-        # 添加系统提示词
-        if self.system_prompt:
-            messages.append(HumanMessage(content=self.system_prompt))
-        
-        # 添加上下文信息
-        if context:
-            context_str = self._format_context(context)
-            if context_str:
-                messages.append(HumanMessage(content=f"上下文信息：\n{context_str}"))
+        # 添加系统提示词和任务说明
+        static_prompt = "\n\n".join(part for part in (self.system_prompt, instructions) if part)
+        if static_prompt:
+            messages.append(SystemMessage(content=static_prompt))
         
         # 添加对话历史
         if conversation_history:
@@ -130,6 +131,12 @@ class BaseAgent(ABC):
                 elif msg.get("role") == "assistant":
                     messages.append(AIMessage(content=msg.get("content", "")))
         
+        # 添加上下文信息
+        if context:
+            context_str = self._format_context(context)
+            if context_str:
+                messages.append(HumanMessage(content=f"上下文信息：\n{context_str}"))
+        
         # 添加当前用户输入
         messages.append(HumanMessage(content=user_input))
         
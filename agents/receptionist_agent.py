@@ -26,6 +26,18 @@ from utils.logger import get_logger
 logger = get_logger(__name__)
 
 
+# 分类任务说明（静态文本，放在消息开头以命中提示词前缀缓存）
+_CLASSIFICATION_PROMPT = """请分析用户问题，并返回以下信息（JSON格式）：
+{
+    "greeting": "欢迎语",
+    "problem_category": "问题类别（订单问题/产品咨询/技术支持/投诉建议/其他）",
+    "urgency": "紧急程度（高/中/低）",
+    "needs_analysis": true/false,  // 是否需要转交给问题分析师
+    "response": "你的回复内容",
+    "missing_info": ["需要补充的信息列表"]
+}"""
+
+
 class ReceptionistAgent(BaseAgent):
     """接待员智能体"""
     
@@ -63,23 +75,10 @@ class ReceptionistAgent(BaseAgent):
         messages = self._build_messages(
             user_input=user_input,
             conversation_history=conversation_history,
-            context=state.get("context", {})
+            context=state.get("context", {}),
+            instructions=_CLASSIFICATION_PROMPT
         )
         
-        # 添加分类提示
-        classification_prompt = """请分析用户问题，并返回以下信息（JSON格式）：
-{
-    "greeting": "欢迎语",
-    "problem_category": "问题类别（订单问题/产品咨询/技术支持/投诉建议/其他）",
-    "urgency": "紧急程度（高/中/低）",
-    "needs_analysis": true/false,  // 是否需要转交给问题分析师
-    "response": "你的回复内容",
-    "missing_info": ["需要补充的信息列表"]
-}"""
-        
-        from langchain_core.messages import HumanMessage
-        messages.append(HumanMessage(content=classification_prompt))
-        
         # 调用 LLM
         try:
             response = await self._invoke_llm(messages)
@@ -102,10 +101,10 @@ class ReceptionistAgent(BaseAgent):
             state["current_agent"] = self.name
             state["next_agent"] = "analyst" if classification_result.get("needs_analysis", True) else None
             
-            logger.info(f"{self.name} 处理完成: {classification_result.get('problem_category', '未知')}")
+            logger.info("{} 处理完成: {}", self.name, classification_result.get('problem_category', '未知'))
             
         except Exception as e:
-            logger.error(f"{self.name} 处理失败: {e}")
+            logger.error("{} 处理失败: {}", self.name, e)
             state["error"] = str(e)
             state["next_agent"] = None
         
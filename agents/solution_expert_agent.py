@@ -26,6 +26,22 @@ from utils.logger import get_logger
 logger = get_logger(__name__)
 
 
+# 解决方案任务说明（静态文本，放在消息开头以命中提示词前缀缓存）
+_SOLUTION_PROMPT = """请基于分析结果和工具结果提供简洁、直接的解决方案。
+
+重要提示：
+1. 如果工具结果中有直接答案（如时间、日期、车票信息、文件内容等），请直接使用工具结果回答用户，不要生成复杂的JSON格式。
+2. 如果工具结果为空或查询失败，请提供简洁、友好的错误提示，而不是复杂的JSON格式。
+3. 对于常见问题（如"如何查询订单"），请提供简洁的步骤说明，而不是复杂的JSON结构。
+
+请用自然语言直接回答用户，格式如下：
+- 如果有工具结果：直接使用工具结果回答
+- 如果查询失败：简洁说明失败原因和可能的解决方案
+- 如果是常见问题：提供简洁的步骤说明
+
+不要返回JSON格式，直接返回自然语言回答。"""
+
+
 class SolutionExpertAgent(BaseAgent):
     """解决方案专家智能体"""
     
@@ -79,16 +95,17 @@ class SolutionExpertAgent(BaseAgent):
         messages = self._build_messages(
             user_input=user_input,
             conversation_history=conversation_history,
-            context=solution_context
+            context=solution_context,
+            instructions=_SOLUTION_PROMPT
         )
         
         # 检查是否有工具结果，如果有且是简单查询（如时间、日期），直接使用工具结果
-        logger.info(f"检查工具结果: {list(tool_results.keys())}")
+        logger.debug("检查工具结果: {}", list(tool_results.keys()))
         if tool_results:
             # 时间查询
             if "time_info" in tool_results:
                 time_info = tool_results.get("time_info", {})
-                logger.info(f"找到时间信息: {time_info}")
+                logger.debug("找到时间信息: {}", time_info)
                 # 工具结果可能是 {"success": True, "data": {...}} 或直接是 data
                 if isinstance(time_info, dict):
                     time_data = time_info.get("data", time_info)
@@ -103,13 +120,13 @@ class SolutionExpertAgent(BaseAgent):
                             state["current_agent"] = self.name
                             state["next_agent"] = None
                             state["is_complete"] = True
-                            logger.info(f"{self.name} 直接返回时间查询结果: {time_str}")
+                            logger.info("{} 直接返回时间查询结果: {}", self.name, time_str)
                             return state
             
             # 日期查询
             if "date_info" in tool_results:
                 date_info = tool_results.get("date_info", {})
-                logger.info(f"找到日期信息: {date_info}, 类型: {type(date_info)}")
+                logger.debug("找到日期信息: {}, 类型: {}", date_info, type(date_info))
                 # 工具结果格式：{"success": True, "data": {...}}
                 if isinstance(date_info, dict):
                     # 先检查是否有 success 字段（说明是工具管理器返回的格式）
@@ -119,7 +136,7 @@ class SolutionExpertAgent(BaseAgent):
                         # 否则直接使用 date_info
                         date_data = date_info
                     
-                    logger.info(f"日期数据: {date_data}, 类型: {type(date_data)}")
+                    logger.debug("日期数据: {}, 类型: {}", date_data, type(date_data))
                     if isinstance(date_data, dict) and date_data.get("success"):
                         date_str = date_data.get("date", "")
                         weekday = date_data.get("weekday", "")
@@ -131,7 +148,7 @@ class SolutionExpertAgent(BaseAgent):
                             state["current_agent"] = self.name
                             state["next_agent"] = None
                             state["is_complete"] = True
-                            logger.info(f"{self.name} 直接返回日期查询结果: {date_str} {weekday}")
+                            logger.info("{} 直接返回日期查询结果: {} {}", self.name, date_str, weekday)
                             return state
                     # 如果 date_data 没有 success 字段，但直接有 date 字段，也尝试使用
                     elif isinstance(date_data, dict) and date_data.get("date"):
@@ -145,13 +162,13 @@ class SolutionExpertAgent(BaseAgent):
                             state["current_agent"] = self.name
                             state["next_agent"] = None
                             state["is_complete"] = True
-                            logger.info(f"{self.name} 直接返回日期查询结果（无success字段）: {date_str}")
+                            logger.info("{} 直接返回日期查询结果（无success字段）: {}", self.name, date_str)
                             return state
             
             # 天气查询
             if "weather" in tool_results:
                 weather_info = tool_results.get("weather", {})
-                logger.info(f"找到天气信息: {weather_info}")
+                logger.debug("找到天气信息: {}", weather_info)
                 if isinstance(weather_info, dict):
                     # 工具结果格式：{"success": True, "data": {...}}
                     if weather_info.get("success") and "data" in weather_info:
@@ -159,7 +176,7 @@ class SolutionExpertAgent(BaseAgent):
                     else:
                         weather_data = weather_info
                     
-                    logger.info(f"天气数据: {weather_data}")
+                    logger.debug("天气数据: {}", weather_data)
                     if isinstance(weather_data, dict) and weather_data.get("success"):
                         city = weather_data.get("city", "该城市")
                         temp = weather_data.get("temperature", 0)
@@ -184,13 +201,13 @@ class SolutionExpertAgent(BaseAgent):
                         state["current_agent"] = self.name
                         state["next_agent"] = None
                         state["is_complete"] = True
-                        logger.info(f"{self.name} 直接返回天气查询结果: {city}")
+                        logger.info("{} 直接返回天气查询结果: {}", self.name, city)
                         return state
             
             # 火车票查询
             if "train_tickets" in tool_results:
                 train_info = tool_results.get("train_tickets", {})
-                logger.info(f"找到火车票信息: {train_info}")
+                logger.debug("找到火车票信息: {}", train_info)
                 if isinstance(train_info, dict):
                     # 工具结果格式：{"success": True, "data": {...}}
                     if train_info.get("success") and "data" in train_info:
@@ -198,7 +215,7 @@ class SolutionExpertAgent(BaseAgent):
                     else:
                         train_data = train_info
                     
-                    logger.info(f"火车票数据: {train_data}")
+                    logger.debug("火车票数据: {}", train_data)
                     if isinstance(train_data, dict) and train_data.get("success"):
                         from_station = train_data.get("from_station", "")
                         to_station = train_data.get("to_station", "")
@@ -250,7 +267,7 @@ class SolutionExpertAgent(BaseAgent):
                         state["current_agent"] = self.name
                         state["next_agent"] = None
                         state["is_complete"] = True
-                        logger.info(f"{self.name} 直接返回火车票查询结果: {from_station} -> {to_station}")
+                        logger.info("{} 直接返回火车票查询结果: {} -> {}", self.name, from_station, to_station)
                         return state
                     # 如果查询失败（success=False）
                     elif isinstance(train_data, dict) and not train_data.get("success"):
@@ -262,13 +279,13 @@ class SolutionExpertAgent(BaseAgent):
                         state["current_agent"] = self.name
                         state["next_agent"] = None
                         state["is_complete"] = True
-                        logger.info(f"{self.name} 返回火车票查询错误: {error_msg}")
+                        logger.info("{} 返回火车票查询错误: {}", self.name, error_msg)
                         return state
             
             # 文件内容查询
             if "file_content" in tool_results:
                 file_info = tool_results.get("file_content", {})
-                logger.info(f"找到文件内容: {file_info}")
+                logger.debug("找到文件内容: {}", file_info)
                 if isinstance(file_info, dict):
                     # 工具结果格式：{"success": True, "data": {...}}
                     if file_info.get("success") and "data" in file_info:
@@ -276,7 +293,7 @@ class SolutionExpertAgent(BaseAgent):
                     else:
                         file_data = file_info
                     
-                    logger.info(f"文件数据: {file_data}")
+                    logger.debug("文件数据: {}", file_data)
                     if isinstance(file_data, dict) and file_data.get("success"):
                         content = file_data.get("content", "")
                         file_path = file_data.get("path", "")
@@ -298,7 +315,7 @@ class SolutionExpertAgent(BaseAgent):
                         state["current_agent"] = self.name
                         state["next_agent"] = None
                         state["is_complete"] = True
-                        logger.info(f"{self.name} 直接返回文件内容: {file_path}")
+                        logger.info("{} 直接返回文件内容: {}", self.name, file_path)
                         return state
                     # 如果文件读取失败
                     elif isinstance(file_data, dict) and not file_data.get("success"):
@@ -313,13 +330,13 @@ class SolutionExpertAgent(BaseAgent):
                         state["current_agent"] = self.name
                         state["next_agent"] = None
                         state["is_complete"] = True
-                        logger.info(f"{self.name} 返回文件读取错误: {error_msg}")
+                        logger.info("{} 返回文件读取错误: {}", self.name, error_msg)
                         return state
             
             # 知识库查询
             if "knowledge_base" in tool_results:
                 kb_info = tool_results.get("knowledge_base", {})
-                logger.info(f"找到知识库信息: {kb_info}")
+                logger.debug("找到知识库信息: {}", kb_info)
                 if isinstance(kb_info, dict):
                     # 工具结果格式：{"success": True, "data": {...}}
                     if kb_info.get("success") and "data" in kb_info:
@@ -327,7 +344,7 @@ class SolutionExpertAgent(BaseAgent):
                     else:
                         kb_data = kb_info
                     
-                    logger.info(f"知识库数据: {kb_data}")
+                    logger.debug("知识库数据: {}", kb_data)
                     if isinstance(kb_data, dict) and kb_data.get("success"):
                         results = kb_data.get("results", [])
                         query = kb_data.get("query", "")
@@ -364,7 +381,7 @@ class SolutionExpertAgent(BaseAgent):
                         state["current_agent"] = self.name
                         state["next_agent"] = None
                         state["is_complete"] = True
-                        logger.info(f"{self.name} 直接返回知识库查询结果: {query}")
+                        logger.info("{} 直接返回知识库查询结果: {}", self.name, query)
                         return state
                     # 如果查询失败
                     elif isinstance(kb_data, dict) and not kb_data.get("success"):
@@ -376,27 +393,9 @@ class SolutionExpertAgent(BaseAgent):
                         state["current_agent"] = self.name
                         state["next_agent"] = None
                         state["is_complete"] = True
-                        logger.info(f"{self.name} 返回知识库查询错误: {error_msg}")
+                        logger.info("{} 返回知识库查询错误: {}", self.name, error_msg)
                         return state
         
-        # 添加解决方案提示
-        solution_prompt = """请基于分析结果和工具结果提供简洁、直接的解决方案。
-
-重要提示：
-1. 如果工具结果中有直接答案（如时间、日期、车票信息、文件内容等），请直接使用工具结果回答用户，不要生成复杂的JSON格式。
-2. 如果工具结果为空或查询失败，请提供简洁、友好的错误提示，而不是复杂的JSON格式。
-3. 对于常见问题（如"如何查询订单"），请提供简洁的步骤说明，而不是复杂的JSON结构。
-
-请用自然语言直接回答用户，格式如下：
-- 如果有工具结果：直接使用工具结果回答
-- 如果查询失败：简洁说明失败原因和可能的解决方案
-- 如果是常见问题：提供简洁的步骤说明
-
-不要返回JSON格式，直接返回自然语言回答。"""
-        
-        from langchain_core.messages import HumanMessage
-        messages.append(HumanMessage(content=solution_prompt))
-        
         # 调用 LLM
         try:
             response = await self._invoke_llm(messages)
@@ -421,10 +420,10 @@ class SolutionExpertAgent(BaseAgent):
             state["next_agent"] = None  # 流程结束
             state["is_complete"] = True
             
-            logger.info(f"{self.name} 解决方案生成完成")
+            logger.info("{} 解决方案生成完成", self.name)
             
         except Exception as e:
-            logger.error(f"{self.name} 解决方案生成失败: {e}")
+            logger.error("{} 解决方案生成失败: {}", self.name, e)
             state["error"] = str(e)
             state["next_agent"] = None
         
@@ -1,7 +1,9 @@
 """FastAPI 应用 - Web API 模式"""
 
+import asyncio
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
@@ -11,12 +13,12 @@ sys.path.insert(0, str(Path(__file__).parent))
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import os
 
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
 # DeepSeek 支持（可选，如果 langchain_community 版本支持）
 try:
@@ -27,6 +29,9 @@ except ImportError:
 
 from workflow.customer_service_graph import CustomerServiceGraph
 from memory.memory_store import MemoryStore
+from memory.semantic_cache import SemanticCache
+from tools.mcp_tools import close_shared_tool_manager
+from utils import json_utils
 from utils.logger import setup_logging, get_logger
 
 # 加载环境变量
@@ -56,8 +61,13 @@ app.add_middleware(
 graph: Optional[CustomerServiceGraph] = None
 
 
-def create_llm():
-    """创建语言模型"""
+def create_llm(model: Optional[str] = None):
+    """
+    创建语言模型
+    
+    Args:
+        model: 模型名称，默认取 LLM_MODEL
+    """
     provider = os.getenv("LLM_PROVIDER", "deepseek").lower()
     
     if provider == "deepseek":
@@ -72,7 +82,7 @@ def create_llm():
             raise ValueError("请设置 DEEPSEEK_API_KEY 环境变量")
         
         return ChatDeepSeek(
-            model=os.getenv("LLM_MODEL", "deepseek-chat"),
+            model=model or os.getenv("LLM_MODEL", "deepseek-chat"),
             temperature=float(os.getenv("LLM_TEMPERATURE", "0.7")),
             max_tokens=int(os.getenv("LLM_MAX_TOKENS", "2000")),
             api_key=api_key
@@ -83,7 +93,7 @@ def create_llm():
             raise ValueError("请设置 OPENAI_API_KEY 环境变量")
         
         # 如果模型名称是 deepseek-chat，自动改为 gpt-3.5-turbo
-        model = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+        model = model or os.getenv("LLM_MODEL", "gpt-3.5-turbo")
         if model == "deepseek-chat":
             model = "gpt-3.5-turbo"
             logger.warning("检测到 LLM_MODEL=deepseek-chat 但使用 OpenAI，自动改为 gpt-3.5-turbo")
@@ -96,11 +106,31 @@ def create_llm():
         )
 
 
+def create_semantic_cache() -> Optional[SemanticCache]:
+    """创建语义回复缓存（配置了 SEMANTIC_CACHE_EMBEDDING_MODEL 时启用，使用 OpenAI 兼容的向量化接口）"""
+    model = os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL")
+    if not model:
+        return None
+    
+    embeddings = OpenAIEmbeddings(
+        model=model,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("SEMANTIC_CACHE_EMBEDDING_BASE_URL") or None
+    )
+    threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    ttl = float(os.getenv("SEMANTIC_CACHE_TTL", "600"))
+    logger.info("已启用语义回复缓存: {}, 相似度阈值 {}, 缓存时间 {} 秒", model, threshold, ttl)
+    return SemanticCache(embeddings, threshold=threshold, ttl=ttl)
+
+
 @app.on_event("startup")
 async def startup_event():
     """启动事件"""
     global graph
     try:
+        # 扩大默认线程池，文件等阻塞操作通过 asyncio.to_thread 并发执行
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=32))
+        
         logger.info("正在初始化系统...")
         
         # 先检查环境变量
@@ -120,14 +150,35 @@ async def startup_event():
         logger.info(f"实际使用的 LLM 提供商: {provider.upper()}")
         logger.info(f"实际使用的 LLM 模型: {model}")
         
+        # 接待员只做意图分类和路由，可配置更小更快的模型
+        small_model = os.getenv("LLM_SMALL_MODEL")
+        small_llm = create_llm(small_model) if small_model else None
+        if small_model:
+            logger.info("接待员使用的 LLM 模型: {}", small_model)
+        
         memory_store = MemoryStore()
-        graph = CustomerServiceGraph(llm=llm, memory_store=memory_store)
+        graph = CustomerServiceGraph(
+            llm=llm,
+            memory_store=memory_store,
+            semantic_cache=create_semantic_cache(),
+            small_llm=small_llm
+        )
         logger.info("系统初始化完成！")
     except Exception as e:
         logger.error(f"系统初始化失败: {e}")
         raise
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭事件"""
+    if graph:
+        await graph.aclose()
+    await close_shared_tool_manager()
+    # 等待队列中的日志写完
+    await logger.complete()
+
+
 # 请求模型
 class ChatRequest(BaseModel):
     user_id: str
@@ -189,6 +240,42 @@ async def chat(request: ChatRequest):
         )
 
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    流式处理聊天请求
+    
+    以换行分隔的 JSON 逐行返回：生成过程中的 {"type": "token", "content": ...}，
+    最后一行为 {"type": "result", ...}（字段与 /api/chat 的响应相同）。
+    
+    Args:
+        request: 聊天请求
+        
+    Returns:
+        流式响应
+    """
+    if graph is None:
+        raise HTTPException(status_code=503, detail="系统未初始化")
+    
+    async def events():
+        async for event in graph.process_message_stream(
+            user_id=request.user_id,
+            message=request.message,
+            session_id=request.session_id
+        ):
+            if event["type"] == "result":
+                event = {
+                    "type": "result",
+                    "session_id": event.get("session_id"),
+                    "response": event.get("response", ""),
+                    "needs_human_intervention": event.get("needs_human_intervention", False),
+                    "error": event.get("error")
+                }
+            yield json_utils.dumps(event) + "\n"
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
 @app.get("/api/health")
 async def health():
     """健康检查"""
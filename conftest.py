@@ -0,0 +1,8 @@
+"""pytest 配置：将项目根目录加入导入路径（各模块不再自行修改 sys.path）"""
+
+import sys
+from pathlib import Path
+
+project_root = str(Path(__file__).parent)
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
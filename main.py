@@ -3,7 +3,9 @@
 import asyncio
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
 
 # 添加项目根目录到路径
 sys.path.insert(0, str(Path(__file__).parent))
@@ -18,8 +20,15 @@ except ImportError:
     # 如果导入失败，使用 OpenAI 兼容方式
     ChatDeepSeek = None
 
+# uvloop 支持（可选，安装后使用更快的事件循环实现）
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 from workflow.customer_service_graph import CustomerServiceGraph
 from memory.memory_store import MemoryStore
+from tools.mcp_tools import close_shared_tool_manager
 from utils.logger import setup_logging, get_logger
 
 # 加载环境变量
@@ -30,8 +39,13 @@ setup_logging(level="INFO")
 logger = get_logger(__name__)
 
 
-def create_llm():
-    """创建语言模型"""
+def create_llm(model: Optional[str] = None):
+    """
+    创建语言模型
+    
+    Args:
+        model: 模型名称，默认取 LLM_MODEL
+    """
     provider = os.getenv("LLM_PROVIDER", "deepseek").lower()
     
     if provider == "deepseek":
@@ -46,7 +60,7 @@ def create_llm():
             raise ValueError("请设置 DEEPSEEK_API_KEY 环境变量")
         
         return ChatDeepSeek(
-            model=os.getenv("LLM_MODEL", "deepseek-chat"),
+            model=model or os.getenv("LLM_MODEL", "deepseek-chat"),
             temperature=float(os.getenv("LLM_TEMPERATURE", "0.7")),
             max_tokens=int(os.getenv("LLM_MAX_TOKENS", "2000")),
             api_key=api_key
@@ -57,7 +71,7 @@ def create_llm():
             raise ValueError("请设置 OPENAI_API_KEY 环境变量")
         
         return ChatOpenAI(
-            model=os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
+            model=model or os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
             temperature=float(os.getenv("LLM_TEMPERATURE", "0.7")),
             max_tokens=int(os.getenv("LLM_MAX_TOKENS", "2000")),
             api_key=api_key
@@ -71,7 +85,11 @@ async def main():
     print("=" * 60)
     print()
     
+    graph = None
     try:
+        # 扩大默认线程池，文件等阻塞操作通过 asyncio.to_thread 并发执行
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=32))
+        
         # 初始化组件
         print("正在初始化系统...")
         
@@ -92,8 +110,14 @@ async def main():
         print(f"实际使用的 LLM 提供商: {provider.upper()}")
         print(f"实际使用的 LLM 模型: {model}")
         
+        # 接待员只做意图分类和路由，可配置更小更快的模型
+        small_model = os.getenv("LLM_SMALL_MODEL")
+        small_llm = create_llm(small_model) if small_model else None
+        if small_model:
+            print(f"接待员使用的 LLM 模型: {small_model}")
+        
         memory_store = MemoryStore()
-        graph = CustomerServiceGraph(llm=llm, memory_store=memory_store)
+        graph = CustomerServiceGraph(llm=llm, memory_store=memory_store, small_llm=small_llm)
         print("系统初始化完成！")
         print()
         
@@ -145,7 +169,16 @@ async def main():
     except Exception as e:
         logger.error(f"程序运行失败: {e}")
         print(f"\n程序运行失败: {e}")
+    finally:
+        if graph:
+            await graph.aclose()
+        await close_shared_tool_manager()
+        # 等待队列中的日志写完
+        await logger.complete()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
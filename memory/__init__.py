@@ -10,8 +10,12 @@ if str(Path(__file__).parent.parent) not in sys.path:
 try:
     from .memory_store import MemoryStore
     from .conversation_manager import ConversationManager
+    from .semantic_cache import SemanticCache
+    from .checkpoint import BoundedMemorySaver
 except ImportError:
     from memory.memory_store import MemoryStore
     from memory.conversation_manager import ConversationManager
+    from memory.semantic_cache import SemanticCache
+    from memory.checkpoint import BoundedMemorySaver
 
-__all__ = ["MemoryStore", "ConversationManager"]
+__all__ = ["MemoryStore", "ConversationManager", "SemanticCache", "BoundedMemorySaver"]
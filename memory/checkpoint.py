@@ -0,0 +1,87 @@
+"""有界的内存检查点存储
+
+MemorySaver 会保留每个会话的全部检查点直到进程退出，长时间运行的服务内存只增不减。
+BoundedMemorySaver 按会话（thread_id）做 LRU 淘汰，只保留最近活跃的会话。
+"""
+
+from collections import OrderedDict
+from typing import Any, Optional
+import os
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class BoundedMemorySaver(MemorySaver):
+    """最多保留 max_sessions 个会话检查点的 MemorySaver"""
+    
+    def __init__(self, max_sessions: int = 10000, evict_ratio: float = 0.1, **kwargs: Any):
+        """
+        初始化检查点存储
+        
+        Args:
+            max_sessions: 最多保留的会话数
+            evict_ratio: 超出上限时一次淘汰的会话比例。淘汰需要扫描全部写入记录，
+                成批淘汰可把扫描开销分摊到多个新会话上
+        """
+        super().__init__(**kwargs)
+        self.max_sessions = max_sessions
+        self._evict_count = max(1, int(max_sessions * evict_ratio))
+        self._threads: "OrderedDict[str, None]" = OrderedDict()
+    
+    def put(self, config, checkpoint, metadata, new_versions):
+        """保存检查点并记录会话的最近使用顺序（aput 也经由此方法）"""
+        result = super().put(config, checkpoint, metadata, new_versions)
+        
+        thread_id = config["configurable"]["thread_id"]
+        if thread_id in self._threads:
+            self._threads.move_to_end(thread_id)
+        else:
+            self._threads[thread_id] = None
+            if len(self._threads) > self.max_sessions:
+                self._evict()
+        return result
+    
+    def delete_thread(self, thread_id: str) -> None:
+        """删除会话的全部检查点"""
+        self._threads.pop(thread_id, None)
+        super().delete_thread(thread_id)
+    
+    def _evict(self):
+        """淘汰最久未使用的一批会话"""
+        evicted = set()
+        while self._threads and len(evicted) < self._evict_count:
+            thread_id, _ = self._threads.popitem(last=False)
+            evicted.add(thread_id)
+        
+        for thread_id in evicted:
+            self.storage.pop(thread_id, None)
+        for key in [k for k in self.writes if k[0] in evicted]:
+            del self.writes[key]
+        for key in [k for k in self.blobs if k[0] in evicted]:
+            del self.blobs[key]
+        
+        logger.debug("检查点会话数超过上限 {}，淘汰 {} 个最久未使用的会话", self.max_sessions, len(evicted))
+
+
+_shared_memory_saver: Optional[BoundedMemorySaver] = None
+
+
+def get_shared_memory_saver() -> BoundedMemorySaver:
+    """
+    获取进程内共享的内存检查点存储
+    
+    会话上限取环境变量 CHECKPOINT_MAX_SESSIONS（默认 10000）。
+    
+    Returns:
+        共享的检查点存储
+    """
+    global _shared_memory_saver
+    if _shared_memory_saver is None:
+        _shared_memory_saver = BoundedMemorySaver(
+            max_sessions=int(os.getenv("CHECKPOINT_MAX_SESSIONS", "10000"))
+        )
+    return _shared_memory_saver
@@ -1,7 +1,8 @@
 """记忆存储 - 支持多轮对话的持久化存储"""
 
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
 from datetime import datetime
+import asyncio
 import sqlite3
 import json
 import os
@@ -101,6 +102,11 @@ class MemoryStore:
         Returns:
             对话历史列表
         """
+        # SQLite 读写是阻塞调用，放到线程中执行，不阻塞事件循环
+        return await asyncio.to_thread(self._get_conversation_history_sync, session_id, limit)
+    
+    def _get_conversation_history_sync(self, session_id: str, limit: int) -> List[Dict[str, str]]:
+        """获取对话历史（同步实现）"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
@@ -108,7 +114,7 @@ class MemoryStore:
             SELECT role, content, metadata
             FROM messages
             WHERE session_id = ?
-            ORDER BY created_at ASC
+            ORDER BY created_at ASC, id ASC
             LIMIT ?
         """, (session_id, limit))
         
@@ -143,6 +149,32 @@ class MemoryStore:
             content: 消息内容
             metadata: 元数据
         """
+        await self.save_messages(user_id, session_id, [{"role": role, "content": content, "metadata": metadata}])
+    
+    async def save_messages(
+        self,
+        user_id: str,
+        session_id: str,
+        messages: List[Dict[str, Any]]
+    ):
+        """
+        在一个事务中按顺序保存多条消息
+        
+        Args:
+            user_id: 用户ID
+            session_id: 会话ID
+            messages: 消息列表，每条包含 role、content 和可选的 metadata
+        """
+        await asyncio.to_thread(self._save_messages_sync, user_id, session_id, messages)
+    
+    def _save_messages_sync(
+        self,
+        user_id: str,
+        session_id: str,
+        messages: List[Dict[str, Any]]
+    ):
+        """保存消息（同步实现）"""
+        now = datetime.now()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
@@ -150,26 +182,34 @@ class MemoryStore:
         cursor.execute("""
             INSERT OR IGNORE INTO sessions (session_id, user_id, created_at, updated_at)
             VALUES (?, ?, ?, ?)
-        """, (session_id, user_id, datetime.now(), datetime.now()))
+        """, (session_id, user_id, now, now))
         
         # 更新会话更新时间
         cursor.execute("""
             UPDATE sessions
             SET updated_at = ?
             WHERE session_id = ?
-        """, (datetime.now(), session_id))
+        """, (now, session_id))
         
-        # 保存消息
-        metadata_str = json.dumps(metadata) if metadata else None
-        cursor.execute("""
+        # 保存消息（同一批消息时间相同，读取时按自增 id 保持顺序）
+        cursor.executemany("""
             INSERT INTO messages (session_id, role, content, metadata, created_at)
             VALUES (?, ?, ?, ?, ?)
-        """, (session_id, role, content, metadata_str, datetime.now()))
+        """, [
+            (
+                session_id,
+                message["role"],
+                message["content"],
+                json.dumps(message["metadata"]) if message.get("metadata") else None,
+                now
+            )
+            for message in messages
+        ])
         
         conn.commit()
         conn.close()
         
-        logger.debug(f"消息已保存: session_id={session_id}, role={role}")
+        logger.debug("消息已保存: session_id={}, roles={}", session_id, [m["role"] for m in messages])
     
     async def get_user_sessions(self, user_id: str) -> List[str]:
         """
@@ -0,0 +1,164 @@
+"""语义回复缓存
+
+同一用户短时间内的提问常常只是换了个说法（如"我的订单到哪了"/"订单现在在哪"）。
+对提问做向量化后与该用户缓存过的提问比较余弦相似度，超过阈值时直接复用之前的回复，
+一次向量化调用代替整条多智能体 LLM 流程。
+"""
+
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+import math
+import time
+
+from langchain_core.embeddings import Embeddings
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 尝试导入 numpy（可选依赖，用于批量计算相似度）
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+class _UserEntries:
+    """单个用户缓存的提问向量和回复（超出上限或过期时淘汰最早的条目）"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.vectors: List[List[float]] = []
+        self.responses: List[str] = []
+        self.added_at: List[float] = []
+        self._matrix = None
+    
+    def add(self, vector: List[float], response: str, now: float):
+        self.vectors.append(vector)
+        self.responses.append(response)
+        self.added_at.append(now)
+        if len(self.vectors) > self.max_entries:
+            del self.vectors[0]
+            del self.responses[0]
+            del self.added_at[0]
+        self._matrix = None
+    
+    def expire(self, deadline: float):
+        """删除早于 deadline 加入的条目（条目按加入时间排列，过期的总在开头）"""
+        count = 0
+        while count < len(self.added_at) and self.added_at[count] < deadline:
+            count += 1
+        if count:
+            del self.vectors[:count]
+            del self.responses[:count]
+            del self.added_at[:count]
+            self._matrix = None
+    
+    def best_match(self, vector: List[float]) -> Tuple[float, int]:
+        """返回 (最高相似度, 条目下标)，向量均已归一化，点积即余弦相似度"""
+        if NUMPY_AVAILABLE:
+            if self._matrix is None:
+                self._matrix = np.asarray(self.vectors, dtype=np.float32)
+            sims = self._matrix @ np.asarray(vector, dtype=np.float32)
+            index = int(sims.argmax())
+            return float(sims[index]), index
+        
+        sims = [sum(a * b for a, b in zip(row, vector)) for row in self.vectors]
+        index = max(range(len(sims)), key=sims.__getitem__)
+        return sims[index], index
+
+
+class SemanticCache:
+    """按用户隔离的语义回复缓存（供单个事件循环内使用）"""
+    
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = 0.92,
+        max_entries_per_user: int = 64,
+        max_users: int = 1024,
+        ttl: float = 600.0
+    ):
+        """
+        初始化缓存
+        
+        Args:
+            embeddings: 向量化模型
+            threshold: 复用回复所需的最低余弦相似度
+            max_entries_per_user: 每个用户最多缓存的提问数
+            max_users: 最多缓存的用户数，超出后淘汰最久未使用的用户
+            ttl: 回复的缓存时间（秒），过期后不再复用
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries_per_user = max_entries_per_user
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users: "OrderedDict[str, _UserEntries]" = OrderedDict()
+    
+    async def embed(self, text: str) -> List[float]:
+        """
+        向量化文本并归一化
+        
+        Args:
+            text: 文本
+        
+        Returns:
+            L2 归一化后的向量
+        """
+        vector = await self.embeddings.aembed_query(text)
+        return _normalize(vector)
+    
+    def lookup(self, user_id: str, vector: Sequence[float]) -> Optional[str]:
+        """
+        查找与提问足够相似的缓存回复
+        
+        Args:
+            user_id: 用户ID
+            vector: 归一化后的提问向量
+        
+        Returns:
+            缓存的回复，未命中时返回 None
+        """
+        entries = self._users.get(user_id)
+        if entries is None:
+            return None
+        
+        entries.expire(time.monotonic() - self.ttl)
+        if not entries.vectors:
+            return None
+        
+        self._users.move_to_end(user_id)
+        similarity, index = entries.best_match(vector)
+        if similarity < self.threshold:
+            return None
+        
+        logger.debug("语义缓存命中: user_id={}, 相似度={:.3f}", user_id, similarity)
+        return entries.responses[index]
+    
+    def add(self, user_id: str, vector: Sequence[float], response: str):
+        """
+        缓存提问向量和回复
+        
+        Args:
+            user_id: 用户ID
+            vector: 归一化后的提问向量
+            response: 回复
+        """
+        entries = self._users.get(user_id)
+        if entries is None:
+            entries = self._users[user_id] = _UserEntries(self.max_entries_per_user)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        entries.add(list(vector), response, time.monotonic())
+
+
+def _normalize(vector: Sequence[float]) -> List[float]:
+    """L2 归一化（零向量原样返回）"""
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm == 0:
+        return list(vector)
+    return [x / norm for x in vector]
@@ -0,0 +1,794 @@
+"""工具层测试"""
+
+import pytest
+import aiohttp
+
+from tools.amap_tool import AmapTool
+import tools.amap_tool as amap_module
+
+
+class _FakeResponse:
+    """模拟 aiohttp 响应"""
+    
+    def __init__(self, status, payload=None):
+        self.status = status
+        self._payload = payload or {}
+    
+    async def json(self):
+        return self._payload
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _FakeSession:
+    """按顺序返回预设响应（或抛出预设异常）的模拟会话"""
+    
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.calls = 0
+    
+    def get(self, url, **kwargs):
+        outcome = self.outcomes[self.calls]
+        self.calls += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _amap_with_session(monkeypatch, outcomes):
+    """创建使用模拟会话的高德地图工具"""
+    session = _FakeSession(outcomes)
+    monkeypatch.setenv("AMAP_API_KEY", "test-key")
+    
+    async def get_shared_session():
+        return session
+    
+    monkeypatch.setattr(amap_module, "get_shared_session", get_shared_session)
+    monkeypatch.setattr(amap_module.random, "uniform", lambda a, b: 0)
+    return AmapTool(), session
+
+
+@pytest.mark.asyncio
+async def test_amap_retries_transient_errors(monkeypatch):
+    """测试 503 / 网络异常后重试并返回真实数据"""
+    payload = {"status": "1", "geocodes": [{"location": "1,2", "city": "北京市"}]}
+    tool, session = _amap_with_session(monkeypatch, [
+        _FakeResponse(503),
+        aiohttp.ClientConnectionError("reset"),
+        _FakeResponse(200, payload),
+    ])
+    
+    result = await tool.geocode("天安门")
+    
+    assert session.calls == 3
+    assert result["location"] == "1,2"
+    assert "note" not in result
+
+
+@pytest.mark.asyncio
+async def test_amap_does_not_retry_client_errors(monkeypatch):
+    """测试 4xx 不重试，直接回退到模拟数据"""
+    tool, session = _amap_with_session(monkeypatch, [_FakeResponse(403)])
+    
+    result = await tool.geocode("天安门")
+    
+    assert session.calls == 1
+    assert "note" in result
+
+
+@pytest.mark.asyncio
+async def test_amap_mock_geocode_falls_back_to_address_prefix():
+    """测试城市不在模拟表中时按地址前缀匹配"""
+    tool = AmapTool()
+    
+    result = await tool._mock_geocode("上海市浦东新区", city="杭州市")
+    
+    assert result["location"] == "121.473701,31.230416"
+
+
+@pytest.mark.asyncio
+async def test_amap_caches_geocode_failures(monkeypatch):
+    """测试地理编码失败后短时间内不再请求上游"""
+    tool, session = _amap_with_session(monkeypatch, [
+        _FakeResponse(200, {"status": "0", "info": "INVALID_PARAMS"}),
+    ])
+    
+    first = await tool.geocode("不存在的地址", city="北京")
+    second = await tool.geocode("不存在的地址", city="北京")
+    
+    assert session.calls == 1
+    assert first == second
+    assert "note" in second
+
+
+@pytest.mark.asyncio
+async def test_tool_manager_wraps_results_and_errors(monkeypatch):
+    """测试工具管理器统一包装成功结果与异常"""
+    from tools.mcp_tools import MCPToolManager
+    
+    manager = MCPToolManager()
+    
+    async def fail(*args, **kwargs):
+        raise RuntimeError("boom")
+    
+    monkeypatch.setattr(manager.weather_tool, "query_weather", fail)
+    manager.time_tool.use_mcp = False
+    
+    assert await manager.query_weather("北京") == {"success": False, "error": "boom"}
+    
+    result = await manager.get_date_info()
+    assert result["success"] is True
+    assert "date" in result["data"]
+
+
+@pytest.mark.asyncio
+async def test_tool_manager_caches_and_coalesces_calls(monkeypatch):
+    """测试相同参数的并发调用只请求一次，结果在 TTL 内复用"""
+    import asyncio
+    from tools.mcp_tools import MCPToolManager
+    
+    manager = MCPToolManager()
+    calls = []
+    
+    async def geocode(address, city=None):
+        calls.append(address)
+        await asyncio.sleep(0.01)
+        return {"address": address, "location": "1,2"}
+    
+    monkeypatch.setattr(manager.amap_tool, "geocode", geocode)
+    
+    results = await asyncio.gather(*(manager.query_address("天安门") for _ in range(5)))
+    again = await manager.query_address("天安门")
+    
+    assert calls == ["天安门"]
+    assert all(r["success"] and r["data"]["location"] == "1,2" for r in results)
+    assert again == results[0]
+
+
+def test_tool_manager_session_follows_event_loop(monkeypatch):
+    """测试事件循环更换后工具管理器重新创建 HTTP 会话和并发信号量"""
+    import asyncio
+    from tools.mcp_tools import MCPToolManager
+    
+    monkeypatch.setenv("MCP_CONCURRENCY", "1")
+    manager = MCPToolManager()
+    
+    async def slow(value):
+        await asyncio.sleep(0.001)
+        return value
+    
+    manager.slow = slow
+    
+    async def run():
+        results = await manager.batch([("slow", {"value": 1}), ("slow", {"value": 2})])
+        return await manager._get_session(), results
+    
+    first, results = asyncio.run(run())
+    second, again = asyncio.run(run())
+    
+    assert second is not first
+    assert results == again == [1, 2]
+    asyncio.run(manager.aclose())
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_leader_cancellation():
+    """测试发起调用的协程被取消后，其余等待者仍拿到结果"""
+    import asyncio
+    from utils.cache import SingleFlight
+    
+    flight = SingleFlight()
+    release = asyncio.Event()
+    calls = []
+    
+    async def fetch():
+        calls.append(1)
+        await release.wait()
+        return "ok"
+    
+    leader = asyncio.create_task(flight.do("k", fetch))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(flight.do("k", fetch))
+    await asyncio.sleep(0)
+    
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    
+    assert await follower == "ok"
+    assert leader.cancelled()
+    assert calls == [1]
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_tool_manager_caches_knowledge_base_search(monkeypatch):
+    """测试短时间内重复的知识库搜索复用结果"""
+    from tools.mcp_tools import MCPToolManager
+    
+    manager = MCPToolManager()
+    calls = []
+    
+    async def search_memory(query, limit):
+        calls.append(query)
+        return {"success": True, "results": [query]}
+    
+    monkeypatch.setattr(manager.memory_tool, "search_memory", search_memory)
+    
+    first = await manager.search_knowledge_base("如何退款")
+    second = await manager.search_knowledge_base("如何退款")
+    await manager.search_knowledge_base("如何改签")
+    
+    assert calls == ["如何退款", "如何改签"]
+    assert first == second
+
+@pytest.mark.asyncio
+async def test_weather_tool_caches_api_results(monkeypatch):
+    """测试天气结果按城市缓存，并发未命中只请求一次，模拟数据不缓存"""
+    import asyncio
+    from tools.weather_tool import WeatherTool
+    
+    monkeypatch.setenv("QWEATHER_API_KEY", "test-key")
+    tool = WeatherTool()
+    calls = []
+    
+    async def query_qweather(city):
+        calls.append(city)
+        await asyncio.sleep(0.01)
+        if city == "火星":
+            raise RuntimeError("not found")
+        return {"success": True, "city": city, "source": "和风天气"}
+    
+    monkeypatch.setattr(tool, "_query_qweather", query_qweather)
+    
+    results = await asyncio.gather(*(tool.query_weather("北京") for _ in range(3)))
+    await tool.query_weather("北京")
+    await tool.query_weather("火星")
+    await tool.query_weather("火星")
+    
+    assert calls == ["北京", "火星", "火星"]
+    assert all(r["source"] == "和风天气" for r in results)
+
+
+@pytest.mark.asyncio
+async def test_memory_mock_search_matches_category_only():
+    """测试模拟知识库只返回命中类别的条目"""
+    from tools.memory_tool import MemoryTool
+    
+    result = await MemoryTool()._mock_search("订单怎么查询", 5)
+    
+    assert result["count"] == 2
+    assert all("订单" in item["content"] for item in result["results"])
+
+
+def test_parse_mcp_args_supports_quotes_and_commas():
+    """测试 MCP 参数解析兼容 shell 引号和逗号分隔两种写法"""
+    from tools.mcp_session import parse_mcp_args
+    
+    assert parse_mcp_args("-y @mcp/server '/app/my data'") == ("-y", "@mcp/server", "/app/my data")
+    assert parse_mcp_args("-y,12306-mcp") == ("-y", "12306-mcp")
+    assert parse_mcp_args("-m tools.time_mcp_server") == ("-m", "tools.time_mcp_server")
+
+
+@pytest.mark.asyncio
+async def test_session_pool_replaces_only_failed_entry(monkeypatch):
+    """测试业务异常不影响会话，连接断开后只重启这一个会话，池中其他会话保持不变"""
+    import asyncio
+    import types
+    import tools.mcp_session as mcp_session
+    
+    async def start_session(server_params):
+        stop = asyncio.Event()
+        task = asyncio.create_task(stop.wait())
+        return mcp_session._CachedSession(object(), [types.SimpleNamespace(name="t")], stop, task)
+    
+    monkeypatch.setattr(mcp_session, "_start_session", start_session)
+    first, second = await start_session(None), await start_session(None)
+    pool = mcp_session.SessionPool([first, second], types.SimpleNamespace(command="fake"))
+    
+    with pytest.raises(ValueError):
+        async with pool.acquire():
+            raise ValueError("未找到搜索工具")
+    assert not first.broken
+    async with pool.acquire() as session:
+        assert session is second.session
+    
+    with pytest.raises(BrokenPipeError):
+        async with pool.acquire() as session:
+            assert session is first.session
+            raise BrokenPipeError()
+    async with pool.acquire() as session:
+        assert session is second.session
+    async with pool.acquire() as session:
+        assert session is not first.session
+    
+    assert pool.entries[1] is second and pool.entries[0] is not first
+    assert first.task.done() and not second.task.done()
+    await pool.close()
+
+
+def test_session_pool_lock_works_across_event_loops(monkeypatch):
+    """测试在多个事件循环中先后并发创建会话池不会因锁绑定旧循环而失败"""
+    import asyncio
+    import types
+    import tools.mcp_session as mcp_session
+    
+    async def start_session(server_params):
+        await asyncio.sleep(0.001)
+        stop = asyncio.Event()
+        task = asyncio.create_task(stop.wait())
+        return mcp_session._CachedSession(object(), [types.SimpleNamespace(name="t")], stop, task)
+    
+    monkeypatch.setattr(mcp_session, "MCP_AVAILABLE", True)
+    monkeypatch.setattr(mcp_session, "StdioServerParameters", types.SimpleNamespace, raising=False)
+    monkeypatch.setattr(mcp_session, "_start_session", start_session)
+    monkeypatch.setattr(mcp_session, "_SESSION_CACHE", {})
+    
+    async def run():
+        pools = await asyncio.gather(*(mcp_session.get_pool(name, []) for name in ("a", "b")))
+        await mcp_session.close_all()
+        return pools
+    
+    for _ in range(2):
+        assert len(asyncio.run(run())) == 2
+
+
+def test_json_utils_roundtrip_keeps_chinese(monkeypatch):
+    """测试 JSON 工具序列化保留中文、可往返解析，且未安装 orjson 时输出格式相同"""
+    import importlib.util
+    import sys
+    from utils import json_utils
+    
+    text = json_utils.dumps({"weekday": "星期一", "day": 1})
+    
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    spec = importlib.util.spec_from_file_location("json_utils_fallback", json_utils.__file__)
+    fallback = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fallback)
+    
+    assert fallback.orjson is None
+    assert text == fallback.dumps({"weekday": "星期一", "day": 1}) == '{"weekday":"星期一","day":1}'
+    assert json_utils.loads(text) == {"weekday": "星期一", "day": 1}
+    assert json_utils.loads_object(" " + text) == {"weekday": "星期一", "day": 1}
+    assert json_utils.loads_object("2026-01-01 12:00:00") is None
+    assert json_utils.loads_object("{broken") is None
+    assert json_utils.loads_object("[1, 2]") is None
+
+
+@pytest.mark.asyncio
+async def test_tool_manager_batch_keeps_order_and_isolates_errors():
+    """测试批量调用按顺序返回结果，单个调用失败不影响其他调用"""
+    from tools.mcp_tools import MCPToolManager
+    
+    manager = MCPToolManager()
+    manager.time_tool.use_mcp = False
+    
+    results = await manager.batch([
+        ("get_date_info", {}),
+        ("no_such_tool", {}),
+        ("search_location", {"keywords": "咖啡", "city": "北京"}),
+    ])
+    
+    assert results[0]["success"] and "weekday" in results[0]["data"]
+    assert results[1]["success"] is False
+    assert results[2]["success"] and results[2]["data"]["count"] > 0
+
+
+@pytest.mark.asyncio
+async def test_query_station_code_prefers_cached_code(monkeypatch):
+    """测试未内置的车站代码从缓存读取（如 MCP 解析过的车站）"""
+    from tools.train_ticket_tool import TrainTicketTool
+    import utils.station_cache as station_cache
+    
+    monkeypatch.setattr(station_cache, "DISKCACHE_AVAILABLE", False)
+    monkeypatch.setattr(station_cache, "_disk_cache", None)
+    monkeypatch.setattr(station_cache, "_memory_cache", station_cache.TTLCache(16, 60))
+    await station_cache.set_station_code("苏州", "SZH")
+    
+    tool = TrainTicketTool()
+    
+    assert (await tool.query_station_code("苏州"))["station_code"] == "SZH"
+    assert (await tool.query_station_code("北京"))["station_code"] == "BJP"
+    assert (await tool.query_station_code("火星"))["station_code"] == ""
+
+
+@pytest.mark.asyncio
+async def test_station_cache_reads_through_to_disk_and_tolerates_errors(monkeypatch):
+    """测试车站代码先查内存缓存，未命中时读磁盘缓存并回填，磁盘出错时按未命中处理"""
+    import sqlite3
+    import utils.station_cache as station_cache
+    
+    class FakeDiskCache:
+        def __init__(self):
+            self.data = {"苏州": "SZH"}
+            self.reads = []
+        
+        def get(self, key):
+            self.reads.append(key)
+            if key == "坏盘":
+                raise sqlite3.OperationalError("database is locked")
+            return self.data.get(key)
+        
+        def set(self, key, value, expire=None):
+            self.data[key] = value
+    
+    disk = FakeDiskCache()
+    monkeypatch.setattr(station_cache, "DISKCACHE_AVAILABLE", True)
+    monkeypatch.setattr(station_cache, "_disk_cache", disk)
+    monkeypatch.setattr(station_cache, "_memory_cache", station_cache.TTLCache(16, 60))
+    
+    assert await station_cache.get_station_code("苏州") == "SZH"
+    assert await station_cache.get_station_code("苏州") == "SZH"
+    assert await station_cache.get_station_code("坏盘") is None
+    await station_cache.set_station_code("杭州", "HZH")
+    
+    assert await station_cache.get_station_code("杭州") == "HZH"
+    assert disk.reads == ["苏州", "坏盘"]
+    assert disk.data["杭州"] == "HZH"
+
+
+class _FakeStationSession:
+    """记录调用参数的模拟 MCP 会话，按车站名返回车站代码"""
+    
+    def __init__(self, codes):
+        self.codes = codes
+        self.calls = []
+    
+    async def call_tool(self, name, arguments):
+        from types import SimpleNamespace
+        from utils import json_utils
+        
+        names = arguments["stationNames"]
+        self.calls.append(names)
+        data = {n: {"station_code": self.codes[n]} for n in names.split("|")}
+        return SimpleNamespace(content=[SimpleNamespace(text=json_utils.dumps(data))])
+
+
+@pytest.mark.asyncio
+async def test_resolve_station_codes_batches_when_supported(monkeypatch):
+    """测试工具支持多车站输入时只发起一次车站代码查询"""
+    from types import SimpleNamespace
+    from tools.train_ticket_tool import TrainTicketTool
+    import utils.station_cache as station_cache
+    
+    monkeypatch.setattr(station_cache, "DISKCACHE_AVAILABLE", False)
+    monkeypatch.setattr(station_cache, "_disk_cache", None)
+    monkeypatch.setattr(station_cache, "_memory_cache", station_cache.TTLCache(16, 60))
+    
+    tool = TrainTicketTool()
+    codes = {"北京": "BJP", "苏州": "SZH"}
+    multi = SimpleNamespace(inputSchema={"properties": {"stationNames": {"description": "多个车站用|分隔"}}})
+    single = SimpleNamespace(inputSchema={"properties": {"stationNames": {"description": "车站名称"}}})
+    
+    session = _FakeStationSession(codes)
+    assert await tool._resolve_station_codes(session, multi, ["北京", "苏州"]) == codes
+    assert session.calls == ["北京|苏州"]
+    assert await station_cache.get_station_code("苏州") == "SZH"
+    
+    session = _FakeStationSession(codes)
+    assert await tool._resolve_station_codes(session, single, ["北京", "苏州"]) == codes
+    assert sorted(session.calls) == ["北京", "苏州"]
+
+
+@pytest.mark.asyncio
+async def test_qweather_reuses_cached_location(monkeypatch):
+    """测试和风天气位置缓存命中时只请求天气接口，location_id 失效后重新查询"""
+    import tools.weather_tool as weather_module
+    
+    monkeypatch.setenv("QWEATHER_API_KEY", "test-key")
+    location = {"code": "200", "location": [{"id": "101010100", "name": "北京"}]}
+    now = {"code": "200", "now": {"temp": "20", "text": "晴"}}
+    session = _FakeSession([
+        _FakeResponse(200, location), _FakeResponse(200, now),
+        _FakeResponse(200, now),
+        _FakeResponse(200, {"code": "404"}), _FakeResponse(200, location), _FakeResponse(200, now),
+    ])
+    
+    async def get_shared_session():
+        return session
+    
+    monkeypatch.setattr(weather_module, "get_shared_session", get_shared_session)
+    tool = weather_module.WeatherTool()
+    
+    assert (await tool._query_qweather("北京"))["temperature"] == 20.0
+    assert session.calls == 2
+    assert (await tool._query_qweather("北京"))["city"] == "北京"
+    assert session.calls == 3
+    assert (await tool._query_qweather("北京"))["description"] == "晴"
+    assert session.calls == 6
+
+
+@pytest.mark.asyncio
+async def test_unknown_city_does_not_trip_weather_breaker(monkeypatch):
+    """测试城市不存在（请求本身有误）不计入熔断，连接错误才会打开熔断器"""
+    import tools.weather_tool as weather_module
+    from utils import circuit
+    
+    monkeypatch.setenv("QWEATHER_API_KEY", "test-key")
+    monkeypatch.delenv("OPENWEATHER_API_KEY", raising=False)
+    session = _FakeSession(
+        [_FakeResponse(200, {"code": "404"}) for _ in range(4)]
+        + [aiohttp.ClientConnectionError("down") for _ in range(3)]
+    )
+    
+    async def get_shared_session():
+        return session
+    
+    monkeypatch.setattr(weather_module, "get_shared_session", get_shared_session)
+    tool = weather_module.WeatherTool()
+    
+    for _ in range(4):
+        result = await tool._query_weather_uncached("今天天气怎么样")
+        assert "note" in result
+    assert tool._qweather_breaker.state == circuit.CLOSED
+    
+    for _ in range(3):
+        await tool._query_weather_uncached("北京")
+    assert tool._qweather_breaker.state == circuit.OPEN
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_after_failures_and_recovers(monkeypatch):
+    """测试熔断器连续失败后跳过调用，超时后放行一次探测并在成功后关闭"""
+    import utils.circuit as circuit
+    
+    clock = [0.0]
+    monkeypatch.setattr(circuit.time, "monotonic", lambda: clock[0])
+    breaker = circuit.Breaker("test", failure_threshold=2, reset_timeout=10)
+    calls = []
+    
+    async def fail():
+        calls.append("fail")
+        raise RuntimeError("down")
+    
+    async def ok():
+        calls.append("ok")
+        return "up"
+    
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await breaker.call(fail)
+    assert breaker.state == circuit.OPEN
+    with pytest.raises(circuit.CircuitOpenError):
+        await breaker.call(ok)
+    assert calls == ["fail", "fail"]
+    
+    clock[0] = 11
+    assert breaker.state == circuit.HALF_OPEN
+    with pytest.raises(RuntimeError):
+        await breaker.call(fail)
+    assert breaker.state == circuit.OPEN
+    
+    clock[0] = 22
+    assert await breaker.call(ok) == "up"
+    assert breaker.state == circuit.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_breaker_probe_flag_kept_by_older_calls(monkeypatch):
+    """测试熔断前就开始的调用（此处被取消）结束时不会清除半开探测标记，放进第二个探测"""
+    import asyncio
+    import utils.circuit as circuit
+    
+    clock = [0.0]
+    monkeypatch.setattr(circuit.time, "monotonic", lambda: clock[0])
+    breaker = circuit.Breaker("test", failure_threshold=1, reset_timeout=10)
+    slow_done, probe_done = asyncio.Event(), asyncio.Event()
+    
+    async def wait_for(event):
+        await event.wait()
+        return "ok"
+    
+    async def fail():
+        raise RuntimeError("down")
+    
+    slow = asyncio.create_task(breaker.call(lambda: wait_for(slow_done)))
+    await asyncio.sleep(0)
+    with pytest.raises(RuntimeError):
+        await breaker.call(fail)
+    
+    clock[0] = 11
+    probe = asyncio.create_task(breaker.call(lambda: wait_for(probe_done)))
+    await asyncio.sleep(0)
+    slow.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await slow
+    
+    with pytest.raises(circuit.CircuitOpenError):
+        await breaker.call(fail)
+    probe_done.set()
+    assert await probe == "ok"
+    assert breaker.state == circuit.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_train_tool_coalesces_concurrent_queries(monkeypatch):
+    """测试相同行程的并发火车票查询只请求一次"""
+    import asyncio
+    from tools.train_ticket_tool import TrainTicketTool
+    
+    tool = TrainTicketTool()
+    tool.use_mock = False
+    calls = []
+    
+    async def query(from_station, to_station, date):
+        calls.append((from_station, to_station, date))
+        await asyncio.sleep(0.01)
+        return {"success": True, "trains": []}
+    
+    monkeypatch.setattr(tool, "_query_trains_uncached", query)
+    
+    results = await asyncio.gather(*(tool.query_trains("北京", "上海", "2026-01-10") for _ in range(3)))
+    await tool.query_trains("北京", "广州", "2026-01-10")
+    
+    assert all(r["success"] for r in results)
+    assert calls == [("北京", "上海", "2026-01-10"), ("北京", "广州", "2026-01-10")]
+
+
+@pytest.mark.asyncio
+async def test_weather_batch_window_dispatches_together(monkeypatch):
+    """测试启用微批处理后，窗口内的多个城市查询在同一批中发出"""
+    import asyncio
+    from tools.weather_tool import WeatherTool
+    
+    monkeypatch.setenv("QWEATHER_API_KEY", "test-key")
+    monkeypatch.setenv("WEATHER_BATCH_WINDOW_MS", "20")
+    tool = WeatherTool()
+    started = []
+    
+    async def query_qweather(city):
+        started.append(asyncio.get_running_loop().time())
+        return {"success": True, "city": city, "source": "和风天气"}
+    
+    monkeypatch.setattr(tool, "_query_qweather", query_qweather)
+    
+    results = await asyncio.gather(*(tool.query_weather(c) for c in ("北京", "上海", "广州")))
+    
+    assert [r["city"] for r in results] == ["北京", "上海", "广州"]
+    assert len(started) == 3 and max(started) - min(started) < 0.01
+
+
+@pytest.mark.asyncio
+async def test_weather_batch_recovers_after_flush_cancelled():
+    """测试批次任务被取消后等待者收到取消，之后的查询重新调度"""
+    import asyncio
+    from tools.weather_tool import _BatchDispatcher
+    
+    async def handler(city):
+        return {"city": city}
+    
+    dispatcher = _BatchDispatcher(0.01, handler)
+    waiting = asyncio.create_task(dispatcher.submit("北京"))
+    await asyncio.sleep(0)
+    dispatcher._flush_task.cancel()
+    
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    assert await dispatcher.submit("上海") == {"city": "上海"}
+
+
+def test_parse_third_party_trains_fills_defaults():
+    """测试第三方 API 车次数据按统一字段提取，缺失字段使用默认值"""
+    from tools.train_ticket_tool import TrainTicketTool
+    
+    tool = TrainTicketTool()
+    data = {"data": {"trains": [{"train_no": "G1", "first_class": {"price": "¥933"}, "extra": 1}]}}
+    
+    for trains in (tool._parse_yikeapi_data(data), tool._parse_apiumi_data(data)):
+        assert trains == [{
+            "train_no": "G1", "train_type": "", "from_station": "", "to_station": "",
+            "departure_time": "", "arrival_time": "", "duration": "",
+            "business_seat": {}, "first_class": {"price": "¥933"}, "second_class": {}, "hard_seat": {}
+        }]
+
+
+@pytest.mark.asyncio
+async def test_httpx_session_matches_aiohttp_interface():
+    """测试 httpx 会话包装后提供与 aiohttp 相同的 get/status/json/text 接口"""
+    httpx = pytest.importorskip("httpx")
+    from tools.http_session import HttpxSession
+    
+    def handler(request):
+        return httpx.Response(200, json={"code": "200", "city": request.url.params["location"]})
+    
+    session = HttpxSession(httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    async with session.get("https://example.com/weather", params={"location": "北京"}) as response:
+        assert response.status == 200
+        assert await response.json() == {"code": "200", "city": "北京"}
+        assert "北京" in await response.text()
+    await session.close()
+    assert session.closed
+
+
+@pytest.mark.asyncio
+async def test_train_race_returns_first_success(monkeypatch):
+    """测试并发查询多个服务时跳过失败的服务，取最先成功的结果并取消其余请求"""
+    import asyncio
+    from tools.train_ticket_tool import TrainTicketTool
+    
+    monkeypatch.setenv("TRAIN_TICKET_SERVICE", "yikeapi")
+    monkeypatch.setenv("TRAIN_TICKET_RACE", "1")
+    monkeypatch.setenv("YIKEAPI_KEY", "k1")
+    monkeypatch.setenv("APIUMI_KEY", "k2")
+    tool = TrainTicketTool()
+    cancelled = []
+    
+    async def fail_fast(*args):
+        raise RuntimeError("quota exceeded")
+    
+    async def succeed(*args):
+        await asyncio.sleep(0.01)
+        return {"success": True, "source": "YikeAPI"}
+    
+    async def hang(*args):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+    
+    monkeypatch.setattr(tool, "_query_yikeapi", succeed)
+    monkeypatch.setattr(tool, "_query_apiumi", fail_fast)
+    assert (await tool.query_trains("北京", "上海", "2026-01-10"))["source"] == "YikeAPI"
+    
+    monkeypatch.setattr(tool, "_query_apiumi", hang)
+    assert (await tool.query_trains("北京", "上海", "2026-01-11"))["source"] == "YikeAPI"
+    await asyncio.sleep(0)
+    assert cancelled == [True]
+
+
+@pytest.mark.asyncio
+async def test_weather_health_check_skips_unreachable_provider(monkeypatch):
+    """测试健康检查发现和风天气不可达时直接使用 OpenWeatherMap，结果在有效期内复用"""
+    import tools.weather_tool as weather_module
+    
+    monkeypatch.setenv("QWEATHER_API_KEY", "k1")
+    monkeypatch.setenv("OPENWEATHER_API_KEY", "k2")
+    monkeypatch.setenv("WEATHER_HEALTH_CHECK", "1")
+    session = _FakeSession([_FakeResponse(503), _FakeResponse(404)])
+    
+    async def get_shared_session():
+        return session
+    
+    monkeypatch.setattr(weather_module, "get_shared_session", get_shared_session)
+    tool = weather_module.WeatherTool()
+    called = []
+    
+    async def query_qweather(city):
+        called.append("qweather")
+        return {"success": True, "source": "和风天气"}
+    
+    async def query_openweather(city, country=None):
+        called.append("openweather")
+        return {"success": True, "source": "OpenWeatherMap"}
+    
+    monkeypatch.setattr(tool, "_query_qweather", query_qweather)
+    monkeypatch.setattr(tool, "_query_openweather", query_openweather)
+    
+    await tool.query_weather("北京")
+    await tool.query_weather("上海")
+    
+    assert called == ["openweather", "openweather"]
+    assert session.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_weather_query_many_keeps_order(monkeypatch):
+    """测试批量查询天气按输入顺序返回结果"""
+    from tools.weather_tool import WeatherTool
+    
+    tool = WeatherTool()
+    results = await tool.query_many(["北京", "广州", "北京"])
+    
+    assert [r["city"] for r in results] == ["北京", "广州", "北京"]
+    assert results[1]["description"] == "小雨"
@@ -38,5 +38,349 @@ async def test_solution_expert_agent():
     pass
 
 
+@pytest.mark.asyncio
+async def test_call_tools_node_runs_tools_concurrently():
+    """测试工具调用节点并发执行相互独立的工具调用"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from tools.mcp_tools import MCPToolManager
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    graph = CustomerServiceGraph(llm=FakeListChatModel(responses=["ok"]), tool_manager=MCPToolManager())
+    running = 0
+    peak = 0
+    
+    async def slow_tool(result):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        return result
+    
+    graph.tool_manager.query_weather = lambda **kwargs: slow_tool({"success": True, "city": kwargs["city"]})
+    graph.tool_manager.query_train_tickets = AsyncMock(side_effect=RuntimeError("boom"))
+    graph.tool_manager.search_knowledge_base = lambda **kwargs: slow_tool({"success": True})
+    
+    user_input = "北京明天天气怎么样，顺便查一下北京到上海的火车票"
+    state = {
+        "user_input": user_input,
+        "user_input_lower": user_input.lower(),
+        "analysis_result": {"key_parameters": {"城市": "北京", "出发站": "北京", "到达站": "上海"}},
+        "receptionist_result": {"problem_category": "咨询"},
+    }
+    state = await graph._call_tools_node(state)
+    
+    tool_results = state["tool_results"]
+    assert tool_results["weather"] == {"success": True, "city": "北京"}
+    assert tool_results["train_tickets"] == {"success": False, "error": "boom"}
+    assert tool_results["knowledge_base"] == {"success": True}
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_agents_and_tool_manager_are_created_lazily():
+    """测试智能体和工具管理器在首次使用时才创建"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    graph = CustomerServiceGraph(llm=FakeListChatModel(responses=["ok"]))
+    assert "receptionist" not in graph.__dict__
+    assert "tool_manager" not in graph.__dict__
+    
+    await graph.aclose()
+    assert "tool_manager" not in graph.__dict__
+    
+    assert graph.receptionist is graph.receptionist
+    assert graph.tool_manager is CustomerServiceGraph(llm=FakeListChatModel(responses=["ok"])).tool_manager
+    assert CustomerServiceGraph(llm=FakeListChatModel(responses=["ok"]), enable_tools=False).tool_manager is None
+
+
+@pytest.mark.asyncio
+async def test_closing_graph_keeps_shared_tool_manager_open():
+    """测试关闭一个工作流不会关闭其他工作流共用的工具管理器，应用关闭时统一关闭"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from workflow.customer_service_graph import CustomerServiceGraph
+    from tools.mcp_tools import close_shared_tool_manager, get_shared_tool_manager
+    
+    first = CustomerServiceGraph(llm=FakeListChatModel(responses=["ok"]))
+    second = CustomerServiceGraph(llm=FakeListChatModel(responses=["ok"]))
+    session = await first.tool_manager._get_session()
+    
+    await first.aclose()
+    assert not session.closed
+    assert await second.tool_manager._get_session() is session
+    
+    await close_shared_tool_manager()
+    assert session.closed
+    assert get_shared_tool_manager() is not second.tool_manager
+    await close_shared_tool_manager()
+
+
+def test_receptionist_uses_small_llm_when_configured():
+    """测试配置小模型后接待员使用小模型，其余智能体仍使用主模型"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langgraph.checkpoint.memory import MemorySaver
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    llm = FakeListChatModel(responses=["main"])
+    small_llm = FakeListChatModel(responses=["small"])
+    graph = CustomerServiceGraph(llm=llm, small_llm=small_llm, checkpointer=MemorySaver())
+    assert graph.receptionist.llm is small_llm
+    assert graph.analyst.llm is llm
+    assert graph.solution_expert.llm is llm
+    
+    assert CustomerServiceGraph(llm=llm, checkpointer=MemorySaver()).receptionist.llm is llm
+
+
+def test_intent_matcher_finds_all_groups_in_one_pass():
+    """测试意图匹配器返回所有命中的关键词组"""
+    from utils.intent_matcher import IntentMatcher
+    
+    matcher = IntentMatcher({
+        "weather": ("天气", "weather"),
+        "train": ("火车票", "车票"),
+        "date": ("几号", "星期"),
+    })
+    
+    assert matcher.match("明天北京天气怎么样，顺便买张火车票") == {"weather", "train"}
+    assert matcher.match("今天几号") == {"date"}
+    assert matcher.match("你好") == set()
+
+
+@pytest.mark.asyncio
+async def test_call_tools_node_extracts_train_route_from_input():
+    """测试从用户输入中提取出发站和到达站"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from tools.mcp_tools import MCPToolManager
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    graph = CustomerServiceGraph(llm=FakeListChatModel(responses=["ok"]), tool_manager=MCPToolManager())
+    graph.tool_manager.query_train_tickets = AsyncMock(return_value={"success": True})
+    
+    for user_input, route in [
+        ("我想查北京到上海的火车票", ("北京", "上海")),
+        ("宜昌至武汉的车票", ("宜昌", "武汉")),
+        ("beijing-shanghai train", ("beijing", "shanghai")),
+    ]:
+        await graph._call_tools_node({"user_input": user_input, "user_input_lower": user_input.lower()})
+        kwargs = graph.tool_manager.query_train_tickets.call_args.kwargs
+        assert (kwargs["from_station"], kwargs["to_station"]) == route
+
+
+@pytest.mark.asyncio
+async def test_process_message_stream_yields_solution_tokens(tmp_path):
+    """测试流式处理逐段产出解决方案专家的回复，最后产出完整结果"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from memory.memory_store import MemoryStore
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    llm = FakeListChatModel(responses=["请重启路由器后再试"])
+    graph = CustomerServiceGraph(
+        llm=llm,
+        memory_store=MemoryStore(str(tmp_path / "conversations.db")),
+        enable_tools=False
+    )
+    
+    events = [event async for event in graph.process_message_stream("u1", "网络连不上")]
+    
+    tokens = [event["content"] for event in events if event["type"] == "token"]
+    result = events[-1]
+    assert result["type"] == "result"
+    assert "".join(tokens) == result["response"] == "请重启路由器后再试"
+    
+    chunks = [chunk async for chunk in graph.stream_message("u1", "网络连不上")]
+    assert len(chunks) > 1
+    assert "".join(chunks) == "请重启路由器后再试"
+
+
+@pytest.mark.asyncio
+async def test_process_message_saves_user_and_assistant_messages_in_order(tmp_path):
+    """测试用户消息和助手回复一次写入后，对话历史按顺序记录"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from memory.memory_store import MemoryStore
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    memory_store = MemoryStore(str(tmp_path / "conversations.db"))
+    graph = CustomerServiceGraph(
+        llm=FakeListChatModel(responses=["好的"]),
+        memory_store=memory_store,
+        enable_tools=False
+    )
+    
+    result = await graph.process_message("u1", "你好", session_id="s1")
+    history = await memory_store.get_conversation_history("u1", "s1")
+    
+    assert [(m["role"], m["content"]) for m in history] == [("user", "你好"), ("assistant", result["response"])]
+
+
+@pytest.mark.asyncio
+async def test_call_tools_node_skips_tools_without_intent():
+    """测试没有命中任何工具意图时不调用工具"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from tools.mcp_tools import MCPToolManager
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    graph = CustomerServiceGraph(llm=FakeListChatModel(responses=["ok"]), tool_manager=MCPToolManager())
+    graph.tool_manager.batch = AsyncMock(return_value=[])
+    
+    state = await graph._call_tools_node({"user_input": "你好", "user_input_lower": "你好"})
+    
+    assert state["tool_results"] == {}
+    graph.tool_manager.batch.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_reuses_reply_for_same_user(tmp_path):
+    """测试相同用户的重复提问直接复用缓存的回复，其他用户不受影响"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from memory.memory_store import MemoryStore
+    from memory.semantic_cache import SemanticCache
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    graph = CustomerServiceGraph(
+        llm=FakeListChatModel(responses=["请重启路由器后再试"]),
+        memory_store=MemoryStore(str(tmp_path / "conversations.db")),
+        enable_tools=False,
+        semantic_cache=SemanticCache(DeterministicFakeEmbedding(size=32))
+    )
+    graph.compiled_graph = Mock(wraps=graph.compiled_graph)
+    
+    first = await graph.process_message("u1", "网络连不上")
+    second = await graph.process_message("u1", "网络连不上", session_id="s2")
+    other = await graph.process_message("u2", "网络连不上")
+    
+    assert "cached" not in first and "cached" not in other
+    assert second["cached"] is True
+    assert second["response"] == first["response"]
+    assert second["session_id"] == "s2"
+    assert graph.compiled_graph.ainvoke.call_count == 2
+    
+    # 命中工具意图（依赖实时数据）的提问不缓存
+    await graph.process_message("u1", "今天几号")
+    assert "cached" not in await graph.process_message("u1", "今天几号")
+
+
+def test_semantic_cache_entries_expire(monkeypatch):
+    """测试语义缓存的回复超过缓存时间后不再复用"""
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    import memory.semantic_cache as cache_module
+    
+    now = 1000.0
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now)
+    cache = cache_module.SemanticCache(DeterministicFakeEmbedding(size=8), ttl=60)
+    vector = cache_module._normalize([1.0] * 8)
+    
+    cache.add("u1", vector, "回复")
+    now += 59
+    assert cache.lookup("u1", vector) == "回复"
+    now += 2
+    assert cache.lookup("u1", vector) is None
+
+
+@pytest.mark.asyncio
+async def test_bounded_memory_saver_evicts_least_recent_sessions(tmp_path):
+    """测试内存检查点超过会话上限后淘汰最久未使用的会话"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from memory.checkpoint import BoundedMemorySaver
+    from memory.memory_store import MemoryStore
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    saver = BoundedMemorySaver(max_sessions=2, evict_ratio=0.5)
+    graph = CustomerServiceGraph(
+        llm=FakeListChatModel(responses=["好的"]),
+        memory_store=MemoryStore(str(tmp_path / "conversations.db")),
+        enable_tools=False,
+        checkpointer=saver
+    )
+    
+    for session_id in ("s1", "s2", "s1", "s3"):
+        await graph.process_message("u1", "你好", session_id=session_id)
+    
+    assert set(saver.storage) == {"s1", "s3"}
+    assert all(key[0] in {"s1", "s3"} for key in list(saver.writes) + list(saver.blobs))
+
+
+def test_route_after_analyst_skips_tools_without_intent():
+    """测试分析师判定需要工具但没有命中任何工具意图时直接交给解决方案专家"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langgraph.checkpoint.memory import MemorySaver
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    graph = CustomerServiceGraph(llm=FakeListChatModel(responses=["ok"]), checkpointer=MemorySaver())
+    analysis_result = {"complexity": "复杂", "key_parameters": {"城市": "北京"}}
+    
+    state = {"analysis_result": analysis_result, "user_input_lower": "我的账号登不上"}
+    assert graph._route_after_analyst(state) == "solution_expert"
+    
+    state = {"analysis_result": analysis_result, "user_input_lower": "北京明天天气怎么样"}
+    assert graph._route_after_analyst(state) == "call_tools"
+
+
+@pytest.mark.asyncio
+async def test_simple_confident_questions_are_answered_by_small_llm(tmp_path):
+    """测试简单且有把握的问题由小模型直接作答，不再调用解决方案专家"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langgraph.checkpoint.memory import MemorySaver
+    from memory.memory_store import MemoryStore
+    from workflow.customer_service_graph import CustomerServiceGraph
+    
+    analysis = '{"complexity": "简单", "confidence": 0.9, "key_parameters": {}, "analysis_report": "分析"}'
+    graph = CustomerServiceGraph(
+        llm=FakeListChatModel(responses=[analysis]),
+        small_llm=FakeListChatModel(responses=['{"problem_category": "咨询", "needs_analysis": true}', "小模型回复"]),
+        memory_store=MemoryStore(str(tmp_path / "conversations.db")),
+        enable_tools=False,
+        checkpointer=MemorySaver()
+    )
+    
+    assert graph._route_after_analyst({"analysis_result": {"complexity": "简单", "confidence": "0.9"}, "user_input_lower": ""}) == "draft_expert"
+    assert graph._route_after_analyst({"analysis_result": {"complexity": "简单", "confidence": 0.5}, "user_input_lower": ""}) == "solution_expert"
+    assert graph._route_after_analyst({"analysis_result": {"complexity": "中等", "confidence": 0.9}, "user_input_lower": ""}) == "solution_expert"
+    
+    result = await graph.process_message("u1", "你们支持七天无理由退货吗")
+    assert result["response"] == "小模型回复"
+    assert "solution_expert" not in graph.__dict__
+
+
+@pytest.mark.asyncio
+async def test_open_checkpointer_waits_for_single_open_and_retries_after_failure(monkeypatch):
+    """测试并发的首批请求都等待同一次连接打开，打开失败后下次请求换新连接重试"""
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langgraph.checkpoint.memory import MemorySaver
+    import workflow.customer_service_graph as graph_module
+    
+    class FakeConnection:
+        def __init__(self, fail=False):
+            self.fail = fail
+            self.opens = 0
+            self.opened = False
+        
+        def __await__(self):
+            return self._open().__await__()
+        
+        async def _open(self):
+            self.opens += 1
+            await asyncio.sleep(0.01)
+            if self.fail:
+                raise RuntimeError("open failed")
+            self.opened = True
+            return self
+    
+    graph = graph_module.CustomerServiceGraph(llm=FakeListChatModel(responses=["ok"]), checkpointer=MemorySaver())
+    
+    broken, fresh = FakeConnection(fail=True), FakeConnection()
+    graph._checkpoint_conn = broken
+    monkeypatch.setattr(graph_module, "aiosqlite", Mock(connect=Mock(return_value=fresh)), raising=False)
+    with pytest.raises(RuntimeError):
+        await graph._open_checkpointer()
+    assert graph._checkpoint_conn is fresh
+    assert graph.checkpointer.conn is fresh
+    
+    await asyncio.gather(*(graph._open_checkpointer() for _ in range(5)))
+    assert fresh.opens == 1
+    assert fresh.opened
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -1,5 +1,9 @@
-"""工具模块"""
+"""工具模块
 
+工具类按需导入（PEP 562），``from tools import WeatherTool`` 只会加载对应模块。
+"""
+
+import importlib
 import sys
 from pathlib import Path
 
@@ -7,19 +11,27 @@ from pathlib import Path
 if str(Path(__file__).parent.parent) not in sys.path:
     sys.path.insert(0, str(Path(__file__).parent.parent))
 
-try:
-    from .mcp_tools import MCPToolManager
-    from .weather_tool import WeatherTool
-    from .amap_tool import AmapTool
-    from .time_tool import TimeTool
-    from .memory_tool import MemoryTool
-    from .filesystem_tool import FilesystemTool
-except ImportError:
-    from tools.mcp_tools import MCPToolManager
-    from tools.weather_tool import WeatherTool
-    from tools.amap_tool import AmapTool
-    from tools.time_tool import TimeTool
-    from tools.memory_tool import MemoryTool
-    from tools.filesystem_tool import FilesystemTool
+# 导出名称 -> 所在子模块
+_EXPORTS = {
+    "MCPToolManager": ".mcp_tools",
+    "WeatherTool": ".weather_tool",
+    "AmapTool": ".amap_tool",
+    "TimeTool": ".time_tool",
+    "MemoryTool": ".memory_tool",
+    "FilesystemTool": ".filesystem_tool",
+}
 
 __all__ = ["MCPToolManager", "WeatherTool", "AmapTool", "TimeTool", "MemoryTool", "FilesystemTool"]
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
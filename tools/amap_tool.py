@@ -1,21 +1,54 @@
 """高德地图地址查询工具"""
 
+from types import MappingProxyType
 from typing import Dict, Any, Optional
 import aiohttp
+import asyncio
 import os
+import random
 
-import sys
-from pathlib import Path
-
-# 确保可以导入项目模块
-project_root = Path(__file__).parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
-
+from tools.http_session import get_shared_session
+from utils.cache import TTLCache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 重试策略：最多尝试 3 次，仅对网关类 5xx 和网络异常/超时重试（4xx 不重试）
+_MAX_ATTEMPTS = 3
+_RETRY_STATUSES = frozenset((502, 503, 504))
+
+# 地理编码失败结果的缓存时间（秒），避免上游故障期间反复请求同一个地址
+_NEGATIVE_TTL = 60
+
+# 请求超时策略：总时长 10 秒，建连 2 秒内失败即放弃（快速识别死连接），读取 8 秒
+_DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=2, sock_read=8)
+
+# 模拟数据（只读，模块加载时构建一次）
+_MOCK_LOCATIONS = MappingProxyType({
+    "北京": {"longitude": 116.397128, "latitude": 39.916527},
+    "上海": {"longitude": 121.473701, "latitude": 31.230416},
+    "广州": {"longitude": 113.264385, "latitude": 23.129112},
+    "深圳": {"longitude": 114.057868, "latitude": 22.543099}
+})
+
+# 模拟 POI 模板，{keywords} / {city} 在调用时通过 str.format_map 填充
+_MOCK_POI_TEMPLATES = (
+    MappingProxyType({
+        "name": "{keywords}示例1",
+        "address": "{city}示例街道1号",
+        "location": "116.397128,39.916527",
+        "type": "{keywords}",
+        "tel": "010-12345678"
+    }),
+    MappingProxyType({
+        "name": "{keywords}示例2",
+        "address": "{city}示例街道2号",
+        "location": "116.407128,39.926527",
+        "type": "{keywords}",
+        "tel": "010-87654321"
+    })
+)
+
 
 class AmapTool:
     """高德地图地址查询工具"""
@@ -28,6 +61,9 @@ class AmapTool:
         
         # 如果没有配置 API key，使用模拟数据
         self.use_mock = not self.api_key
+        
+        # 地理编码失败结果缓存：(address, city) -> 失败原因
+        self._negative_cache = TTLCache(maxsize=1024, ttl=_NEGATIVE_TTL)
     
     async def geocode(
         self,
@@ -44,43 +80,50 @@ class AmapTool:
         Returns:
             地理编码结果（包含经纬度、详细地址等）
         """
-        logger.info(f"地理编码查询: {address}, 城市: {city}")
+        logger.info("地理编码查询: {}, 城市: {}", address, city)
         
         if self.use_mock:
             return await self._mock_geocode(address, city)
         
+        # 近期失败过的地址直接返回模拟数据，不再请求上游
+        cache_key = (address, city)
+        failure = self._negative_cache.get(cache_key)
+        if failure is not None:
+            logger.debug("地理编码命中失败缓存: {}, 原因: {}", address, failure["reason"])
+            return await self._mock_geocode(address, city)
+        
+        params = {
+            "key": self.api_key,
+            "address": address
+        }
+        if city:
+            params["city"] = city
+        
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/geocode/geo"
-                params = {
-                    "key": self.api_key,
-                    "address": address
-                }
-                if city:
-                    params["city"] = city
-                
-                async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get("status") == "1":
-                            return {
-                                "success": True,
-                                "address": address,
-                                "location": data.get("geocodes", [{}])[0].get("location", ""),
-                                "formatted_address": data.get("geocodes", [{}])[0].get("formatted_address", ""),
-                                "province": data.get("geocodes", [{}])[0].get("province", ""),
-                                "city": data.get("geocodes", [{}])[0].get("city", ""),
-                                "district": data.get("geocodes", [{}])[0].get("district", "")
-                            }
-                        else:
-                            logger.warning(f"高德地图 API 返回错误: {data.get('info')}，使用模拟数据")
-                            return await self._mock_geocode(address, city)
-                    else:
-                        logger.warning(f"高德地图 API 调用失败: {response.status}，使用模拟数据")
-                        return await self._mock_geocode(address, city)
+            data = await self._get_json("/geocode/geo", params)
         except Exception as e:
-            logger.error(f"高德地图 API 调用异常: {e}，使用模拟数据")
+            logger.error("高德地图 API 调用异常: {}，使用模拟数据", e)
+            self._negative_cache.set(cache_key, {"success": False, "reason": str(e)})
+            return await self._mock_geocode(address, city)
+        
+        if data is None:
+            self._negative_cache.set(cache_key, {"success": False, "reason": "请求失败"})
+            return await self._mock_geocode(address, city)
+        if data.get("status") != "1":
+            logger.warning("高德地图 API 返回错误: {}，使用模拟数据", data.get("info"))
+            self._negative_cache.set(cache_key, {"success": False, "reason": data.get("info")})
             return await self._mock_geocode(address, city)
+        
+        geocode = (data.get("geocodes") or [{}])[0]
+        return {
+            "success": True,
+            "address": address,
+            "location": geocode.get("location", ""),
+            "formatted_address": geocode.get("formatted_address", ""),
+            "province": geocode.get("province", ""),
+            "city": geocode.get("city", ""),
+            "district": geocode.get("district", "")
+        }
     
     async def reverse_geocode(
         self,
@@ -97,44 +140,40 @@ class AmapTool:
         Returns:
             地址信息
         """
-        logger.info(f"逆地理编码查询: ({longitude}, {latitude})")
+        logger.info("逆地理编码查询: ({}, {})", longitude, latitude)
         
         if self.use_mock:
             return await self._mock_reverse_geocode(longitude, latitude)
         
+        params = {
+            "key": self.api_key,
+            "location": f"{longitude},{latitude}"
+        }
+        
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/geocode/regeo"
-                params = {
-                    "key": self.api_key,
-                    "location": f"{longitude},{latitude}"
-                }
-                
-                async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get("status") == "1":
-                            regeocode = data.get("regeocode", {})
-                            address_component = regeocode.get("addressComponent", {})
-                            return {
-                                "success": True,
-                                "location": f"{longitude},{latitude}",
-                                "formatted_address": regeocode.get("formatted_address", ""),
-                                "province": address_component.get("province", ""),
-                                "city": address_component.get("city", ""),
-                                "district": address_component.get("district", ""),
-                                "street": address_component.get("street", ""),
-                                "street_number": address_component.get("streetNumber", "")
-                            }
-                        else:
-                            logger.warning(f"高德地图 API 返回错误: {data.get('info')}，使用模拟数据")
-                            return await self._mock_reverse_geocode(longitude, latitude)
-                    else:
-                        logger.warning(f"高德地图 API 调用失败: {response.status}，使用模拟数据")
-                        return await self._mock_reverse_geocode(longitude, latitude)
+            data = await self._get_json("/geocode/regeo", params)
         except Exception as e:
-            logger.error(f"高德地图 API 调用异常: {e}，使用模拟数据")
+            logger.error("高德地图 API 调用异常: {}，使用模拟数据", e)
             return await self._mock_reverse_geocode(longitude, latitude)
+        
+        if data is None:
+            return await self._mock_reverse_geocode(longitude, latitude)
+        if data.get("status") != "1":
+            logger.warning("高德地图 API 返回错误: {}，使用模拟数据", data.get("info"))
+            return await self._mock_reverse_geocode(longitude, latitude)
+        
+        regeocode = data.get("regeocode", {})
+        address_component = regeocode.get("addressComponent", {})
+        return {
+            "success": True,
+            "location": f"{longitude},{latitude}",
+            "formatted_address": regeocode.get("formatted_address", ""),
+            "province": address_component.get("province", ""),
+            "city": address_component.get("city", ""),
+            "district": address_component.get("district", ""),
+            "street": address_component.get("street", ""),
+            "street_number": address_component.get("streetNumber", "")
+        }
     
     async def search_poi(
         self,
@@ -153,64 +192,87 @@ class AmapTool:
         Returns:
             POI 列表
         """
-        logger.info(f"POI 搜索: {keywords}, 城市: {city}")
+        logger.info("POI 搜索: {}, 城市: {}", keywords, city)
         
         if self.use_mock:
             return await self._mock_search_poi(keywords, city)
         
+        params = {
+            "key": self.api_key,
+            "keywords": keywords
+        }
+        if city:
+            params["city"] = city
+        if types:
+            params["types"] = types
+        
         try:
-            async with aiohttp.ClientSession() as session:
-                url = f"{self.base_url}/place/text"
-                params = {
-                    "key": self.api_key,
-                    "keywords": keywords
-                }
-                if city:
-                    params["city"] = city
-                if types:
-                    params["types"] = types
-                
-                async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get("status") == "1":
-                            pois = data.get("pois", [])
-                            return {
-                                "success": True,
-                                "keywords": keywords,
-                                "count": len(pois),
-                                "pois": [
-                                    {
-                                        "name": poi.get("name", ""),
-                                        "address": poi.get("address", ""),
-                                        "location": poi.get("location", ""),
-                                        "type": poi.get("type", ""),
-                                        "tel": poi.get("tel", "")
-                                    }
-                                    for poi in pois[:10]  # 最多返回10个
-                                ]
-                            }
-                        else:
-                            logger.warning(f"高德地图 API 返回错误: {data.get('info')}，使用模拟数据")
-                            return await self._mock_search_poi(keywords, city)
-                    else:
-                        logger.warning(f"高德地图 API 调用失败: {response.status}，使用模拟数据")
-                        return await self._mock_search_poi(keywords, city)
+            data = await self._get_json("/place/text", params)
         except Exception as e:
-            logger.error(f"高德地图 API 调用异常: {e}，使用模拟数据")
+            logger.error("高德地图 API 调用异常: {}，使用模拟数据", e)
             return await self._mock_search_poi(keywords, city)
+        
+        if data is None:
+            return await self._mock_search_poi(keywords, city)
+        if data.get("status") != "1":
+            logger.warning("高德地图 API 返回错误: {}，使用模拟数据", data.get("info"))
+            return await self._mock_search_poi(keywords, city)
+        
+        pois = data.get("pois", [])
+        return {
+            "success": True,
+            "keywords": keywords,
+            "count": len(pois),
+            "pois": [
+                {
+                    "name": poi.get("name", ""),
+                    "address": poi.get("address", ""),
+                    "location": poi.get("location", ""),
+                    "type": poi.get("type", ""),
+                    "tel": poi.get("tel", "")
+                }
+                for poi in pois[:10]  # 最多返回10个
+            ]
+        }
+    
+    async def _get_json(self, path: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        调用高德地图 REST 接口，对瞬时故障做有限次指数退避重试
+        
+        Args:
+            path: 接口路径（如：/geocode/geo）
+            params: 查询参数
+            
+        Returns:
+            接口返回的 JSON；重试耗尽或遇到不可重试的状态码时返回 None
+        """
+        url = f"{self.base_url}{path}"
+        for attempt in range(_MAX_ATTEMPTS):
+            try:
+                # 复用共享会话的连接池，重试和后续调用不必重新建立 TCP/TLS 连接
+                session = await get_shared_session()
+                async with session.get(url, params=params, timeout=_DEFAULT_TIMEOUT) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    if response.status not in _RETRY_STATUSES:
+                        logger.warning("高德地图 API 调用失败: {}，使用模拟数据", response.status)
+                        return None
+                    logger.warning("高德地图 API 暂时不可用: {}（第 {} 次尝试）", response.status, attempt + 1)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("高德地图 API 网络异常: {}（第 {} 次尝试）", e, attempt + 1)
+            
+            if attempt + 1 < _MAX_ATTEMPTS:
+                # 指数退避 + 全抖动，上限 1 秒
+                await asyncio.sleep(random.uniform(0, min(2 ** attempt * 0.1, 1.0)))
+        
+        logger.warning("高德地图 API 重试 {} 次仍失败，使用模拟数据", _MAX_ATTEMPTS)
+        return None
     
     async def _mock_geocode(self, address: str, city: Optional[str] = None) -> Dict[str, Any]:
         """模拟地理编码"""
-        # 模拟数据
-        mock_locations = {
-            "北京": {"longitude": 116.397128, "latitude": 39.916527},
-            "上海": {"longitude": 121.473701, "latitude": 31.230416},
-            "广州": {"longitude": 113.264385, "latitude": 23.129112},
-            "深圳": {"longitude": 114.057868, "latitude": 22.543099}
-        }
-        
-        location = mock_locations.get(city or address[:2] if address else "北京", mock_locations["北京"])
+        # 优先按城市匹配，否则取地址前两个字（如"北京市..."取"北京"）
+        key = city if city in _MOCK_LOCATIONS else (address[:2] if address else "")
+        location = _MOCK_LOCATIONS.get(key, _MOCK_LOCATIONS["北京"])
         
         return {
             "success": True,
@@ -239,21 +301,10 @@ class AmapTool:
     
     async def _mock_search_poi(self, keywords: str, city: Optional[str] = None) -> Dict[str, Any]:
         """模拟 POI 搜索"""
+        fields = {"keywords": keywords, "city": city or "北京市"}
         mock_pois = [
-            {
-                "name": f"{keywords}示例1",
-                "address": f"{city or '北京市'}示例街道1号",
-                "location": "116.397128,39.916527",
-                "type": keywords,
-                "tel": "010-12345678"
-            },
-            {
-                "name": f"{keywords}示例2",
-                "address": f"{city or '北京市'}示例街道2号",
-                "location": "116.407128,39.926527",
-                "type": keywords,
-                "tel": "010-87654321"
-            }
+            {key: value.format_map(fields) for key, value in template.items()}
+            for template in _MOCK_POI_TEMPLATES
         ]
         
         return {
@@ -1,16 +1,12 @@
 """文件系统工具 - 使用 MCP 协议"""
 
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, Optional, Tuple
+import asyncio
 import os
 
-import sys
-from pathlib import Path
-
-# 确保可以导入项目模块
-project_root = Path(__file__).parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
-
+from tools.mcp_session import parse_mcp_args
+from utils import json_utils
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -25,6 +21,13 @@ except ImportError:
     logger.warning("MCP SDK 不可用")
 
 
+@lru_cache(maxsize=1024)
+def _path_allowed(path: str, allowed_dirs: Tuple[str, ...]) -> bool:
+    """检查路径是否在允许范围内（结果按路径缓存）"""
+    abs_path = os.path.abspath(path)
+    return any(abs_path.startswith(allowed) for allowed in allowed_dirs)
+
+
 class FilesystemTool:
     """文件系统工具 - 使用 MCP 协议"""
     
@@ -36,14 +39,14 @@ class FilesystemTool:
         # 默认允许访问的目录：/app/data, /app/logs, /app/cache
         default_dirs = "/app/data /app/logs /app/cache"
         mcp_args_str = os.getenv("FILESYSTEM_MCP_ARGS", f"-y @modelcontextprotocol/server-filesystem {default_dirs}")
-        self.mcp_args = mcp_args_str.split() if " " in mcp_args_str else mcp_args_str.split(",")
+        self.mcp_args = list(parse_mcp_args(mcp_args_str))
         
         # 允许访问的目录（安全限制）
-        self.allowed_dirs = [
+        self.allowed_dirs = (
             "/app/data",
             "/app/logs",
             "/app/cache"
-        ]
+        )
         
         # 如果没有配置 MCP，使用系统文件操作
         self.use_mcp = MCP_AVAILABLE and self.mcp_command
@@ -58,7 +61,7 @@ class FilesystemTool:
         Returns:
             文件内容
         """
-        logger.info(f"读取文件: {file_path}")
+        logger.info("读取文件: {}", file_path)
         
         # 安全检查
         if not self._is_path_allowed(file_path):
@@ -71,7 +74,7 @@ class FilesystemTool:
             try:
                 return await self._read_via_mcp(file_path)
             except Exception as e:
-                logger.warning(f"MCP 文件读取失败: {e}，使用系统文件操作")
+                logger.warning("MCP 文件读取失败: {}，使用系统文件操作", e)
                 return await self._read_system_file(file_path)
         else:
             return await self._read_system_file(file_path)
@@ -86,7 +89,7 @@ class FilesystemTool:
         Returns:
             目录内容列表
         """
-        logger.info(f"列出目录: {dir_path}")
+        logger.info("列出目录: {}", dir_path)
         
         # 安全检查
         if not self._is_path_allowed(dir_path):
@@ -99,15 +102,14 @@ class FilesystemTool:
             try:
                 return await self._list_via_mcp(dir_path)
             except Exception as e:
-                logger.warning(f"MCP 目录列表失败: {e}，使用系统文件操作")
+                logger.warning("MCP 目录列表失败: {}，使用系统文件操作", e)
                 return await self._list_system_directory(dir_path)
         else:
             return await self._list_system_directory(dir_path)
     
     def _is_path_allowed(self, path: str) -> bool:
         """检查路径是否在允许范围内"""
-        abs_path = os.path.abspath(path)
-        return any(abs_path.startswith(allowed) for allowed in self.allowed_dirs)
+        return _path_allowed(path, tuple(self.allowed_dirs))
     
     async def _read_via_mcp(self, file_path: str) -> Dict[str, Any]:
         """通过 MCP 协议读取文件"""
@@ -129,7 +131,7 @@ class FilesystemTool:
                     
                     # 列出可用工具
                     tools = await session.list_tools()
-                    logger.info(f"Filesystem MCP 可用工具: {[tool.name for tool in tools.tools]}")
+                    logger.opt(lazy=True).debug("Filesystem MCP 可用工具: {}", lambda: [tool.name for tool in tools.tools])
                     
                     # 查找读取文件工具
                     read_tool = None
@@ -142,7 +144,7 @@ class FilesystemTool:
                         raise Exception("未找到文件读取工具")
                     
                     # 调用工具读取文件
-                    logger.info(f"调用文件读取工具: {read_tool.name}, path={file_path}")
+                    logger.info("调用文件读取工具: {}, path={}", read_tool.name, file_path)
                     result = await session.call_tool(
                         read_tool.name,
                         arguments={"path": file_path}
@@ -162,7 +164,7 @@ class FilesystemTool:
                         raise Exception("MCP 服务返回空结果")
                         
         except Exception as e:
-            logger.error(f"MCP 文件读取失败: {e}", exc_info=True)
+            logger.error("MCP 文件读取失败: {}", e, exc_info=True)
             raise
     
     async def _list_via_mcp(self, dir_path: str) -> Dict[str, Any]:
@@ -204,7 +206,7 @@ class FilesystemTool:
                         raise Exception("未找到目录列表工具")
                     
                     # 调用工具列出目录
-                    logger.info(f"调用目录列表工具: {list_tool.name}, path={dir_path}")
+                    logger.info("调用目录列表工具: {}, path={}", list_tool.name, dir_path)
                     result = await session.call_tool(
                         list_tool.name,
                         arguments={"path": dir_path}
@@ -214,10 +216,8 @@ class FilesystemTool:
                     if result.content:
                         content = result.content[0] if result.content else {}
                         if hasattr(content, 'text'):
-                            import json
-                            try:
-                                data = json.loads(content.text)
-                            except:
+                            data = json_utils.loads_object(content.text)
+                            if data is None:
                                 data = {"files": content.text.split("\n")}
                             
                             return {
@@ -230,11 +230,20 @@ class FilesystemTool:
                         raise Exception("MCP 服务返回空结果")
                         
         except Exception as e:
-            logger.error(f"MCP 目录列表失败: {e}", exc_info=True)
+            logger.error("MCP 目录列表失败: {}", e, exc_info=True)
             raise
     
     async def _read_system_file(self, file_path: str) -> Dict[str, Any]:
-        """使用系统文件操作读取文件（回退方案）"""
+        """使用系统文件操作读取文件（回退方案，在线程池中执行）"""
+        return await asyncio.to_thread(self._read_system_file_sync, file_path)
+    
+    async def _list_system_directory(self, dir_path: str) -> Dict[str, Any]:
+        """使用系统文件操作列出目录（回退方案，在线程池中执行）"""
+        return await asyncio.to_thread(self._list_system_directory_sync, dir_path)
+    
+    @staticmethod
+    def _read_system_file_sync(file_path: str) -> Dict[str, Any]:
+        """读取文件（阻塞调用）"""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
@@ -251,16 +260,18 @@ class FilesystemTool:
                 "source": "系统文件操作"
             }
     
-    async def _list_system_directory(self, dir_path: str) -> Dict[str, Any]:
-        """使用系统文件操作列出目录（回退方案）"""
+    @staticmethod
+    def _list_system_directory_sync(dir_path: str) -> Dict[str, Any]:
+        """列出目录（阻塞调用）"""
         try:
-            files = []
-            for item in os.listdir(dir_path):
-                item_path = os.path.join(dir_path, item)
-                files.append({
-                    "name": item,
-                    "type": "directory" if os.path.isdir(item_path) else "file"
-                })
+            with os.scandir(dir_path) as entries:
+                files = [
+                    {
+                        "name": entry.name,
+                        "type": "directory" if entry.is_dir() else "file"
+                    }
+                    for entry in entries
+                ]
             return {
                 "success": True,
                 "path": dir_path,
@@ -0,0 +1,149 @@
+"""共享的 HTTP 会话
+
+火车票、天气等工具调用外部 HTTP API 时共用一个连接池，
+避免每次请求重新建立 TCP/TLS 连接。
+
+默认使用 aiohttp；也可以使用 httpx（安装 h2 后启用 HTTP/2 多路复用），
+httpx 客户端包装成与 aiohttp 会话相同的 get 接口，调用方无需区分。
+"""
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+import asyncio
+
+import aiohttp
+
+from utils import json_utils
+
+# 尝试导入 httpx（可选依赖）
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+# aiodns 可用时使用异步 DNS 解析（默认解析器在线程池中调用 getaddrinfo）
+try:
+    import aiodns  # noqa: F401
+    AIODNS_AVAILABLE = True
+except ImportError:
+    AIODNS_AVAILABLE = False
+
+# HTTP/2 需要 h2 包
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 请求超时策略：总时长 10 秒，建连 3 秒、读取 7 秒内无响应即放弃
+_DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3, sock_read=7)
+
+# DNS 解析结果缓存时间（秒）
+_DNS_TTL = 600
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+_httpx_session: Optional["HttpxSession"] = None
+_httpx_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def make_connector(**kwargs) -> aiohttp.TCPConnector:
+    """
+    创建带 DNS 缓存的连接器（安装了 aiodns 时使用异步 DNS 解析），需在事件循环中调用
+    
+    Args:
+        **kwargs: 传给 TCPConnector 的其他参数（如 limit）
+    """
+    if AIODNS_AVAILABLE:
+        kwargs["resolver"] = aiohttp.AsyncResolver()
+    return aiohttp.TCPConnector(
+        use_dns_cache=True,
+        ttl_dns_cache=_DNS_TTL,
+        keepalive_timeout=60,
+        **kwargs
+    )
+
+
+async def get_shared_session() -> aiohttp.ClientSession:
+    """
+    获取共享的 HTTP 会话
+    
+    首次调用时创建；会话已关闭或事件循环已更换（如测试中多次 asyncio.run）时重新创建。
+    创建过程中没有 await，同一事件循环内不需要加锁。
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = aiohttp.ClientSession(
+            connector=make_connector(limit=100, limit_per_host=20),
+            timeout=_DEFAULT_TIMEOUT
+        )
+        _session_loop = loop
+    return _session
+
+
+async def close_shared_session():
+    """关闭共享的 HTTP 会话（包括 httpx 会话，应用关闭时调用）"""
+    global _session, _session_loop, _httpx_session, _httpx_session_loop
+    if _session is not None and not _session.closed and _session_loop is asyncio.get_running_loop():
+        await _session.close()
+    _session = None
+    _session_loop = None
+    
+    if _httpx_session is not None and not _httpx_session.closed and _httpx_session_loop is asyncio.get_running_loop():
+        await _httpx_session.close()
+    _httpx_session = None
+    _httpx_session_loop = None
+
+
+class _HttpxResponse:
+    """把 httpx 响应包装成 aiohttp 响应的常用接口"""
+    
+    def __init__(self, response: "httpx.Response"):
+        self._response = response
+        self.status = response.status_code
+    
+    async def json(self, loads=json_utils.loads) -> Any:
+        return loads(self._response.content)
+    
+    async def text(self) -> str:
+        return self._response.text
+
+
+class HttpxSession:
+    """提供 aiohttp 风格 get 接口的 httpx 客户端"""
+    
+    def __init__(self, client: "httpx.AsyncClient"):
+        self.client = client
+    
+    @property
+    def closed(self) -> bool:
+        return self.client.is_closed
+    
+    @asynccontextmanager
+    async def get(self, url: str, **kwargs) -> AsyncIterator[_HttpxResponse]:
+        response = await self.client.get(url, **kwargs)
+        yield _HttpxResponse(response)
+    
+    async def close(self):
+        await self.client.aclose()
+
+
+async def get_shared_httpx_session() -> HttpxSession:
+    """
+    获取共享的 httpx 会话（已安装 h2 时启用 HTTP/2）
+    
+    与 get_shared_session 相同，会话已关闭或事件循环已更换时重新创建。
+    """
+    global _httpx_session, _httpx_session_loop
+    loop = asyncio.get_running_loop()
+    if _httpx_session is None or _httpx_session.closed or _httpx_session_loop is not loop:
+        _httpx_session = HttpxSession(httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=10.0,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+        ))
+        _httpx_session_loop = loop
+    return _httpx_session
@@ -3,14 +3,6 @@
 from typing import Dict, Any, Optional
 import os
 
-import sys
-from pathlib import Path
-
-# 确保可以导入项目模块
-project_root = Path(__file__).parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
-
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -71,7 +63,7 @@ class KnowledgeBaseTool:
         Returns:
             查询结果
         """
-        logger.info(f"查询知识库: {query}, 类别: {category}")
+        logger.info("查询知识库: {}, 类别: {}", query, category)
         
         # 模拟查询逻辑（实际应该调用真实的知识库API）
         results = []
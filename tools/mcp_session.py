@@ -0,0 +1,288 @@
+"""MCP stdio 会话缓存
+
+每个 (command, args) 维护一个会话池：池中的 MCP 服务子进程只启动一次，
+初始化后的 ClientSession 和工具列表在多次调用之间复用，避免每次查询都
+重新拉起进程并握手。池大小大于 1 时，并发调用分摊到多个子进程。
+"""
+
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import shlex
+import weakref
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 尝试导入 MCP SDK
+try:
+    import anyio
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+    MCP_AVAILABLE = True
+except ImportError:
+    MCP_AVAILABLE = False
+
+# 连接关闭时会话抛出的 McpError（错误码同 mcp.types.CONNECTION_CLOSED），旧版本 SDK 没有该异常
+try:
+    from mcp.shared.exceptions import McpError
+except ImportError:
+    McpError = None
+_CONNECTION_CLOSED = -32000
+
+# 说明会话本身已不可用（子进程退出、管道断开）的异常；BrokenPipeError 属于 ConnectionError
+if MCP_AVAILABLE:
+    _TRANSPORT_ERRORS = (ConnectionError, EOFError, anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream)
+else:
+    _TRANSPORT_ERRORS = (ConnectionError, EOFError)
+
+
+SessionKey = Tuple[str, Tuple[str, ...]]
+
+
+@lru_cache(maxsize=None)
+def parse_mcp_args(args_str: str) -> Tuple[str, ...]:
+    """
+    解析 MCP 服务命令参数
+
+    按 shell 规则拆分（支持带引号的参数）；不含空白但含逗号时，
+    兼容旧的逗号分隔写法（如 "-y,12306-mcp"）。
+
+    Args:
+        args_str: 参数字符串（通常来自环境变量）
+
+    Returns:
+        参数元组
+    """
+    if "," in args_str and not any(ch.isspace() for ch in args_str):
+        return tuple(args_str.split(","))
+    return tuple(shlex.split(args_str))
+
+
+def _is_transport_error(e: Exception) -> bool:
+    """是否为会话连接层面的错误（工具返回的错误、调用方的业务异常不算）"""
+    if isinstance(e, _TRANSPORT_ERRORS):
+        return True
+    return McpError is not None and isinstance(e, McpError) and getattr(e.error, "code", None) == _CONNECTION_CLOSED
+
+
+class _CachedSession:
+    """缓存的 MCP 会话
+
+    stdio_client 内部使用 anyio 任务组，进入和退出必须在同一个任务中完成，
+    因此由一个后台任务持有上下文，收到关闭信号后再退出。
+    """
+
+    def __init__(
+        self,
+        session: "ClientSession",
+        tools: List[Any],
+        stop: asyncio.Event,
+        task: asyncio.Task
+    ):
+        self.session = session
+        self.tools = tools
+        self.stop = stop
+        self.task = task
+        self.loop = task.get_loop()
+        self.broken = False
+
+    def usable(self) -> bool:
+        """会话是否仍可在当前事件循环中使用"""
+        return not self.task.done() and self.loop is asyncio.get_running_loop()
+
+    async def close(self):
+        """通知后台任务退出并等待子进程关闭"""
+        self.stop.set()
+        if self.loop is asyncio.get_running_loop():
+            try:
+                await self.task
+            except Exception as e:
+                logger.warning("关闭 MCP 会话失败: {}", e)
+
+
+class SessionPool:
+    """同一 MCP 服务的会话池，调用时借出一个空闲会话，用完归还
+
+    借出期间连接断开的会话会被标记为失效，下次借出时只重启这一个子进程，
+    池中其他会话（可能正被其他调用使用）不受影响。工具调用或业务逻辑出错时会话照常归还。
+    """
+
+    def __init__(self, entries: List[_CachedSession], server_params: "StdioServerParameters"):
+        self.entries = entries
+        self.server_params = server_params
+        self.loop = entries[0].loop
+        self.tools = entries[0].tools
+        self.tools_by_name = {tool.name: tool for tool in self.tools}
+        self._idle: "asyncio.Queue[_CachedSession]" = asyncio.Queue()
+        for entry in entries:
+            self._idle.put_nowait(entry)
+
+    def usable(self) -> bool:
+        """池是否可在当前事件循环中使用（已退出的单个会话在借出时重启）"""
+        return self.loop is asyncio.get_running_loop()
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator["ClientSession"]:
+        """借出一个空闲会话（全部忙碌时等待）"""
+        entry = await self._idle.get()
+        try:
+            if entry.broken or not entry.usable():
+                entry = await self._restart(entry)
+            yield entry.session
+        except Exception as e:
+            if _is_transport_error(e):
+                entry.broken = True
+            raise
+        finally:
+            self._idle.put_nowait(entry)
+
+    async def _restart(self, entry: _CachedSession) -> _CachedSession:
+        """关闭失效的会话并启动新会话替换它（启动失败时抛出异常，原会话保持失效状态）"""
+        logger.info("重启失效的 MCP 会话: {}", self.server_params.command)
+        await entry.close()
+        new_entry = await _start_session(self.server_params)
+        self.entries[self.entries.index(entry)] = new_entry
+        return new_entry
+
+    async def close(self):
+        """关闭池中所有会话"""
+        for entry in self.entries:
+            await entry.close()
+
+
+_SESSION_CACHE: Dict[SessionKey, SessionPool] = {}
+# 创建会话池时加的锁，每个事件循环一把（asyncio.Lock 会绑定到首次争用它的事件循环，
+# 而会话池本身也是按事件循环重建的）
+_SESSION_LOCKS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+_STATS = {"hits": 0, "misses": 0}
+
+
+async def _serve(
+    server_params: "StdioServerParameters",
+    ready: asyncio.Future,
+    stop: asyncio.Event
+):
+    """后台任务：建立会话并保持打开，直到收到关闭信号"""
+    try:
+        async with stdio_client(server_params) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                tools = (await session.list_tools()).tools
+                logger.opt(lazy=True).info(
+                    "MCP 会话已建立: {}, 可用工具: {}",
+                    lambda: server_params.command,
+                    lambda: [tool.name for tool in tools]
+                )
+                ready.set_result((session, tools))
+                await stop.wait()
+    except Exception as e:
+        if not ready.done():
+            ready.set_exception(e)
+        else:
+            logger.warning("MCP 会话异常退出: {}", e)
+
+
+async def _start_session(server_params: "StdioServerParameters") -> _CachedSession:
+    """启动一个 MCP 服务子进程并等待会话初始化完成"""
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    stop = asyncio.Event()
+    task = loop.create_task(_serve(server_params, ready, stop))
+    session, tools = await ready
+    return _CachedSession(session, tools, stop, task)
+
+
+def _session_lock() -> asyncio.Lock:
+    """获取当前事件循环的会话池创建锁"""
+    loop = asyncio.get_running_loop()
+    lock = _SESSION_LOCKS.get(loop)
+    if lock is None:
+        lock = _SESSION_LOCKS[loop] = asyncio.Lock()
+    return lock
+
+
+async def get_pool(command: str, args: Sequence[str], size: int = 1) -> SessionPool:
+    """
+    获取（必要时创建）缓存的 MCP 会话池
+
+    Args:
+        command: MCP 服务启动命令
+        args: 命令参数
+        size: 池大小（仅在创建时生效），各子进程并发启动
+
+    Returns:
+        会话池
+    """
+    if not MCP_AVAILABLE:
+        raise Exception("MCP SDK 不可用")
+
+    key = (command, tuple(args))
+    pool = _SESSION_CACHE.get(key)
+    if pool is not None and pool.usable():
+        _STATS["hits"] += 1
+        return pool
+
+    async with _session_lock():
+        pool = _SESSION_CACHE.get(key)
+        if pool is not None and pool.usable():
+            _STATS["hits"] += 1
+            return pool
+
+        _STATS["misses"] += 1
+        if pool is not None:
+            # 事件循环已更换，整体重建
+            await pool.close()
+
+        server_params = StdioServerParameters(command=command, args=list(args))
+        results = await asyncio.gather(
+            *(_start_session(server_params) for _ in range(max(size, 1))),
+            return_exceptions=True
+        )
+        entries = [r for r in results if isinstance(r, _CachedSession)]
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            for entry in entries:
+                await entry.close()
+            raise errors[0]
+
+        pool = SessionPool(entries, server_params)
+        _SESSION_CACHE[key] = pool
+        return pool
+
+
+async def close_all():
+    """关闭所有缓存的会话"""
+    pools = list(_SESSION_CACHE.values())
+    _SESSION_CACHE.clear()
+    for pool in pools:
+        await pool.close()
+
+
+def resolve_tool_name(tools: Sequence[Any], patterns: Tuple[str, ...]) -> Optional[str]:
+    """
+    按名称匹配规则查找工具
+
+    Args:
+        tools: 会话的工具列表
+        patterns: 小写子串，工具名包含其中任意一个即视为匹配
+
+    Returns:
+        第一个匹配的工具名，未找到时返回 None
+    """
+    for tool in tools:
+        name = tool.name.lower()
+        if any(pattern in name for pattern in patterns):
+            return tool.name
+    return None
+
+
+def get_cache_stats() -> Dict[str, int]:
+    """获取会话缓存统计信息"""
+    return {
+        "hits": _STATS["hits"],
+        "misses": _STATS["misses"],
+        "sessions": sum(len(pool.entries) for pool in _SESSION_CACHE.values())
+    }
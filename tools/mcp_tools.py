@@ -1,45 +1,172 @@
 """MCP 工具管理器"""
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import aiohttp
+import asyncio
+import functools
 import os
-
 import sys
-from pathlib import Path
-
-# 确保可以导入项目模块
-project_root = Path(__file__).parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
 
-# 导入工具类
-from tools.weather_tool import WeatherTool
-from tools.amap_tool import AmapTool
-from tools.train_ticket_tool import TrainTicketTool
-from tools.time_tool import TimeTool
-from tools.memory_tool import MemoryTool
-from tools.filesystem_tool import FilesystemTool
+from utils.cache import SingleFlight, TTLCache
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
 
+# 单次请求总超时：Python 3.11+ 使用 asyncio.timeout，旧版本回退到 async_timeout
+try:
+    from asyncio import timeout as request_timeout
+except ImportError:
+    from async_timeout import timeout as request_timeout
+
+# 请求超时策略：总时长 10 秒（由 request_timeout 控制），建连 2 秒内失败即放弃（快速识别死连接），读取 8 秒
+_REQUEST_TIMEOUT = 10
+_DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=None, connect=2, sock_read=8)
+
+
+# 各工具结果缓存时间（秒）：时间类结果只在 1 秒内复用，知识库 1 分钟（合并短时间内的重复提问），
+# POI 1 小时，地理编码基本不变（天气结果由 WeatherTool 自行缓存）
+_TTL_TIME = 1
+_TTL_KNOWLEDGE = 60
+_TTL_POI = 3600
+_TTL_GEOCODE = 86400
+
+
+def _is_cacheable(result: Any) -> bool:
+    """模拟数据（带 note 说明）是上游失败时的回退结果，不写入缓存"""
+    return isinstance(result, dict) and "note" not in result
+
+
+def _wrap(err_msg: str, ttl: Optional[float] = None):
+    """
+    将工具调用结果包装为 {"success", "data"/"error"} 结构的装饰器
+    
+    Args:
+        err_msg: 调用失败时的日志前缀
+        ttl: 结果缓存时间（秒），None 表示不缓存；
+            缓存未命中时相同参数的并发调用只会执行一次
+    """
+    def deco(fn):
+        name = fn.__name__
+        
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            if ttl is None:
+                try:
+                    return {"success": True, "data": await fn(self, *args, **kwargs)}
+                except Exception as e:
+                    logger.error("{}: {}", err_msg, e)
+                    return {"success": False, "error": str(e)}
+            
+            key = (name, args, tuple(sorted(kwargs.items())) if kwargs else ())
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                return cached
+            
+            try:
+                result = await self._inflight.do(key, lambda: fn(self, *args, **kwargs))
+            except Exception as e:
+                logger.error("{}: {}", err_msg, e)
+                return {"success": False, "error": str(e)}
+            
+            wrapped = {"success": True, "data": result}
+            if _is_cacheable(result):
+                self._result_cache.set(key, wrapped, ttl)
+            return wrapped
+        return wrapper
+    return deco
+
+
 class MCPToolManager:
     """MCP 工具管理器"""
     
     def __init__(self):
         """初始化工具管理器"""
-        # 使用真实的 MCP 工具
-        self.weather_tool = WeatherTool()
-        self.amap_tool = AmapTool()
-        self.train_ticket_tool = TrainTicketTool()
-        self.time_tool = TimeTool()
-        self.memory_tool = MemoryTool()
-        self.filesystem_tool = FilesystemTool()
-        
         # MCP 服务器配置
         self.mcp_server_url = os.getenv("MCP_SERVER_URL", "http://localhost:8001")
+        
+        # 复用的 HTTP 会话（首次调用时创建，保持连接池）
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        # 工具结果缓存与并发请求合并
+        self._result_cache = TTLCache(maxsize=1024)
+        self._inflight = SingleFlight()
+        
+        # 并发调用上限（保护上游服务的限流配额）
+        self._max_concurrency = int(os.getenv("MCP_CONCURRENCY", "8"))
+        self._concurrency = asyncio.Semaphore(self._max_concurrency)
+        
+        # HTTP 会话和信号量所属的事件循环，更换后两者一起重建（见 _check_loop）
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    # 工具实例在首次使用时创建，未用到的工具模块不会被导入
+    @functools.cached_property
+    def weather_tool(self):
+        """天气工具"""
+        from tools.weather_tool import WeatherTool
+        return WeatherTool()
+    
+    @functools.cached_property
+    def amap_tool(self):
+        """高德地图工具"""
+        from tools.amap_tool import AmapTool
+        return AmapTool()
+    
+    @functools.cached_property
+    def train_ticket_tool(self):
+        """火车票工具"""
+        from tools.train_ticket_tool import TrainTicketTool
+        return TrainTicketTool()
+    
+    @functools.cached_property
+    def time_tool(self):
+        """时间工具"""
+        from tools.time_tool import TimeTool
+        return TimeTool()
+    
+    @functools.cached_property
+    def memory_tool(self):
+        """记忆/知识库工具"""
+        from tools.memory_tool import MemoryTool
+        return MemoryTool()
+    
+    @functools.cached_property
+    def filesystem_tool(self):
+        """文件系统工具"""
+        from tools.filesystem_tool import FilesystemTool
+        return FilesystemTool()
+    
+    def _check_loop(self):
+        """事件循环已更换（如测试中多次 asyncio.run）时，丢弃绑定在旧循环上的 HTTP 会话并重建信号量"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._session = None
+            self._concurrency = asyncio.Semaphore(self._max_concurrency)
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """
+        获取复用的 HTTP 会话
+        
+        与 http_session.get_shared_session 相同，会话不存在、已关闭或事件循环已更换
+        时重新创建；创建过程中没有 await，不需要加锁。
+        """
+        self._check_loop()
+        if self._session is None or self._session.closed:
+            from tools.http_session import make_connector
+            self._session = aiohttp.ClientSession(
+                connector=make_connector(limit=100),
+                timeout=_DEFAULT_TIMEOUT
+            )
+        return self._session
+    
+    async def aclose(self):
+        """关闭管理器自己的 HTTP 会话（工具共用的连接池和 MCP 会话由 close_shared_tool_manager 关闭）"""
+        if self._session is not None and not self._session.closed and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
     
+    @_wrap("天气查询失败")
     async def query_weather(
         self,
         city: str,
@@ -55,19 +182,9 @@ class MCPToolManager:
         Returns:
             天气信息
         """
-        try:
-            result = await self.weather_tool.query_weather(city, country)
-            return {
-                "success": True,
-                "data": result
-            }
-        except Exception as e:
-            logger.error(f"天气查询失败: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return await self.weather_tool.query_weather(city, country)
     
+    @_wrap("地址查询失败", ttl=_TTL_GEOCODE)
     async def query_address(
         self,
         address: str,
@@ -83,19 +200,9 @@ class MCPToolManager:
         Returns:
             地址信息（包含经纬度等）
         """
-        try:
-            result = await self.amap_tool.geocode(address, city)
-            return {
-                "success": True,
-                "data": result
-            }
-        except Exception as e:
-            logger.error(f"地址查询失败: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return await self.amap_tool.geocode(address, city)
     
+    @_wrap("地点搜索失败", ttl=_TTL_POI)
     async def search_location(
         self,
         keywords: str,
@@ -111,19 +218,9 @@ class MCPToolManager:
         Returns:
             POI 列表
         """
-        try:
-            result = await self.amap_tool.search_poi(keywords, city)
-            return {
-                "success": True,
-                "data": result
-            }
-        except Exception as e:
-            logger.error(f"地点搜索失败: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return await self.amap_tool.search_poi(keywords, city)
     
+    @_wrap("火车票查询失败")
     async def query_train_tickets(
         self,
         from_station: str,
@@ -141,19 +238,9 @@ class MCPToolManager:
         Returns:
             车次信息列表
         """
-        try:
-            result = await self.train_ticket_tool.query_trains(from_station, to_station, date)
-            return {
-                "success": True,
-                "data": result
-            }
-        except Exception as e:
-            logger.error(f"火车票查询失败: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return await self.train_ticket_tool.query_trains(from_station, to_station, date)
     
+    @_wrap("时间查询失败", ttl=_TTL_TIME)
     async def query_time(
         self,
         timezone: Optional[str] = None
@@ -167,19 +254,9 @@ class MCPToolManager:
         Returns:
             时间信息
         """
-        try:
-            result = await self.time_tool.get_current_time(timezone)
-            return {
-                "success": True,
-                "data": result
-            }
-        except Exception as e:
-            logger.error(f"时间查询失败: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return await self.time_tool.get_current_time(timezone)
     
+    @_wrap("日期查询失败", ttl=_TTL_TIME)
     async def get_date_info(self) -> Dict[str, Any]:
         """
         获取日期信息（今天几号、星期几等）
@@ -187,19 +264,9 @@ class MCPToolManager:
         Returns:
             日期信息
         """
-        try:
-            result = await self.time_tool.get_date_info()
-            return {
-                "success": True,
-                "data": result
-            }
-        except Exception as e:
-            logger.error(f"日期查询失败: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return await self.time_tool.get_date_info()
     
+    @_wrap("知识库搜索失败", ttl=_TTL_KNOWLEDGE)
     async def search_knowledge_base(
         self,
         query: str,
@@ -215,19 +282,9 @@ class MCPToolManager:
         Returns:
             搜索结果
         """
-        try:
-            result = await self.memory_tool.search_memory(query, limit)
-            return {
-                "success": True,
-                "data": result
-            }
-        except Exception as e:
-            logger.error(f"知识库搜索失败: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return await self.memory_tool.search_memory(query, limit)
     
+    @_wrap("文件读取失败")
     async def read_file(
         self,
         file_path: str
@@ -241,19 +298,9 @@ class MCPToolManager:
         Returns:
             文件内容
         """
-        try:
-            result = await self.filesystem_tool.read_file(file_path)
-            return {
-                "success": True,
-                "data": result
-            }
-        except Exception as e:
-            logger.error(f"文件读取失败: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return await self.filesystem_tool.read_file(file_path)
     
+    @_wrap("目录列表失败")
     async def list_directory(
         self,
         dir_path: str
@@ -267,18 +314,33 @@ class MCPToolManager:
         Returns:
             目录内容
         """
-        try:
-            result = await self.filesystem_tool.list_directory(dir_path)
-            return {
-                "success": True,
-                "data": result
-            }
-        except Exception as e:
-            logger.error(f"目录列表失败: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return await self.filesystem_tool.list_directory(dir_path)
+    
+    async def batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        并发执行多个相互独立的工具调用
+        
+        Args:
+            calls: (方法名, 关键字参数) 列表，如 [("query_weather", {"city": "北京"})]
+            
+        Returns:
+            与 calls 顺序一致的结果列表
+        """
+        self._check_loop()
+        concurrency = self._concurrency
+        
+        async def run(name: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+            async with concurrency:
+                return await getattr(self, name)(**kwargs)
+        
+        results = await asyncio.gather(
+            *(run(name, kwargs) for name, kwargs in calls),
+            return_exceptions=True
+        )
+        return [
+            {"success": False, "error": str(result)} if isinstance(result, BaseException) else result
+            for result in results
+        ]
     
     async def call_mcp_tool(
         self,
@@ -296,19 +358,58 @@ class MCPToolManager:
             工具执行结果
         """
         try:
-            async with aiohttp.ClientSession() as session:
+            session = await self._get_session()
+            async with request_timeout(_REQUEST_TIMEOUT):
                 async with session.post(
                     f"{self.mcp_server_url}/tools/{tool_name}",
-                    json=parameters,
-                    timeout=aiohttp.ClientTimeout(total=10)
+                    json=parameters
                 ) as response:
                     if response.status == 200:
                         return await response.json()
                     else:
                         raise Exception(f"MCP工具调用失败: {response.status}")
         except Exception as e:
-            logger.error(f"MCP工具调用失败: {e}")
+            logger.error("MCP工具调用失败: {}", e)
             return {
                 "success": False,
                 "error": str(e)
             }
+
+
+_shared_tool_manager: Optional[MCPToolManager] = None
+
+
+def get_shared_tool_manager() -> MCPToolManager:
+    """
+    获取进程内共享的工具管理器
+    
+    各工作流实例复用同一个管理器，从而共用 HTTP 会话、结果缓存、并发请求合并和并发上限，
+    而不是每个实例各建一套。
+    
+    Returns:
+        共享的工具管理器
+    """
+    global _shared_tool_manager
+    if _shared_tool_manager is None:
+        _shared_tool_manager = MCPToolManager()
+    return _shared_tool_manager
+
+
+async def close_shared_tool_manager():
+    """
+    关闭进程内共享的工具管理器，以及工具共用的 HTTP 连接池和缓存的 MCP 会话（应用关闭时调用）
+    
+    这些资源由所有工作流实例共用，不随单个工作流的 aclose() 关闭。
+    """
+    global _shared_tool_manager
+    if _shared_tool_manager is not None:
+        await _shared_tool_manager.aclose()
+        _shared_tool_manager = None
+    
+    # 只关闭已被工具导入（用过）的共享资源
+    mcp_session = sys.modules.get("tools.mcp_session")
+    if mcp_session is not None:
+        await mcp_session.close_all()
+    http_session = sys.modules.get("tools.http_session")
+    if http_session is not None:
+        await http_session.close_shared_session()
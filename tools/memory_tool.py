@@ -1,29 +1,41 @@
 """记忆/知识库查询工具 - 使用 MCP 协议"""
 
-from typing import Dict, Any, Optional, List
+from types import MappingProxyType
+from typing import Dict, Any, Optional, List, Tuple
 import os
 
-import sys
-from pathlib import Path
-
-# 确保可以导入项目模块
-project_root = Path(__file__).parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
-
+from tools.mcp_session import MCP_AVAILABLE, get_pool, parse_mcp_args, resolve_tool_name
+from utils import json_utils
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-# 尝试导入 MCP SDK
-try:
-    from mcp import ClientSession, StdioServerParameters
-    from mcp.client.stdio import stdio_client
-    MCP_AVAILABLE = True
-except ImportError:
-    MCP_AVAILABLE = False
+if not MCP_AVAILABLE:
     logger.warning("MCP SDK 不可用")
 
+# 工具名匹配规则（Memory MCP 使用 search_nodes / create_entities 等）
+_SEARCH_PATTERNS = ("search",)
+_SEARCH_FALLBACK_PATTERNS = ("read", "query")
+_STORE_PATTERNS = ("store", "save", "create")
+
+# 模拟知识库（回退方案），按类别组织，并展开为 (类别, 条目) 列表供检索
+_MOCK_KB_BY_CAT = MappingProxyType({
+    "订单": (
+        {"content": "订单查询：可以通过订单号查询订单状态", "score": 0.9},
+        {"content": "订单取消：订单在发货前可以取消", "score": 0.8}
+    ),
+    "退款": (
+        {"content": "退款申请：7天内可以申请退款", "score": 0.9},
+        {"content": "退款流程：提交申请后3-5个工作日处理", "score": 0.8}
+    ),
+    "产品": (
+        {"content": "产品咨询：我们有多种产品可供选择", "score": 0.9},
+    )
+})
+_MOCK_KB_ITEMS: Tuple[Tuple[str, Dict[str, Any]], ...] = tuple(
+    (category, item) for category, items in _MOCK_KB_BY_CAT.items() for item in items
+)
+
 
 class MemoryTool:
     """记忆/知识库查询工具 - 使用 MCP 协议"""
@@ -32,11 +44,31 @@ class MemoryTool:
         """初始化记忆工具"""
         # MCP 服务配置
         self.mcp_command = os.getenv("MEMORY_MCP_COMMAND", "npx")
-        mcp_args_str = os.getenv("MEMORY_MCP_ARGS", "-y @modelcontextprotocol/server-memory")
-        self.mcp_args = mcp_args_str.split() if " " in mcp_args_str else mcp_args_str.split(",")
+        self.mcp_args = list(parse_mcp_args(os.getenv("MEMORY_MCP_ARGS", "-y @modelcontextprotocol/server-memory")))
+        # 会话池大小（并发查询时分摊到多个 MCP 子进程）
+        self.pool_size = int(os.getenv("MEMORY_MCP_POOL_SIZE", "1"))
         
         # 如果没有配置 MCP，使用模拟数据
         self.use_mcp = MCP_AVAILABLE and self.mcp_command
+        
+        # 会话建立后解析一次的工具名
+        self._resolved_tools: Dict[str, Optional[str]] = {}
+        self._resolved_from: Optional[List[Any]] = None
+    
+    async def _get_mcp_pool(self):
+        """获取缓存的 MCP 会话池，会话（工具列表）变化时重新解析工具名"""
+        pool = await get_pool(self.mcp_command, self.mcp_args, self.pool_size)
+        tools = pool.tools
+        if tools is not self._resolved_from:
+            self._resolved_tools = {
+                "search": (
+                    resolve_tool_name(tools, _SEARCH_PATTERNS)
+                    or resolve_tool_name(tools, _SEARCH_FALLBACK_PATTERNS)
+                ),
+                "store": resolve_tool_name(tools, _STORE_PATTERNS)
+            }
+            self._resolved_from = tools
+        return pool
     
     async def search_memory(
         self,
@@ -53,13 +85,13 @@ class MemoryTool:
         Returns:
             搜索结果
         """
-        logger.info(f"搜索记忆: {query}")
+        logger.info("搜索记忆: {}", query)
         
         if self.use_mcp:
             try:
                 return await self._search_via_mcp(query, limit)
             except Exception as e:
-                logger.warning(f"MCP 记忆搜索失败: {e}，使用模拟数据")
+                logger.warning("MCP 记忆搜索失败: {}，使用模拟数据", e)
                 return await self._mock_search(query, limit)
         else:
             return await self._mock_search(query, limit)
@@ -79,13 +111,13 @@ class MemoryTool:
         Returns:
             存储结果
         """
-        logger.info(f"存储记忆: {content[:50]}...")
+        logger.info("存储记忆: {}...", content[:50])
         
         if self.use_mcp:
             try:
                 return await self._store_via_mcp(content, metadata)
             except Exception as e:
-                logger.warning(f"MCP 记忆存储失败: {e}")
+                logger.warning("MCP 记忆存储失败: {}", e)
                 return {"success": False, "error": str(e)}
         else:
             return {"success": False, "error": "MCP 不可用"}
@@ -96,71 +128,44 @@ class MemoryTool:
             raise Exception("MCP SDK 不可用")
         
         try:
-            # 配置 MCP 服务器参数
-            server_params = StdioServerParameters(
-                command=self.mcp_command,
-                args=self.mcp_args
-            )
+            # 获取缓存的 MCP 会话池
+            pool = await self._get_mcp_pool()
+            
+            search_tool = self._resolved_tools["search"]
+            if not search_tool:
+                raise Exception("未找到搜索工具")
             
-            # 连接到 MCP 服务器
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    # 初始化会话
-                    await session.initialize()
-                    
-                    # 列出可用工具
-                    tools = await session.list_tools()
-                    logger.info(f"Memory MCP 可用工具: {[tool.name for tool in tools.tools]}")
-                    
-                    # 查找搜索工具（Memory MCP 使用 search_nodes）
-                    search_tool = None
-                    for tool in tools.tools:
-                        if tool.name == "search_nodes" or "search" in tool.name.lower():
-                            search_tool = tool
-                            break
-                    
-                    if not search_tool:
-                        # 如果没有找到，尝试使用 read_graph 或其他工具
-                        for tool in tools.tools:
-                            if "read" in tool.name.lower() or "query" in tool.name.lower():
-                                search_tool = tool
-                                break
-                    
-                    if not search_tool:
-                        raise Exception("未找到搜索工具")
-                    
-                    # 调用工具搜索
-                    arguments = {"query": query}
-                    if limit:
-                        arguments["limit"] = limit
-                    
-                    logger.info(f"调用记忆搜索工具: {search_tool.name}, arguments={arguments}")
-                    result = await session.call_tool(search_tool.name, arguments=arguments)
-                    
-                    # 解析结果
-                    if result.content:
-                        content = result.content[0] if result.content else {}
-                        if hasattr(content, 'text'):
-                            import json
-                            try:
-                                data = json.loads(content.text)
-                            except:
-                                data = {"results": [{"content": content.text}]}
-                        else:
-                            data = content
-                        
-                        return {
-                            "success": True,
-                            "query": query,
-                            "results": data.get("results", data.get("data", [])),
-                            "count": len(data.get("results", data.get("data", []))),
-                            "source": "Memory MCP (真实MCP服务)"
-                        }
-                    else:
-                        raise Exception("MCP 服务返回空结果")
-                        
+            # 调用工具搜索
+            arguments = {"query": query}
+            if limit:
+                arguments["limit"] = limit
+            
+            logger.info("调用记忆搜索工具: {}, arguments={}", search_tool, arguments)
+            async with pool.acquire() as session:
+                result = await session.call_tool(search_tool, arguments=arguments)
+            
+            # 解析结果
+            if result.content:
+                content = result.content[0] if result.content else {}
+                if hasattr(content, 'text'):
+                    data = json_utils.loads_object(content.text)
+                    if data is None:
+                        data = {"results": [{"content": content.text}]}
+                else:
+                    data = content
+                
+                return {
+                    "success": True,
+                    "query": query,
+                    "results": data.get("results", data.get("data", [])),
+                    "count": len(data.get("results", data.get("data", []))),
+                    "source": "Memory MCP (真实MCP服务)"
+                }
+            else:
+                raise Exception("MCP 服务返回空结果")
+                
         except Exception as e:
-            logger.error(f"MCP 记忆搜索失败: {e}", exc_info=True)
+            logger.error("MCP 记忆搜索失败: {}", e, exc_info=True)
             raise
     
     async def _store_via_mcp(self, content: str, metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
@@ -169,71 +174,39 @@ class MemoryTool:
             raise Exception("MCP SDK 不可用")
         
         try:
-            # 配置 MCP 服务器参数
-            server_params = StdioServerParameters(
-                command=self.mcp_command,
-                args=self.mcp_args
-            )
+            # 获取缓存的 MCP 会话池
+            pool = await self._get_mcp_pool()
+            
+            store_tool = self._resolved_tools["store"]
+            if not store_tool:
+                raise Exception("未找到存储工具")
+            
+            # 调用工具存储
+            arguments = {"content": content}
+            if metadata:
+                arguments.update(metadata)
             
-            # 连接到 MCP 服务器
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    # 初始化会话
-                    await session.initialize()
-                    
-                    # 列出可用工具
-                    tools = await session.list_tools()
-                    
-                    # 查找存储工具
-                    store_tool = None
-                    for tool in tools.tools:
-                        if "store" in tool.name.lower() or "save" in tool.name.lower() or "create" in tool.name.lower():
-                            store_tool = tool
-                            break
-                    
-                    if not store_tool:
-                        raise Exception("未找到存储工具")
-                    
-                    # 调用工具存储
-                    arguments = {"content": content}
-                    if metadata:
-                        arguments.update(metadata)
-                    
-                    logger.info(f"调用记忆存储工具: {store_tool.name}")
-                    result = await session.call_tool(store_tool.name, arguments=arguments)
-                    
-                    return {
-                        "success": True,
-                        "message": "记忆已存储",
-                        "source": "Memory MCP (真实MCP服务)"
-                    }
-                        
+            logger.info("调用记忆存储工具: {}", store_tool)
+            async with pool.acquire() as session:
+                result = await session.call_tool(store_tool, arguments=arguments)
+            
+            return {
+                "success": True,
+                "message": "记忆已存储",
+                "source": "Memory MCP (真实MCP服务)"
+            }
+                
         except Exception as e:
-            logger.error(f"MCP 记忆存储失败: {e}", exc_info=True)
+            logger.error("MCP 记忆存储失败: {}", e, exc_info=True)
             raise
     
     async def _mock_search(self, query: str, limit: int) -> Dict[str, Any]:
         """模拟搜索（回退方案）"""
-        # 模拟知识库
-        mock_kb = {
-            "订单": [
-                {"content": "订单查询：可以通过订单号查询订单状态", "score": 0.9},
-                {"content": "订单取消：订单在发货前可以取消", "score": 0.8}
-            ],
-            "退款": [
-                {"content": "退款申请：7天内可以申请退款", "score": 0.9},
-                {"content": "退款流程：提交申请后3-5个工作日处理", "score": 0.8}
-            ],
-            "产品": [
-                {"content": "产品咨询：我们有多种产品可供选择", "score": 0.9}
-            ]
-        }
-        
-        results = []
+        # 按类别命中，没有命中任何类别时返回全部条目
         query_lower = query.lower()
-        for category, items in mock_kb.items():
-            if category in query_lower or any(keyword in query_lower for keyword in ["订单", "退款", "产品"]):
-                results.extend(items)
+        results = [item for category, item in _MOCK_KB_ITEMS if category in query_lower]
+        if not results:
+            results = [item for _, item in _MOCK_KB_ITEMS]
         
         return {
             "success": True,
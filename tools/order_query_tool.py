@@ -1,20 +1,39 @@
 """订单查询工具"""
 
+from types import MappingProxyType
 from typing import Dict, Any
 import os
 
-import sys
-from pathlib import Path
-
-# 确保可以导入项目模块
-project_root = Path(__file__).parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
-
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 模拟订单数据（实际应该连接真实的订单系统），模块级只读映射
+_MOCK_ORDERS = MappingProxyType({
+    "ORD123456": {
+        "order_id": "ORD123456",
+        "status": "已发货",
+        "create_time": "2024-01-05 10:30:00",
+        "delivery_time": "预计2024-01-08 18:00:00",
+        "items": [
+            {"name": "产品A", "quantity": 2, "price": 99.00}
+        ],
+        "total_amount": 198.00,
+        "shipping_address": "北京市朝阳区xxx街道xxx号"
+    },
+    "ORD789012": {
+        "order_id": "ORD789012",
+        "status": "处理中",
+        "create_time": "2024-01-07 14:20:00",
+        "delivery_time": "预计2024-01-10 18:00:00",
+        "items": [
+            {"name": "产品B", "quantity": 1, "price": 199.00}
+        ],
+        "total_amount": 199.00,
+        "shipping_address": "上海市浦东新区xxx路xxx号"
+    }
+})
+
 
 class OrderQueryTool:
     """订单查询工具"""
@@ -25,32 +44,6 @@ class OrderQueryTool:
             "ORDER_SERVICE_URL",
             "http://localhost:8003"
         )
-        
-        # 模拟订单数据（实际应该连接真实的订单系统）
-        self.mock_orders = {
-            "ORD123456": {
-                "order_id": "ORD123456",
-                "status": "已发货",
-                "create_time": "2024-01-05 10:30:00",
-                "delivery_time": "预计2024-01-08 18:00:00",
-                "items": [
-                    {"name": "产品A", "quantity": 2, "price": 99.00}
-                ],
-                "total_amount": 198.00,
-                "shipping_address": "北京市朝阳区xxx街道xxx号"
-            },
-            "ORD789012": {
-                "order_id": "ORD789012",
-                "status": "处理中",
-                "create_time": "2024-01-07 14:20:00",
-                "delivery_time": "预计2024-01-10 18:00:00",
-                "items": [
-                    {"name": "产品B", "quantity": 1, "price": 199.00}
-                ],
-                "total_amount": 199.00,
-                "shipping_address": "上海市浦东新区xxx路xxx号"
-            }
-        }
     
     async def query(self, order_id: str) -> Dict[str, Any]:
         """
@@ -62,13 +55,14 @@ class OrderQueryTool:
         Returns:
             订单信息
         """
-        logger.info(f"查询订单: {order_id}")
+        logger.info("查询订单: {}", order_id)
         
         # 模拟查询逻辑（实际应该调用真实的订单API）
-        order_id_upper = order_id.upper()
+        # 订单号通常已是大写，命中时不再生成大写副本
+        order = _MOCK_ORDERS.get(order_id) or _MOCK_ORDERS.get(order_id.upper())
         
-        if order_id_upper in self.mock_orders:
-            return self.mock_orders[order_id_upper]
+        if order is not None:
+            return order
         else:
             # 返回模拟的订单信息（即使订单号不存在）
             return {
@@ -2,15 +2,10 @@
 
 import asyncio
 import sys
-from pathlib import Path
 from datetime import datetime
-from typing import Any, Sequence
-import json
+from typing import Any, Dict, Hashable, Optional, Sequence, Tuple
 
-# 添加项目根目录到路径
-project_root = Path(__file__).parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
+from utils import json_utils
 
 try:
     from mcp.server import Server
@@ -23,6 +18,26 @@ except ImportError:
     sys.exit(1)
 
 
+_WEEKDAYS = ("星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日")
+
+# 已序列化的响应：工具名 -> (缓存键, JSON 文本)
+# 两个工具的结果都精确到秒，同一秒内的重复调用直接复用
+_RESPONSE_CACHE: Dict[str, Tuple[Hashable, str]] = {}
+
+
+def _text_content(text: str) -> "TextContent":
+    """构造文本内容（字段值已知合法，跳过 pydantic 校验）"""
+    return TextContent.model_construct(type="text", text=text)
+
+
+def _cached_text(name: str, key: Hashable) -> Optional[str]:
+    """返回缓存键一致时的 JSON 文本，否则返回 None"""
+    cached = _RESPONSE_CACHE.get(name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    return None
+
+
 if MCP_SERVER_AVAILABLE:
     # 创建 MCP 服务器
     app = Server("time-server")
@@ -59,26 +74,34 @@ if MCP_SERVER_AVAILABLE:
         """调用工具"""
         if name == "get_current_time":
             timezone = arguments.get("timezone")
-            now = datetime.now()
-            result = {
-                "time": now.strftime("%Y-%m-%d %H:%M:%S"),
-                "timezone": timezone or "本地时区",
-                "timestamp": now.timestamp()
-            }
-            return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False))]
+            now = datetime.now().replace(microsecond=0)
+            key = (now, timezone)
+            text = _cached_text(name, key)
+            if text is None:
+                result = {
+                    "time": now.isoformat(" ", "seconds"),
+                    "timezone": timezone or "本地时区",
+                    "timestamp": now.timestamp()
+                }
+                text = json_utils.dumps(result)
+                _RESPONSE_CACHE[name] = (key, text)
+            return [_text_content(text)]
         
         elif name == "get_date_info":
-            now = datetime.now()
-            weekdays = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
-            result = {
-                "date": now.strftime("%Y-%m-%d"),
-                "year": now.year,
-                "month": now.month,
-                "day": now.day,
-                "weekday": weekdays[now.weekday()],
-                "time": now.strftime("%H:%M:%S")
-            }
-            return [TextContent(type="text", text=json.dumps(result, ensure_ascii=False))]
+            now = datetime.now().replace(microsecond=0)
+            text = _cached_text(name, now)
+            if text is None:
+                result = {
+                    "date": f"{now.year:04d}-{now.month:02d}-{now.day:02d}",
+                    "year": now.year,
+                    "month": now.month,
+                    "day": now.day,
+                    "weekday": _WEEKDAYS[now.weekday()],
+                    "time": f"{now.hour:02d}:{now.minute:02d}:{now.second:02d}"
+                }
+                text = json_utils.dumps(result)
+                _RESPONSE_CACHE[name] = (now, text)
+            return [_text_content(text)]
         
         else:
             raise ValueError(f"未知工具: {name}")
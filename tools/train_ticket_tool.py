@@ -1,32 +1,103 @@
 """12306 火车票查询工具"""
 
-from typing import Dict, Any, Optional
-import aiohttp
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional
 import os
+import re
 import asyncio
 from datetime import datetime, timedelta
 
-import sys
-from pathlib import Path
-
-# 确保可以导入项目模块
-project_root = Path(__file__).parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
-
+from tools.http_session import get_shared_session
+from tools.mcp_session import MCP_AVAILABLE, get_pool, parse_mcp_args
+from utils import json_utils
+from utils.cache import SingleFlight
+from utils.circuit import Breaker, CircuitOpenError
 from utils.logger import get_logger
+from utils.station_cache import get_station_code, set_station_code
 
 logger = get_logger(__name__)
 
-# 尝试导入 MCP SDK
-try:
-    from mcp import ClientSession, StdioServerParameters
-    from mcp.client.stdio import stdio_client
-    MCP_AVAILABLE = True
-except ImportError:
-    MCP_AVAILABLE = False
+if not MCP_AVAILABLE:
     logger.warning("MCP SDK 不可用，将使用其他方式")
 
+# 从内部代码中提取车次号（如从"240000G10336"提取"G103"）
+_TRAIN_NO_RE = re.compile(r'([GDKCTZ]\d+)')
+
+# 模拟车次模板（不含出发/到达站，调用时合并），模块加载时构建一次
+_MOCK_TRAIN_TEMPLATES = (
+    {
+        "train_no": "G123",
+        "train_type": "高速",
+        "departure_time": "08:00",
+        "arrival_time": "12:30",
+        "duration": "4小时30分",
+        "business_seat": {"available": True, "price": "¥1748"},
+        "first_class": {"available": True, "price": "¥924"},
+        "second_class": {"available": True, "price": "¥554"},
+        "hard_seat": {"available": False, "price": "¥128"}
+    },
+    {
+        "train_no": "D456",
+        "train_type": "动车",
+        "departure_time": "10:30",
+        "arrival_time": "15:45",
+        "duration": "5小时15分",
+        "business_seat": {"available": False, "price": "¥1280"},
+        "first_class": {"available": True, "price": "¥640"},
+        "second_class": {"available": True, "price": "¥384"},
+        "hard_seat": {"available": True, "price": "¥128"}
+    },
+    {
+        "train_no": "K789",
+        "train_type": "快速",
+        "departure_time": "14:20",
+        "arrival_time": "22:10",
+        "duration": "7小时50分",
+        "business_seat": {"available": False, "price": "N/A"},
+        "first_class": {"available": False, "price": "N/A"},
+        "second_class": {"available": True, "price": "¥224"},
+        "hard_seat": {"available": True, "price": "¥128"}
+    }
+)
+
+# 第三方 API 车次字段：座位字段缺省为 {}，其余字段缺省为 ""
+_TRAIN_FIELDS = (
+    "train_no", "train_type", "from_station", "to_station",
+    "departure_time", "arrival_time", "duration"
+)
+_SEAT_FIELDS = ("business_seat", "first_class", "second_class", "hard_seat")
+
+
+def _project_train(train: Dict[str, Any]) -> Dict[str, Any]:
+    """从第三方 API 的车次数据中提取统一字段"""
+    get = train.get
+    row = {key: get(key, "") for key in _TRAIN_FIELDS}
+    for key in _SEAT_FIELDS:
+        row[key] = get(key, {})
+    return row
+
+
+# 常用车站代码映射（只读，实际应该从 API 获取）
+_STATION_CODES = MappingProxyType({
+    "北京": "BJP",
+    "上海": "SHH",
+    "广州": "GZQ",
+    "深圳": "SZQ",
+    "杭州": "HZH",
+    "南京": "NJH",
+    "武汉": "WHN",
+    "成都": "CDW",
+    "重庆": "CQW",
+    "西安": "XAY"
+})
+
+
+@lru_cache(maxsize=4096)
+def _station_code_sync(station_name: str) -> str:
+    """查询内置的常用车站代码，未收录时返回空字符串"""
+    return _STATION_CODES.get(station_name, "")
+
 
 class TrainTicketTool:
     """12306 火车票查询工具"""
@@ -45,7 +116,7 @@ class TrainTicketTool:
         
         # 本地MCP服务配置（免费）
         self.mcp_command = os.getenv("TRAIN_TICKET_MCP_COMMAND", "npx")
-        self.mcp_args = os.getenv("TRAIN_TICKET_MCP_ARGS", "-y,12306-mcp").split(",")
+        self.mcp_args = list(parse_mcp_args(os.getenv("TRAIN_TICKET_MCP_ARGS", "-y,12306-mcp")))
         
         # YikeAPI 配置（付费）
         self.yikeapi_key = os.getenv("YIKEAPI_KEY", "")
@@ -61,6 +132,17 @@ class TrainTicketTool:
             self.service_type == "apiumi" and not self.apiumi_key or
             self.service_type == "yikeapi" and not self.yikeapi_key
         )
+        
+        # 各服务的熔断器：服务持续失败时直接跳过，立即回退到下一个服务
+        self._mcp_breaker = Breaker("12306 MCP")
+        self._yikeapi_breaker = Breaker("YikeAPI")
+        self._apiumi_breaker = Breaker("UniCloud API")
+        
+        # 同时查询所有已配置的服务并取最先成功的结果（会消耗各服务的额度，默认关闭）
+        self.race = os.getenv("TRAIN_TICKET_RACE", "0") == "1"
+        
+        # 进行中的查询：(出发站, 到达站, 日期) 相同的并发调用共享同一次请求
+        self._inflight = SingleFlight()
     
     async def query_trains(
         self,
@@ -79,7 +161,7 @@ class TrainTicketTool:
         Returns:
             车次信息列表
         """
-        logger.info(f"查询火车票: {from_station} -> {to_station}, 日期: {date}")
+        logger.info("查询火车票: {} -> {}, 日期: {}", from_station, to_station, date)
         
         if self.use_mock:
             return await self._mock_query_trains(from_station, to_station, date)
@@ -87,75 +169,142 @@ class TrainTicketTool:
         if not date:
             date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
         
+        # 相同行程的并发查询合并为一次请求
+        return await self._inflight.do(
+            (from_station, to_station, date),
+            lambda: self._query_trains_uncached(from_station, to_station, date)
+        )
+    
+    async def _query_trains_uncached(self, from_station: str, to_station: str, date: str) -> Dict[str, Any]:
+        """按配置的服务查询火车票（不合并请求），失败时回退到模拟数据"""
+        if self.race:
+            result = await self._race_backends(from_station, to_station, date)
+            if result:
+                return result
+            logger.info("所有在线服务都不可用，使用模拟数据")
+            return await self._mock_query_trains(from_station, to_station, date)
+        
         # 优先使用 MCP 服务（真正的 MCP 协议）
         if self.service_type == "mcp" and MCP_AVAILABLE and self.mcp_command:
             try:
-                result = await self._query_via_mcp(from_station, to_station, date)
+                result = await self._mcp_breaker.call(
+                    lambda: self._query_via_mcp(from_station, to_station, date)
+                )
                 if result.get("success"):
                     return result
+            except CircuitOpenError as e:
+                logger.warning("{}，尝试其他服务", e)
             except Exception as e:
-                logger.error(f"MCP服务调用失败: {e}，尝试其他服务", exc_info=True)
+                logger.error("MCP服务调用失败: {}，尝试其他服务", e, exc_info=True)
         
+        # 尝试使用 YikeAPI
+        if self.service_type == "yikeapi" and self.yikeapi_key:
+            try:
+                return await self._yikeapi_breaker.call(
+                    lambda: self._query_yikeapi(from_station, to_station, date)
+                )
+            except Exception as e:
+                logger.warning("YikeAPI调用失败: {}，尝试其他服务", e)
+        
+        # 尝试使用 UniCloud API
+        if self.service_type == "apiumi" and self.apiumi_key:
+            try:
+                return await self._apiumi_breaker.call(
+                    lambda: self._query_apiumi(from_station, to_station, date)
+                )
+            except Exception as e:
+                logger.warning("UniCloud API调用失败: {}，使用模拟数据", e)
+        
+        # 如果所有服务都失败，使用模拟数据
+        logger.info("所有在线服务都不可用，使用模拟数据")
+        return await self._mock_query_trains(from_station, to_station, date)
+    
+    async def _race_backends(self, from_station: str, to_station: str, date: str) -> Optional[Dict[str, Any]]:
+        """
+        同时查询所有已配置的服务，返回最先成功的结果并取消其余请求
+        
+        Returns:
+            最先成功的结果，全部失败时返回 None
+        """
+        backends = []
+        if self.service_type == "mcp" and MCP_AVAILABLE and self.mcp_command:
+            backends.append(("12306 MCP", self._mcp_breaker, self._query_via_mcp))
+        if self.yikeapi_key:
+            backends.append(("YikeAPI", self._yikeapi_breaker, self._query_yikeapi))
+        if self.apiumi_key:
+            backends.append(("UniCloud API", self._apiumi_breaker, self._query_apiumi))
+        
+        tasks = {
+            asyncio.create_task(breaker.call(lambda query=query: query(from_station, to_station, date))): name
+            for name, breaker, query in backends
+        }
+        pending = set(tasks)
         try:
-            async with aiohttp.ClientSession() as session:
-                # 尝试使用 YikeAPI
-                if self.service_type == "yikeapi" and self.yikeapi_key:
-                    try:
-                        url = f"{self.yikeapi_url}/query"
-                        params = {
-                            "key": self.yikeapi_key,
-                            "from": from_station,
-                            "to": to_station,
-                            "date": date
-                        }
-                        async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                            if response.status == 200:
-                                data = await response.json()
-                                if data.get("code") == 200 or data.get("success"):
-                                    trains = self._parse_yikeapi_data(data)
-                                    return {
-                                        "success": True,
-                                        "from_station": from_station,
-                                        "to_station": to_station,
-                                        "date": date,
-                                        "trains": trains,
-                                        "source": "YikeAPI"
-                                    }
-                    except Exception as e:
-                        logger.warning(f"YikeAPI调用失败: {e}，尝试其他服务")
-                
-                # 尝试使用 UniCloud API
-                if self.service_type == "apiumi" and self.apiumi_key:
-                    try:
-                        url = f"{self.apiumi_url}/query"
-                        headers = {"Authorization": f"Bearer {self.apiumi_key}"}
-                        payload = {
-                            "from": from_station,
-                            "to": to_station,
-                            "date": date
-                        }
-                        async with session.post(url, json=payload, headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                            if response.status == 200:
-                                data = await response.json()
-                                if data.get("code") == 200 or data.get("success"):
-                                    trains = self._parse_apiumi_data(data)
-                                    return {
-                                        "success": True,
-                                        "from_station": from_station,
-                                        "to_station": to_station,
-                                        "date": date,
-                                        "trains": trains,
-                                        "source": "UniCloud API"
-                                    }
-                    except Exception as e:
-                        logger.warning(f"UniCloud API调用失败: {e}，使用模拟数据")
-                
-                # 如果所有服务都失败，使用模拟数据
-                logger.info("所有在线服务都不可用，使用模拟数据")
-                return await self._mock_query_trains(from_station, to_station, date)
-        except Exception as e:
-            logger.error(f"MCP服务调用异常: {e}，使用模拟数据")
-            return await self._mock_query_trains(from_station, to_station, date)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        logger.warning("{}调用失败: {}", tasks[task], task.exception())
+                        continue
+                    result = task.result()
+                    if result.get("success"):
+                        return result
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def _query_yikeapi(self, from_station: str, to_station: str, date: str) -> Dict[str, Any]:
+        """查询 YikeAPI（付费）"""
+        session = await get_shared_session()
+        url = f"{self.yikeapi_url}/query"
+        params = {
+            "key": self.yikeapi_key,
+            "from": from_station,
+            "to": to_station,
+            "date": date
+        }
+        async with session.get(url, params=params) as response:
+            if response.status != 200:
+                raise Exception(f"YikeAPI返回错误: {response.status}")
+            data = await response.json(loads=json_utils.loads)
+        
+        if not (data.get("code") == 200 or data.get("success")):
+            raise Exception(f"YikeAPI返回错误: {data.get('code')}")
+        return {
+            "success": True,
+            "from_station": from_station,
+            "to_station": to_station,
+            "date": date,
+            "trains": self._parse_yikeapi_data(data),
+            "source": "YikeAPI"
+        }
+    
+    async def _query_apiumi(self, from_station: str, to_station: str, date: str) -> Dict[str, Any]:
+        """查询 UniCloud API（免费5次/天）"""
+        session = await get_shared_session()
+        url = f"{self.apiumi_url}/query"
+        headers = {"Authorization": f"Bearer {self.apiumi_key}"}
+        payload = {
+            "from": from_station,
+            "to": to_station,
+            "date": date
+        }
+        async with session.post(url, json=payload, headers=headers) as response:
+            if response.status != 200:
+                raise Exception(f"UniCloud API返回错误: {response.status}")
+            data = await response.json(loads=json_utils.loads)
+        
+        if not (data.get("code") == 200 or data.get("success")):
+            raise Exception(f"UniCloud API返回错误: {data.get('code')}")
+        return {
+            "success": True,
+            "from_station": from_station,
+            "to_station": to_station,
+            "date": date,
+            "trains": self._parse_apiumi_data(data),
+            "source": "UniCloud API"
+        }
     
     async def _mock_query_trains(
         self,
@@ -169,45 +318,8 @@ class TrainTicketTool:
         
         # 模拟车次数据
         mock_trains = [
-            {
-                "train_no": "G123",
-                "train_type": "高速",
-                "from_station": from_station,
-                "to_station": to_station,
-                "departure_time": "08:00",
-                "arrival_time": "12:30",
-                "duration": "4小时30分",
-                "business_seat": {"available": True, "price": "¥1748"},
-                "first_class": {"available": True, "price": "¥924"},
-                "second_class": {"available": True, "price": "¥554"},
-                "hard_seat": {"available": False, "price": "¥128"}
-            },
-            {
-                "train_no": "D456",
-                "train_type": "动车",
-                "from_station": from_station,
-                "to_station": to_station,
-                "departure_time": "10:30",
-                "arrival_time": "15:45",
-                "duration": "5小时15分",
-                "business_seat": {"available": False, "price": "¥1280"},
-                "first_class": {"available": True, "price": "¥640"},
-                "second_class": {"available": True, "price": "¥384"},
-                "hard_seat": {"available": True, "price": "¥128"}
-            },
-            {
-                "train_no": "K789",
-                "train_type": "快速",
-                "from_station": from_station,
-                "to_station": to_station,
-                "departure_time": "14:20",
-                "arrival_time": "22:10",
-                "duration": "7小时50分",
-                "business_seat": {"available": False, "price": "N/A"},
-                "first_class": {"available": False, "price": "N/A"},
-                "second_class": {"available": True, "price": "¥224"},
-                "hard_seat": {"available": True, "price": "¥128"}
-            }
+            {**train, "from_station": from_station, "to_station": to_station}
+            for train in _MOCK_TRAIN_TEMPLATES
         ]
         
         return {
@@ -221,46 +333,14 @@ class TrainTicketTool:
     
     def _parse_yikeapi_data(self, data: Dict[str, Any]) -> list:
         """解析 YikeAPI 返回的数据"""
-        trains = []
         result = data.get("data", {})
         train_list = result.get("trains", []) if isinstance(result, dict) else []
-        
-        for train in train_list:
-            trains.append({
-                "train_no": train.get("train_no", ""),
-                "train_type": train.get("train_type", ""),
-                "from_station": train.get("from_station", ""),
-                "to_station": train.get("to_station", ""),
-                "departure_time": train.get("departure_time", ""),
-                "arrival_time": train.get("arrival_time", ""),
-                "duration": train.get("duration", ""),
-                "business_seat": train.get("business_seat", {}),
-                "first_class": train.get("first_class", {}),
-                "second_class": train.get("second_class", {}),
-                "hard_seat": train.get("hard_seat", {})
-            })
-        return trains
+        return [_project_train(train) for train in train_list]
     
     def _parse_apiumi_data(self, data: Dict[str, Any]) -> list:
         """解析 UniCloud API 返回的数据"""
-        trains = []
         train_list = data.get("data", {}).get("trains", []) if isinstance(data.get("data"), dict) else []
-        
-        for train in train_list:
-            trains.append({
-                "train_no": train.get("train_no", ""),
-                "train_type": train.get("train_type", ""),
-                "from_station": train.get("from_station", ""),
-                "to_station": train.get("to_station", ""),
-                "departure_time": train.get("departure_time", ""),
-                "arrival_time": train.get("arrival_time", ""),
-                "duration": train.get("duration", ""),
-                "business_seat": train.get("business_seat", {}),
-                "first_class": train.get("first_class", {}),
-                "second_class": train.get("second_class", {}),
-                "hard_seat": train.get("hard_seat", {})
-            })
-        return trains
+        return [_project_train(train) for train in train_list]
     
     async def _query_via_mcp(
         self,
@@ -283,187 +363,210 @@ class TrainTicketTool:
             raise Exception("MCP SDK 不可用")
         
         try:
-            # 配置 MCP 服务器参数（stdio 方式）
-            server_params = StdioServerParameters(
-                command=self.mcp_command,
-                args=self.mcp_args
-            )
+            # 获取缓存的 MCP 会话池（12306-mcp 子进程只启动一次，后续查询复用会话）
+            pool = await get_pool(self.mcp_command, self.mcp_args)
             
-            # 连接到 MCP 服务器
-            # stdio_client 是一个异步上下文管理器
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    # 初始化会话
-                    await session.initialize()
-                    
-                    # 列出可用工具
-                    tools = await session.list_tools()
-                    logger.info(f"MCP 可用工具: {[tool.name for tool in tools.tools]}")
-                    
-                    # 查找查询余票的工具（get-tickets）
-                    query_tool = None
-                    for tool in tools.tools:
-                        if tool.name == "get-tickets":
-                            query_tool = tool
-                            break
-                    
-                    if not query_tool:
-                        raise Exception("未找到 get-tickets 工具")
-                    
-                    # 先获取车站代码（12306 需要车站代码）
-                    from_code = from_station
-                    to_code = to_station
-                    
-                    # 查找车站代码查询工具并查看参数定义
-                    station_code_tool = None
-                    for tool in tools.tools:
-                        if tool.name == "get-station-code-by-names":
-                            station_code_tool = tool
-                            logger.info(f"get-station-code-by-names 工具定义: {tool.inputSchema if hasattr(tool, 'inputSchema') else 'N/A'}")
-                            break
-                    
-                    # 查看 get-tickets 的参数定义
-                    logger.info(f"get-tickets 工具定义: {query_tool.inputSchema if hasattr(query_tool, 'inputSchema') else 'N/A'}")
-                    
-                    # 如果找到了车站代码查询工具，先查询车站代码
-                    if station_code_tool:
-                        try:
-                            logger.info(f"查询出发站代码: {from_station}")
-                            # 根据工具定义，参数是 stationNames (字符串)
-                            from_result = await session.call_tool(
-                                "get-station-code-by-names",
-                                arguments={"stationNames": from_station}
-                            )
-                            
-                            if from_result.content and len(from_result.content) > 0:
-                                import json
-                                from_text = from_result.content[0].text if hasattr(from_result.content[0], 'text') else str(from_result.content[0])
-                                logger.info(f"出发站代码查询结果: {from_text[:200]}")  # 打印前200字符用于调试
-                                if from_text.strip():
-                                    from_data = json.loads(from_text)
-                                    # 提取车站代码（根据实际返回格式：{"北京":{"station_code":"BJP",...}}）
-                                    if isinstance(from_data, dict):
-                                        # 返回格式是 {城市名: {station_code: "xxx", ...}}
-                                        # 取第一个值（车站信息）
-                                        station_info = list(from_data.values())[0] if from_data else {}
-                                        from_code = station_info.get("station_code") or station_info.get("code") or station_info.get("telecode", from_station)
-                                        logger.info(f"出发站代码: {from_code}")
-                                    elif isinstance(from_data, list) and len(from_data) > 0:
-                                        from_code = from_data[0].get("station_code") or from_data[0].get("code") or from_data[0].get("telecode", from_station)
-                                        logger.info(f"出发站代码: {from_code}")
-                            
-                            logger.info(f"查询到达站代码: {to_station}")
-                            # 根据工具定义，参数是 stationNames (字符串)
-                            to_result = await session.call_tool(
-                                "get-station-code-by-names",
-                                arguments={"stationNames": to_station}
-                            )
-                            
-                            if to_result.content and len(to_result.content) > 0:
-                                import json
-                                to_text = to_result.content[0].text if hasattr(to_result.content[0], 'text') else str(to_result.content[0])
-                                logger.info(f"到达站代码查询结果: {to_text[:200]}")  # 打印前200字符用于调试
-                                if to_text.strip():
-                                    to_data = json.loads(to_text)
-                                    # 提取车站代码（根据实际返回格式：{"上海":{"station_code":"SHH",...}}）
-                                    if isinstance(to_data, dict):
-                                        # 返回格式是 {城市名: {station_code: "xxx", ...}}
-                                        # 取第一个值（车站信息）
-                                        station_info = list(to_data.values())[0] if to_data else {}
-                                        to_code = station_info.get("station_code") or station_info.get("code") or station_info.get("telecode", to_station)
-                                        logger.info(f"到达站代码: {to_code}")
-                                    elif isinstance(to_data, list) and len(to_data) > 0:
-                                        to_code = to_data[0].get("station_code") or to_data[0].get("code") or to_data[0].get("telecode", to_station)
-                                        logger.info(f"到达站代码: {to_code}")
-                        except Exception as e:
-                            logger.warning(f"获取车站代码失败: {e}，尝试使用原始名称", exc_info=True)
-                    
-                    # 使用车站代码调用 get-tickets 工具查询火车票
-                    # 根据工具定义，参数是 fromStation, toStation, date
-                    logger.info(f"调用 get-tickets: fromStation={from_code}, toStation={to_code}, date={date}")
-                    result = await session.call_tool(
-                        "get-tickets",
-                        arguments={
-                            "fromStation": from_code,
-                            "toStation": to_code,
-                            "date": date,
-                            "format": "json"  # 使用 JSON 格式便于解析
-                        }
-                    )
-                    
-                    # 解析结果
-                    if result.content:
-                        # MCP 返回的内容可能是文本或结构化数据
-                        content = result.content[0] if result.content else {}
-                        if hasattr(content, 'text'):
-                            import json
-                            result_text = content.text
-                            logger.info(f"get-tickets 返回结果: {result_text[:500]}")  # 打印前500字符用于调试
-                            try:
-                                data = json.loads(result_text)
-                            except:
-                                # 如果不是 JSON，尝试其他格式
-                                logger.warning(f"JSON 解析失败，原始内容: {result_text[:200]}")
-                                data = {"raw": result_text, "trains": []}
-                        else:
-                            data = content
-                        
-                        # 提取车次数据（可能在不同字段中）
-                        trains = []
-                        if isinstance(data, dict):
-                            trains = data.get("trains", data.get("data", data.get("result", [])))
-                        elif isinstance(data, list):
-                            trains = data
-                        
-                        logger.info(f"解析到 {len(trains)} 个车次")
+            # 查找查询余票的工具（get-tickets）
+            query_tool = pool.tools_by_name.get("get-tickets")
+            if not query_tool:
+                raise Exception("未找到 get-tickets 工具")
+            
+            # 先获取车站代码（12306 需要车站代码），优先使用缓存
+            from_code = await get_station_code(from_station)
+            to_code = await get_station_code(to_station)
+            
+            # 查找车站代码查询工具并查看参数定义
+            station_code_tool = pool.tools_by_name.get("get-station-code-by-names")
+            if station_code_tool:
+                logger.debug("get-station-code-by-names 工具定义: {}", getattr(station_code_tool, "inputSchema", "N/A"))
+            
+            # 查看 get-tickets 的参数定义
+            logger.debug("get-tickets 工具定义: {}", getattr(query_tool, "inputSchema", "N/A"))
+            
+            async with pool.acquire() as session:
+                # 如果找到了车站代码查询工具，只查询缓存中缺失的车站代码（一次调用）
+                missing = [name for name, code in ((from_station, from_code), (to_station, to_code)) if not code]
+                if station_code_tool and missing:
+                    try:
+                        logger.info("查询车站代码: {}", missing)
+                        codes = await self._resolve_station_codes(session, station_code_tool, missing)
+                        from_code = from_code or codes.get(from_station)
+                        to_code = to_code or codes.get(to_station)
+                        logger.info("车站代码: {}={}, {}={}", from_station, from_code, to_station, to_code)
+                    except Exception as e:
+                        logger.warning("获取车站代码失败: {}，尝试使用原始名称", e, exc_info=True)
+                from_code = from_code or from_station
+                to_code = to_code or to_station
+                
+                # 使用车站代码调用 get-tickets 工具查询火车票
+                # 根据工具定义，参数是 fromStation, toStation, date
+                logger.info("调用 get-tickets: fromStation={}, toStation={}, date={}", from_code, to_code, date)
+                result = await session.call_tool(
+                    "get-tickets",
+                    arguments={
+                        "fromStation": from_code,
+                        "toStation": to_code,
+                        "date": date,
+                        "format": "json"  # 使用 JSON 格式便于解析
+                    }
+                )
+            
+            # 解析结果
+            if result.content:
+                # MCP 返回的内容可能是文本或结构化数据
+                content = result.content[0] if result.content else {}
+                if hasattr(content, 'text'):
+                    result_text = content.text
+                    logger.opt(lazy=True).debug("get-tickets 返回结果: {}", lambda: result_text[:500])  # 打印前500字符用于调试
+                    try:
+                        data = json_utils.loads(result_text)
+                    except json_utils.JSONDecodeError:
+                        # 如果不是 JSON，尝试其他格式
+                        logger.opt(lazy=True).debug("JSON 解析失败，原始内容: {}", lambda: result_text[:200])
+                        data = {"raw": result_text, "trains": []}
+                else:
+                    data = content
+                
+                # 提取车次数据（可能在不同字段中）
+                trains = []
+                if isinstance(data, dict):
+                    trains = data.get("trains", data.get("data", data.get("result", [])))
+                elif isinstance(data, list):
+                    trains = data
+                
+                logger.info("解析到 {} 个车次", len(trains))
+                
+                # 规范化车次数据格式
+                normalized_trains = []
+                for train in trains:
+                    if isinstance(train, dict):
+                        # 提取车次号（可能在不同字段中）
+                        train_no = train.get("train_no") or train.get("trainNo") or train.get("trainNumber") or train.get("station_train_code", "")
                         
-                        # 规范化车次数据格式
-                        normalized_trains = []
-                        for train in trains:
-                            if isinstance(train, dict):
-                                # 提取车次号（可能在不同字段中）
-                                train_no = train.get("train_no") or train.get("trainNo") or train.get("trainNumber") or train.get("station_train_code", "")
-                                
-                                # 如果train_no是内部代码（如"240000G10336"），尝试提取车次号
-                                # 车次号通常是G、D、K、C、Z、T等字母开头的格式
-                                import re
-                                if train_no and len(train_no) > 6:
-                                    # 尝试从内部代码中提取车次号（如从"240000G10336"提取"G103"）
-                                    match = re.search(r'([GDKCTZ]\d+)', train_no)
-                                    if match:
-                                        train_no = match.group(1)
-                                
-                                # 提取其他字段
-                                normalized_train = {
-                                    "train_no": train_no or "未知",
-                                    "train_type": train.get("train_type") or train.get("trainType") or self._get_train_type(train_no),
-                                    "from_station": train.get("from_station") or train.get("fromStation") or train.get("start_station_name", ""),
-                                    "to_station": train.get("to_station") or train.get("toStation") or train.get("end_station_name", ""),
-                                    "departure_time": train.get("departure_time") or train.get("departureTime") or train.get("start_time", ""),
-                                    "arrival_time": train.get("arrival_time") or train.get("arrivalTime") or train.get("arrive_time", ""),
-                                    "duration": train.get("duration") or train.get("lishi", ""),
-                                    "business_seat": train.get("business_seat") or train.get("swz_num", {}),
-                                    "first_class": train.get("first_class") or train.get("zy_num", {}),
-                                    "second_class": train.get("second_class") or train.get("ze_num", {}),
-                                    "hard_seat": train.get("hard_seat") or train.get("yz_num", {})
-                                }
-                                normalized_trains.append(normalized_train)
+                        # 如果train_no是内部代码（如"240000G10336"），尝试提取车次号
+                        # 车次号通常是G、D、K、C、Z、T等字母开头的格式
+                        if train_no and len(train_no) > 6:
+                            # 尝试从内部代码中提取车次号（如从"240000G10336"提取"G103"）
+                            match = _TRAIN_NO_RE.search(train_no)
+                            if match:
+                                train_no = match.group(1)
                         
-                        return {
-                            "success": True,
-                            "from_station": from_station,
-                            "to_station": to_station,
-                            "date": date,
-                            "trains": normalized_trains,
-                            "source": "12306 MCP (真实MCP服务)"
+                        # 提取其他字段
+                        normalized_train = {
+                            "train_no": train_no or "未知",
+                            "train_type": train.get("train_type") or train.get("trainType") or self._get_train_type(train_no),
+                            "from_station": train.get("from_station") or train.get("fromStation") or train.get("start_station_name", ""),
+                            "to_station": train.get("to_station") or train.get("toStation") or train.get("end_station_name", ""),
+                            "departure_time": train.get("departure_time") or train.get("departureTime") or train.get("start_time", ""),
+                            "arrival_time": train.get("arrival_time") or train.get("arrivalTime") or train.get("arrive_time", ""),
+                            "duration": train.get("duration") or train.get("lishi", ""),
+                            "business_seat": train.get("business_seat") or train.get("swz_num", {}),
+                            "first_class": train.get("first_class") or train.get("zy_num", {}),
+                            "second_class": train.get("second_class") or train.get("ze_num", {}),
+                            "hard_seat": train.get("hard_seat") or train.get("yz_num", {})
                         }
-                    else:
-                        raise Exception("MCP 服务返回空结果")
-                        
+                        normalized_trains.append(normalized_train)
+                
+                return {
+                    "success": True,
+                    "from_station": from_station,
+                    "to_station": to_station,
+                    "date": date,
+                    "trains": normalized_trains,
+                    "source": "12306 MCP (真实MCP服务)"
+                }
+            else:
+                raise Exception("MCP 服务返回空结果")
+                
         except Exception as e:
-            logger.error(f"MCP 查询失败: {e}")
+            logger.error("MCP 查询失败: {}", e)
             raise
     
+    @staticmethod
+    def _accepts_multiple_names(station_code_tool: Any) -> bool:
+        """根据工具参数定义判断 stationNames 是否支持用 | 分隔多个车站"""
+        schema = getattr(station_code_tool, "inputSchema", None) or getattr(station_code_tool, "input_schema", None) or {}
+        prop = schema.get("properties", {}).get("stationNames", {})
+        return "|" in prop.get("description", "")
+    
+    @staticmethod
+    def _extract_station_code(station_info: Any) -> Optional[str]:
+        """从单个车站信息中提取车站代码"""
+        if not isinstance(station_info, dict):
+            return None
+        return station_info.get("station_code") or station_info.get("code") or station_info.get("telecode")
+    
+    async def _call_station_code_tool(self, session: "ClientSession", station_names: str) -> Any:
+        """调用 get-station-code-by-names 并解析返回的 JSON，无内容时返回 None"""
+        # 根据工具定义，参数是 stationNames (字符串)
+        result = await session.call_tool(
+            "get-station-code-by-names",
+            arguments={"stationNames": station_names}
+        )
+        if not result.content:
+            return None
+        
+        text = result.content[0].text if hasattr(result.content[0], 'text') else str(result.content[0])
+        logger.opt(lazy=True).debug("车站代码查询结果: {}", lambda: text[:200])  # 打印前200字符用于调试
+        if not text.strip():
+            return None
+        return json_utils.loads(text)
+    
+    async def _resolve_station_codes(
+        self,
+        session: "ClientSession",
+        station_code_tool: Any,
+        station_names: List[str]
+    ) -> Dict[str, str]:
+        """
+        通过 MCP 服务解析车站代码，成功后写入车站代码缓存
+        
+        工具支持多车站输入时合并为一次调用，否则并发逐个查询。
+        
+        Args:
+            session: 已初始化的 MCP 会话
+            station_code_tool: get-station-code-by-names 工具定义
+            station_names: 车站名称列表
+            
+        Returns:
+            车站名称到车站代码的映射（只包含解析成功的车站）
+        """
+        codes: Dict[str, str] = {}
+        if len(station_names) > 1 and self._accepts_multiple_names(station_code_tool):
+            # 返回格式是 {车站名: {station_code: "xxx", ...}, ...}
+            data = await self._call_station_code_tool(session, "|".join(station_names))
+            if isinstance(data, dict):
+                # 按车站名匹配；返回的键都不是输入名称时按顺序对应
+                if not any(name in data for name in station_names):
+                    data = dict(zip(station_names, data.values()))
+            elif isinstance(data, list):
+                data = dict(zip(station_names, data))
+            else:
+                data = {}
+            for name in station_names:
+                code = self._extract_station_code(data.get(name))
+                if code:
+                    codes[name] = code
+        else:
+            results = await asyncio.gather(
+                *(self._call_station_code_tool(session, name) for name in station_names)
+            )
+            for name, data in zip(station_names, results):
+                # 提取车站代码（根据实际返回格式：{"北京":{"station_code":"BJP",...}}）
+                if isinstance(data, dict):
+                    station_info = next(iter(data.values()), None)
+                elif isinstance(data, list) and data:
+                    station_info = data[0]
+                else:
+                    station_info = None
+                code = self._extract_station_code(station_info)
+                if code:
+                    codes[name] = code
+        
+        for name, code in codes.items():
+            await set_station_code(name, code)
+        return codes
+    
     def _get_train_type(self, train_no: str) -> str:
         """根据车次号判断列车类型"""
         if not train_no:
@@ -493,23 +596,9 @@ class TrainTicketTool:
         Returns:
             车站代码信息
         """
-        logger.info(f"查询车站代码: {station_name}")
-        
-        # 常用车站代码映射（实际应该从 API 获取）
-        station_codes = {
-            "北京": "BJP",
-            "上海": "SHH",
-            "广州": "GZQ",
-            "深圳": "SZQ",
-            "杭州": "HZH",
-            "南京": "NJH",
-            "武汉": "WHN",
-            "成都": "CDW",
-            "重庆": "CQW",
-            "西安": "XAY"
-        }
-        
-        code = station_codes.get(station_name, "")
+        # 常用车站直接查内置映射，其余车站使用 MCP 解析后缓存的代码
+        code = _station_code_sync(station_name) or await get_station_code(station_name) or ""
+        logger.debug("查询车站代码: {} -> {}", station_name, code)
         return {
             "success": True,
             "station_name": station_name,
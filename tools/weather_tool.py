@@ -1,22 +1,161 @@
 """天气查询工具 - 使用免费的天气API"""
 
-from typing import Dict, Any, Optional
-import aiohttp
+from types import MappingProxyType
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
+import asyncio
 import os
 from datetime import datetime
+from urllib.parse import urlsplit
 
-import sys
-from pathlib import Path
-
-# 确保可以导入项目模块
-project_root = Path(__file__).parent.parent
-if str(project_root) not in sys.path:
-    sys.path.insert(0, str(project_root))
-
+from tools.http_session import HTTPX_AVAILABLE, get_shared_httpx_session, get_shared_session
+from utils.cache import SingleFlight, TTLCache
+from utils.circuit import Breaker
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 天气结果缓存时间（秒），同一城市 10 分钟内的重复查询不再请求 API（节省免费额度）
+_CACHE_TTL = 600
+
+# 和风天气城市 -> location_id 映射缓存时间（秒），城市 ID 基本不变
+_LOCATION_TTL = 30 * 86400
+
+# 天气服务健康检查结果的有效期（秒）
+_HEALTH_TTL = 300
+
+class WeatherRequestError(Exception):
+    """请求本身有误（如城市不存在、4xx 响应），服务仍然可用，不计入熔断器失败次数"""
+
+
+def _request_error_status(status: int) -> bool:
+    """是否为请求本身有误的状态码（429 限流说明服务端需要退避，仍计入熔断）"""
+    return 400 <= status < 500 and status != 429
+
+
+# 尝试导入 aiomultiprocess（可选依赖，用于大批量天气查询）
+try:
+    import aiomultiprocess
+    AIOMULTIPROCESS_AVAILABLE = True
+except ImportError:
+    AIOMULTIPROCESS_AVAILABLE = False
+
+# 模拟天气数据（只读，模块加载时构建一次）
+_MOCK_WEATHER = MappingProxyType({
+    "北京": {
+        "temperature": 15,
+        "feels_like": 14,
+        "humidity": 45,
+        "pressure": 1013,
+        "description": "晴朗",
+        "main": "Clear",
+        "wind_speed": 3.5,
+        "wind_degree": 180,
+        "visibility": 10
+    },
+    "上海": {
+        "temperature": 18,
+        "feels_like": 17,
+        "humidity": 60,
+        "pressure": 1015,
+        "description": "多云",
+        "main": "Clouds",
+        "wind_speed": 4.2,
+        "wind_degree": 135,
+        "visibility": 8
+    },
+    "广州": {
+        "temperature": 25,
+        "feels_like": 26,
+        "humidity": 70,
+        "pressure": 1010,
+        "description": "小雨",
+        "main": "Rain",
+        "wind_speed": 2.8,
+        "wind_degree": 90,
+        "visibility": 6
+    }
+})
+
+# 未收录城市的模拟天气
+_MOCK_WEATHER_DEFAULT = MappingProxyType({
+    "temperature": 20,
+    "feels_like": 19,
+    "humidity": 50,
+    "pressure": 1012,
+    "description": "晴朗",
+    "main": "Clear",
+    "wind_speed": 3.0,
+    "wind_degree": 180,
+    "visibility": 10
+})
+
+
+class _BatchDispatcher:
+    """天气查询微批处理：收集一个时间窗口内的查询，窗口结束后统一并发发出"""
+    
+    def __init__(self, window: float, handler: Callable[..., Awaitable[Dict[str, Any]]]):
+        """
+        初始化批处理器
+        
+        Args:
+            window: 收集窗口（秒）
+            handler: 实际执行单个查询的协程函数
+        """
+        self.window = window
+        self.handler = handler
+        self._pending: List[Tuple[tuple, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+    
+    async def submit(self, *args) -> Dict[str, Any]:
+        """提交一个查询并等待结果"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((args, future))
+        # 上一个批次任务已结束（包括被取消）或属于已更换的事件循环时，重新调度
+        if self._flush_task is None or self._flush_task.done() or self._flush_task.get_loop() is not loop:
+            self._flush_task = loop.create_task(self._flush())
+            self._flush_task.add_done_callback(self._flush_cancelled)
+        return await future
+    
+    def _flush_cancelled(self, task: asyncio.Task):
+        """批次任务在开始执行前就被取消时，_flush 中的清理不会运行，在这里取消本批等待者"""
+        if not task.cancelled() or self._flush_task is not task:
+            return
+        pending, self._pending = self._pending, []
+        self._flush_task = None
+        for _, future in pending:
+            future.cancel()
+    
+    async def _flush(self):
+        """等待窗口结束后并发执行本批查询"""
+        pending: List[Tuple[tuple, asyncio.Future]] = []
+        try:
+            try:
+                await asyncio.sleep(self.window)
+            finally:
+                # 被取消时也要取走本批查询并清除任务，之后提交的查询会重新调度
+                pending, self._pending = self._pending, []
+                self._flush_task = None
+            
+            results = await asyncio.gather(
+                *(self.handler(*args) for args, _ in pending),
+                return_exceptions=True
+            )
+        except asyncio.CancelledError:
+            # 批次任务被取消，通知等待中的调用方，避免其一直挂起
+            for _, future in pending:
+                future.cancel()
+            raise
+        
+        for (_, future), result in zip(pending, results):
+            if future.done():
+                # 调用方已取消
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
 
 class WeatherTool:
     """天气查询工具 - 支持多个免费天气API"""
@@ -38,6 +177,40 @@ class WeatherTool:
         
         # 如果没有配置任何API Key，使用模拟数据
         self.use_mock = not self.openweather_key and not self.qweather_key
+        
+        # HTTP 客户端：aiohttp（默认）或 httpx（安装 h2 后使用 HTTP/2，多个请求复用同一连接）
+        self.http_client = os.getenv("WEATHER_HTTP_CLIENT", "aiohttp").lower()
+        if self.http_client == "httpx" and not HTTPX_AVAILABLE:
+            logger.warning("httpx 未安装，天气查询使用 aiohttp")
+            self.http_client = "aiohttp"
+        
+        # 查询结果缓存：(service_type, city, country) -> 天气信息；并发未命中时合并为一次请求
+        self._cache = TTLCache(maxsize=512, ttl=_CACHE_TTL)
+        self._inflight = SingleFlight()
+        
+        # 和风天气位置缓存：城市名 -> (location_id, 城市名)
+        self._qweather_loc_cache = TTLCache(maxsize=1024, ttl=_LOCATION_TTL)
+        
+        # 各服务的熔断器：服务持续失败时直接跳过，立即回退到下一个服务
+        self._qweather_breaker = Breaker("和风天气", ignore=(WeatherRequestError,))
+        self._openweather_breaker = Breaker("OpenWeatherMap", ignore=(WeatherRequestError,))
+        
+        # 微批处理窗口（毫秒），为 0 时不启用；批量查询多个城市时可设为 50~100
+        batch_window_ms = int(os.getenv("WEATHER_BATCH_WINDOW_MS", "0"))
+        self._batcher = _BatchDispatcher(batch_window_ms / 1000, self._query_weather_uncached) if batch_window_ms > 0 else None
+        
+        # 服务健康检查（可选）：启用后每 5 分钟检查一次各服务是否可达，查询时跳过不可达的服务
+        self.health_check = os.getenv("WEATHER_HEALTH_CHECK", "0") == "1"
+        self._health = TTLCache(maxsize=1, ttl=_HEALTH_TTL)
+        
+        # 批量查询的城市数超过该值时使用多进程（需要安装 aiomultiprocess）
+        self.multiprocess_threshold = int(os.getenv("WEATHER_MULTIPROCESS_THRESHOLD", "64"))
+    
+    async def _get_http_session(self):
+        """获取共享的 HTTP 会话（按配置选择 aiohttp 或 httpx）"""
+        if self.http_client == "httpx":
+            return await get_shared_httpx_session()
+        return await get_shared_session()
     
     async def query_weather(
         self,
@@ -54,181 +227,247 @@ class WeatherTool:
         Returns:
             天气信息
         """
-        logger.info(f"查询天气: {city}, 国家: {country}")
+        logger.info("查询天气: {}, 国家: {}", city, country)
         
         if self.use_mock:
             return await self._mock_query_weather(city, country)
         
+        key = (self.service_type, city, country)
+        cached = self._cache.get(key)
+        if cached is not None:
+            logger.debug("天气缓存命中: {}", city)
+            return cached
+        
+        fetch = self._batcher.submit if self._batcher else self._query_weather_uncached
+        result = await self._inflight.do(key, lambda: fetch(city, country))
+        # 模拟数据是 API 失败时的回退结果，不缓存
+        if "note" not in result:
+            self._cache.set(key, result)
+        return result
+    
+    async def query_many(self, cities: List[str]) -> List[Dict[str, Any]]:
+        """
+        批量查询多个城市的天气
+        
+        缓存命中的城市直接返回；其余城市在当前事件循环中并发查询，数量超过
+        WEATHER_MULTIPROCESS_THRESHOLD 且安装了 aiomultiprocess 时分发到多个子进程。
+        
+        Args:
+            cities: 城市名称列表
+            
+        Returns:
+            与 cities 顺序一致的天气信息列表
+        """
+        if self.use_mock or len(cities) <= self.multiprocess_threshold or not AIOMULTIPROCESS_AVAILABLE:
+            return list(await asyncio.gather(*(self.query_weather(city) for city in cities)))
+        
+        results: List[Optional[Dict[str, Any]]] = [self._cache.get((self.service_type, city, None)) for city in cities]
+        missing = list(dict.fromkeys(city for city, result in zip(cities, results) if result is None))
+        logger.info("天气批量查询: {} 个城市，{} 个未命中缓存，使用多进程查询", len(cities), len(missing))
+        
+        async with aiomultiprocess.Pool(processes=os.cpu_count()) as pool:
+            fetched = dict(zip(missing, await pool.map(_query_one_standalone, missing)))
+        
+        for city, result in fetched.items():
+            if "note" not in result:
+                self._cache.set((self.service_type, city, None), result)
+        return [result if result is not None else fetched[city] for city, result in zip(cities, results)]
+    
+    async def _query_weather_uncached(
+        self,
+        city: str,
+        country: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """按配置的服务查询天气（不经过缓存），失败时回退到模拟数据"""
+        # 健康检查未通过的服务直接跳过（未启用健康检查时全部视为可用）
+        health = await self._provider_health()
+        
         # 优先使用和风天气（免费额度更高）
         if self.service_type == "qweather" and self.qweather_key:
-            try:
-                return await self._query_qweather(city)
-            except Exception as e:
-                logger.warning(f"和风天气API调用失败: {e}，尝试OpenWeatherMap")
-                if self.openweather_key:
-                    try:
-                        return await self._query_openweather(city, country)
-                    except Exception as e2:
-                        logger.warning(f"OpenWeatherMap也失败: {e2}，使用模拟数据")
-                        return await self._mock_query_weather(city, country)
-                else:
-                    return await self._mock_query_weather(city, country)
+            if health.get("qweather", True):
+                try:
+                    return await self._qweather_breaker.call(lambda: self._query_qweather(city))
+                except Exception as e:
+                    logger.warning("和风天气API调用失败: {}，尝试OpenWeatherMap", e)
+            if self.openweather_key and health.get("openweather", True):
+                try:
+                    return await self._openweather_breaker.call(lambda: self._query_openweather(city, country))
+                except Exception as e2:
+                    logger.warning("OpenWeatherMap也失败: {}，使用模拟数据", e2)
+            return await self._mock_query_weather(city, country)
         
         # 使用 OpenWeatherMap
-        if self.service_type == "openweather" and self.openweather_key:
+        if self.service_type == "openweather" and self.openweather_key and health.get("openweather", True):
             try:
-                return await self._query_openweather(city, country)
+                return await self._openweather_breaker.call(lambda: self._query_openweather(city, country))
             except Exception as e:
-                logger.warning(f"OpenWeatherMap调用失败: {e}，使用模拟数据")
+                logger.warning("OpenWeatherMap调用失败: {}，使用模拟数据", e)
                 return await self._mock_query_weather(city, country)
         
         # 默认使用模拟数据
         return await self._mock_query_weather(city, country)
     
+    async def _provider_health(self) -> Dict[str, bool]:
+        """获取各服务的健康状态，结果缓存 5 分钟，过期后重新检查（服务恢复后自动启用）"""
+        if not self.health_check:
+            return {}
+        
+        health = self._health.get("providers")
+        if health is None:
+            health = await self._inflight.do("health", self._probe_providers)
+            self._health.set("providers", health)
+        return health
+    
+    async def _probe_providers(self) -> Dict[str, bool]:
+        """并发检查已配置的天气服务是否可达"""
+        session = await self._get_http_session()
+        probes = {}
+        if self.qweather_key:
+            probes["qweather"] = self._probe(session, self.qweather_url)
+        if self.openweather_key:
+            probes["openweather"] = self._probe(session, self.openweather_url)
+        
+        results = await asyncio.gather(*probes.values())
+        health = dict(zip(probes, results))
+        logger.info("天气服务健康检查: {}", health)
+        return health
+    
+    @staticmethod
+    async def _probe(session, url: str) -> bool:
+        """请求服务根地址（不带 API Key，不消耗额度），能连通且无 5xx 即视为可用"""
+        parts = urlsplit(url)
+        try:
+            async with session.get(f"{parts.scheme}://{parts.netloc}/") as response:
+                return response.status < 500
+        except Exception:
+            return False
+    
     async def _query_openweather(self, city: str, country: Optional[str] = None) -> Dict[str, Any]:
         """查询 OpenWeatherMap API"""
-        async with aiohttp.ClientSession() as session:
-            # 构建查询参数
-            q = f"{city},{country}" if country else city
-            url = f"{self.openweather_url}/weather"
-            params = {
-                "q": q,
-                "appid": self.openweather_key,
-                "units": "metric",  # 使用摄氏度
-                "lang": "zh_cn"  # 中文
-            }
+        session = await self._get_http_session()
+        
+        # 构建查询参数
+        q = f"{city},{country}" if country else city
+        url = f"{self.openweather_url}/weather"
+        params = {
+            "q": q,
+            "appid": self.openweather_key,
+            "units": "metric",  # 使用摄氏度
+            "lang": "zh_cn"  # 中文
+        }
+        
+        async with session.get(url, params=params) as response:
+            if response.status == 200:
+                data = await response.json()
+                weather = data.get("weather", [{}])[0]
+                main = data.get("main", {})
+                wind = data.get("wind", {})
+                
+                return {
+                    "success": True,
+                    "city": data.get("name", city),
+                    "country": data.get("sys", {}).get("country", ""),
+                    "temperature": main.get("temp", 0),
+                    "feels_like": main.get("feels_like", 0),
+                    "humidity": main.get("humidity", 0),
+                    "pressure": main.get("pressure", 0),
+                    "description": weather.get("description", ""),
+                    "main": weather.get("main", ""),
+                    "wind_speed": wind.get("speed", 0),
+                    "wind_degree": wind.get("deg", 0),
+                    "visibility": data.get("visibility", 0) / 1000,  # 转换为公里
+                    "source": "OpenWeatherMap"
+                }
+            else:
+                error_data = await response.text()
+                error_type = WeatherRequestError if _request_error_status(response.status) else Exception
+                raise error_type(f"OpenWeatherMap API返回错误: {response.status}, {error_data}")
+    
+    async def _qweather_location(self, session, city: str) -> Tuple[str, str]:
+        """查询和风天气城市位置信息，返回 (location_id, 城市名)，结果长期缓存"""
+        cached = self._qweather_loc_cache.get(city)
+        if cached is not None:
+            return cached
+        
+        # 使用城市搜索API获取位置信息
+        location_url = f"{self.qweather_url}/city/lookup"
+        location_params = {
+            "location": city,
+            "key": self.qweather_key,
+            "number": 1,
+            "adm": "CN"  # 限定在中国
+        }
+        
+        async with session.get(location_url, params=location_params) as location_response:
+            if location_response.status != 200:
+                error_text = await location_response.text()
+                error_type = WeatherRequestError if _request_error_status(location_response.status) else Exception
+                raise error_type(f"和风天气位置查询失败: {location_response.status}, {error_text}")
             
-            async with session.get(url, params=params, timeout=aiohttp.ClientTimeout(total=10)) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    weather = data.get("weather", [{}])[0]
-                    main = data.get("main", {})
-                    wind = data.get("wind", {})
-                    
-                    return {
-                        "success": True,
-                        "city": data.get("name", city),
-                        "country": data.get("sys", {}).get("country", ""),
-                        "temperature": main.get("temp", 0),
-                        "feels_like": main.get("feels_like", 0),
-                        "humidity": main.get("humidity", 0),
-                        "pressure": main.get("pressure", 0),
-                        "description": weather.get("description", ""),
-                        "main": weather.get("main", ""),
-                        "wind_speed": wind.get("speed", 0),
-                        "wind_degree": wind.get("deg", 0),
-                        "visibility": data.get("visibility", 0) / 1000,  # 转换为公里
-                        "source": "OpenWeatherMap"
-                    }
-                else:
-                    error_data = await response.text()
-                    raise Exception(f"OpenWeatherMap API返回错误: {response.status}, {error_data}")
+            location_data = await location_response.json()
+            code = location_data.get("code")
+            if code not in ("200", "204", "400", "404"):
+                raise Exception(f"和风天气位置查询失败: {code}")
+            if code != "200" or not location_data.get("location"):
+                # 无结果或参数错误：城市名无法识别，属于请求本身的问题
+                raise WeatherRequestError(f"未找到城市: {city}")
+        
+        location = location_data["location"][0]
+        result = (location["id"], location["name"])
+        self._qweather_loc_cache.set(city, result)
+        return result
     
     async def _query_qweather(self, city: str) -> Dict[str, Any]:
         """查询和风天气 API"""
-        async with aiohttp.ClientSession() as session:
-            # 先获取城市位置信息（使用城市搜索API）
-            location_url = f"{self.qweather_url}/city/lookup"
-            location_params = {
-                "location": city,
-                "key": self.qweather_key,
-                "number": 1,
-                "adm": "CN"  # 限定在中国
-            }
-            
-            async with session.get(location_url, params=location_params, timeout=aiohttp.ClientTimeout(total=10)) as location_response:
-                if location_response.status != 200:
-                    error_text = await location_response.text()
-                    raise Exception(f"和风天气位置查询失败: {location_response.status}, {error_text}")
-                
-                location_data = await location_response.json()
-                if location_data.get("code") != "200" or not location_data.get("location"):
-                    raise Exception(f"未找到城市: {city}")
-                
-                location_id = location_data["location"][0]["id"]
-                
-                # 查询天气
-                weather_url = f"{self.qweather_url}/weather/now"
-                weather_params = {
-                    "location": location_id,
-                    "key": self.qweather_key
-                }
-                
-                async with session.get(weather_url, params=weather_params, timeout=aiohttp.ClientTimeout(total=10)) as weather_response:
-                    if weather_response.status == 200:
-                        data = await weather_response.json()
-                        if data.get("code") == "200":
-                            now = data.get("now", {})
-                            return {
-                                "success": True,
-                                "city": location_data["location"][0]["name"],
-                                "country": "CN",  # 和风天气主要支持中国
-                                "temperature": float(now.get("temp", 0)),
-                                "feels_like": float(now.get("feelsLike", 0)),
-                                "humidity": int(now.get("humidity", 0)),
-                                "pressure": int(now.get("pressure", 0)),
-                                "description": now.get("text", ""),
-                                "main": now.get("text", ""),
-                                "wind_speed": float(now.get("windSpeed", 0)),
-                                "wind_degree": int(now.get("wind360", 0)),
-                                "visibility": float(now.get("vis", 0)),
-                                "source": "和风天气"
-                            }
-                        else:
-                            raise Exception(f"和风天气API返回错误: {data.get('code')}")
-                    else:
-                        raise Exception(f"和风天气API调用失败: {weather_response.status}")
+        session = await self._get_http_session()
+        
+        # 先获取城市位置信息（城市 -> location_id 的映射很少变化，命中缓存时只需一次请求）
+        from_cache = city in self._qweather_loc_cache
+        location_id, location_name = await self._qweather_location(session, city)
+        
+        # 查询天气
+        weather_url = f"{self.qweather_url}/weather/now"
+        weather_params = {
+            "location": location_id,
+            "key": self.qweather_key
+        }
+        
+        async with session.get(weather_url, params=weather_params) as weather_response:
+            if weather_response.status == 200:
+                data = await weather_response.json()
+                if data.get("code") == "200":
+                    now = data.get("now", {})
+                    return {
+                        "success": True,
+                        "city": location_name,
+                        "country": "CN",  # 和风天气主要支持中国
+                        "temperature": float(now.get("temp", 0)),
+                        "feels_like": float(now.get("feelsLike", 0)),
+                        "humidity": int(now.get("humidity", 0)),
+                        "pressure": int(now.get("pressure", 0)),
+                        "description": now.get("text", ""),
+                        "main": now.get("text", ""),
+                        "wind_speed": float(now.get("windSpeed", 0)),
+                        "wind_degree": int(now.get("wind360", 0)),
+                        "visibility": float(now.get("vis", 0)),
+                        "source": "和风天气"
+                    }
+                error = f"和风天气API返回错误: {data.get('code')}"
+                not_found = data.get("code") == "404"
+            else:
+                error = f"和风天气API调用失败: {weather_response.status}"
+                not_found = weather_response.status == 404
+        
+        if not_found and from_cache:
+            # 缓存的 location_id 已失效，丢弃后重新查询一次
+            logger.info("和风天气位置缓存失效，重新查询: {}", city)
+            self._qweather_loc_cache.pop(city)
+            return await self._query_qweather(city)
+        raise (WeatherRequestError if not_found else Exception)(error)
     
     async def _mock_query_weather(self, city: str, country: Optional[str] = None) -> Dict[str, Any]:
         """模拟天气查询"""
-        # 模拟天气数据
-        mock_weather = {
-            "北京": {
-                "temperature": 15,
-                "feels_like": 14,
-                "humidity": 45,
-                "pressure": 1013,
-                "description": "晴朗",
-                "main": "Clear",
-                "wind_speed": 3.5,
-                "wind_degree": 180,
-                "visibility": 10
-            },
-            "上海": {
-                "temperature": 18,
-                "feels_like": 17,
-                "humidity": 60,
-                "pressure": 1015,
-                "description": "多云",
-                "main": "Clouds",
-                "wind_speed": 4.2,
-                "wind_degree": 135,
-                "visibility": 8
-            },
-            "广州": {
-                "temperature": 25,
-                "feels_like": 26,
-                "humidity": 70,
-                "pressure": 1010,
-                "description": "小雨",
-                "main": "Rain",
-                "wind_speed": 2.8,
-                "wind_degree": 90,
-                "visibility": 6
-            }
-        }
-        
-        weather_data = mock_weather.get(city, {
-            "temperature": 20,
-            "feels_like": 19,
-            "humidity": 50,
-            "pressure": 1012,
-            "description": "晴朗",
-            "main": "Clear",
-            "wind_speed": 3.0,
-            "wind_degree": 180,
-            "visibility": 10
-        })
+        weather_data = _MOCK_WEATHER.get(city, _MOCK_WEATHER_DEFAULT)
         
         return {
             "success": True,
@@ -238,3 +477,15 @@ class WeatherTool:
             "source": "模拟数据",
             "note": "配置 OPENWEATHER_API_KEY 或 QWEATHER_API_KEY 后可使用真实API"
         }
+
+
+# 子进程内复用的天气工具实例（API Key 等配置从环境变量读取）
+_standalone_tool: Optional[WeatherTool] = None
+
+
+async def _query_one_standalone(city: str) -> Dict[str, Any]:
+    """在子进程中查询单个城市的天气（模块级函数，供 aiomultiprocess 调用）"""
+    global _standalone_tool
+    if _standalone_tool is None:
+        _standalone_tool = WeatherTool()
+    return await _standalone_tool.query_weather(city)
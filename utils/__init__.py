@@ -2,7 +2,11 @@
 
 try:
     from .logger import get_logger, setup_logging
+    from .cache import SingleFlight, TTLCache
+    from .circuit import Breaker, CircuitOpenError
 except ImportError:
     from utils.logger import get_logger, setup_logging
+    from utils.cache import SingleFlight, TTLCache
+    from utils.circuit import Breaker, CircuitOpenError
 
-__all__ = ["get_logger", "setup_logging"]
+__all__ = ["get_logger", "setup_logging", "TTLCache", "SingleFlight", "Breaker", "CircuitOpenError"]
@@ -0,0 +1,123 @@
+"""缓存工具"""
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+import asyncio
+import time
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+class TTLCache:
+    """带过期时间的 LRU 缓存（供单个事件循环内使用，不做线程同步）"""
+    
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        """
+        初始化缓存
+        
+        Args:
+            maxsize: 最大条目数，超出后淘汰最久未使用的条目
+            ttl: 默认过期时间（秒）
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """获取未过期的缓存值，不存在或已过期时返回 default"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        
+        self._data.move_to_end(key)
+        return value
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        写入缓存
+        
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 该条目的过期时间（秒），默认使用缓存的 ttl
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """移除并返回缓存值（不检查是否过期）"""
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+    
+    def clear(self):
+        """清空缓存"""
+        self._data.clear()
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+    
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """合并同一个键的并发调用：同一时刻只执行一次，其余调用等待并共享结果
+
+    调用在独立的任务中执行，某个调用方被取消（如客户端断开）只影响它自己，
+    其余等待者照常拿到结果；所有等待者都取消后才取消该任务。
+    """
+    
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行调用（相同键已在执行时等待其结果）
+        
+        Args:
+            key: 调用键
+            fn: 无参协程函数
+            
+        Returns:
+            调用结果
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda t: self._done(key, t))
+        
+        self._waiters[task] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters[task] == 1:
+                # 最后一个等待者也取消了，结果已无人需要
+                task.cancel()
+            raise
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+    
+    def _done(self, key: Hashable, task: asyncio.Task):
+        """任务结束：移除登记，并取出异常避免 "exception was never retrieved" 警告"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        self._waiters.pop(task, None)
+        if not task.cancelled():
+            task.exception()
+    
+    def __len__(self) -> int:
+        return len(self._inflight)
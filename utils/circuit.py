@@ -0,0 +1,112 @@
+"""熔断器
+
+外部服务持续失败时暂停调用一段时间，让回退逻辑立即生效，
+避免每次请求都先等满超时再降级。
+"""
+
+from typing import Awaitable, Callable, Optional, Tuple, Type, TypeVar
+import time
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+
+class Breaker:
+    """熔断器（供单个事件循环内使用）
+
+    连续失败达到阈值后打开（OPEN），期间调用直接抛出 CircuitOpenError；
+    经过 reset_timeout 后进入半开（HALF_OPEN），只放行一次探测调用，
+    探测成功则关闭（CLOSED），失败则重新打开。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        reset_timeout: float = 60.0,
+        ignore: Tuple[Type[BaseException], ...] = ()
+    ):
+        """
+        初始化熔断器
+
+        Args:
+            name: 名称（用于日志）
+            failure_threshold: 连续失败多少次后打开
+            reset_timeout: 打开后多久允许探测（秒）
+            ignore: 不计为失败的异常类型（如请求参数有误，与服务是否可用无关）
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.ignore = ignore
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        """当前状态：closed / open / half_open"""
+        if self._opened_at is None:
+            return CLOSED
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    async def call(self, coro_factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        通过熔断器执行调用
+
+        Args:
+            coro_factory: 返回协程的无参函数
+
+        Returns:
+            调用结果
+
+        Raises:
+            CircuitOpenError: 熔断器打开（或半开且已有探测调用在执行）
+        """
+        state = self.state
+        if state == OPEN or (state == HALF_OPEN and self._probing):
+            raise CircuitOpenError(f"{self.name} 熔断中，跳过调用")
+
+        # 只有发起探测的调用才能清除探测标记：打开前就已开始、此时才结束的调用不能清除它
+        is_probe = state == HALF_OPEN
+        if is_probe:
+            self._probing = True
+        try:
+            result = await coro_factory()
+        except self.ignore:
+            raise
+        except Exception:
+            self._record_failure()
+            raise
+        finally:
+            if is_probe:
+                self._probing = False
+
+        self._record_success()
+        return result
+
+    def _record_success(self):
+        if self._opened_at is not None:
+            logger.info("{} 恢复正常，熔断器关闭", self.name)
+        self._failures = 0
+        self._opened_at = None
+
+    def _record_failure(self):
+        self._failures += 1
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            # 半开探测失败或连续失败达到阈值：（重新）打开
+            self._opened_at = time.monotonic()
+            logger.warning("{} 连续失败 {} 次，熔断 {} 秒", self.name, self._failures, self.reset_timeout)
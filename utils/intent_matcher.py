@@ -0,0 +1,62 @@
+"""关键词意图匹配
+
+把多组关键词预先编译成一个 Aho-Corasick 自动机，对用户输入扫描一遍即可得到
+命中的全部意图，代替逐组逐个关键词的子串查找。未安装 pyahocorasick 时
+退化为逐个关键词的子串查找，结果相同。
+"""
+
+from typing import Dict, Iterable, Set
+
+# 尝试导入 pyahocorasick（可选依赖）
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+
+class IntentMatcher:
+    """多组关键词的意图匹配器（构建后只读，可在模块级共享）"""
+    
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        """
+        初始化匹配器
+        
+        Args:
+            groups: 意图名到关键词列表的映射，同一关键词可属于多个意图
+        """
+        self._groups = {intent: tuple(keywords) for intent, keywords in groups.items()}
+        self._automaton = None
+        
+        if AHOCORASICK_AVAILABLE:
+            keyword_intents: Dict[str, Set[str]] = {}
+            for intent, keywords in self._groups.items():
+                for keyword in keywords:
+                    keyword_intents.setdefault(keyword, set()).add(intent)
+            
+            automaton = ahocorasick.Automaton()
+            for keyword, intents in keyword_intents.items():
+                automaton.add_word(keyword, frozenset(intents))
+            automaton.make_automaton()
+            self._automaton = automaton
+    
+    def match(self, text: str) -> Set[str]:
+        """
+        返回文本命中的意图集合
+        
+        Args:
+            text: 待匹配文本（调用方负责大小写归一化）
+        
+        Returns:
+            至少命中一个关键词的意图名集合
+        """
+        if self._automaton is not None:
+            hits: Set[str] = set()
+            for _, intents in self._automaton.iter(text):
+                hits.update(intents)
+            return hits
+        
+        return {
+            intent for intent, keywords in self._groups.items()
+            if any(keyword in text for keyword in keywords)
+        }
@@ -0,0 +1,61 @@
+"""JSON 序列化工具
+
+安装了 orjson 时使用其 C 实现，否则回退到标准库 json。
+dumps 都返回 str、保留中文字符，并使用紧凑格式（{"a":1}，不带空格）。
+
+仍有以下差异：orjson 只接受 str 键、整数不超过 64 位、不支持 NaN/Infinity（输出为 null），
+标准库 json 则接受非 str 键和任意大小的整数，NaN/Infinity 原样输出（不是合法 JSON）。
+"""
+
+from typing import Any, Dict, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+
+if orjson is not None:
+    # 解析失败时抛出的异常（orjson 与标准库的 JSONDecodeError 都是 ValueError 的子类）
+    JSONDecodeError = orjson.JSONDecodeError
+    
+    def loads(data: Union[str, bytes, bytearray]) -> Any:
+        """解析 JSON 字符串"""
+        return orjson.loads(data)
+    
+    def dumps(obj: Any) -> str:
+        """序列化为 JSON 字符串"""
+        return orjson.dumps(obj).decode()
+else:
+    JSONDecodeError = json.JSONDecodeError
+    
+    def loads(data: Union[str, bytes, bytearray]) -> Any:
+        """解析 JSON 字符串"""
+        return json.loads(data)
+    
+    def dumps(obj: Any) -> str:
+        """序列化为 JSON 字符串"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads_object(text: str) -> Optional[Dict[str, Any]]:
+    """
+    将文本解析为 JSON 对象
+    
+    先检查首个非空白字符，明显不是 JSON 对象的文本（如纯文本回复）
+    直接返回 None，不进入解析和异常处理。
+    
+    Args:
+        text: 待解析文本
+        
+    Returns:
+        解析得到的字典，文本不是 JSON 对象时返回 None
+    """
+    if text.lstrip()[:1] != "{":
+        return None
+    try:
+        data = loads(text)
+    except JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
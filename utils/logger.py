@@ -2,6 +2,7 @@
 
 import logging
 import sys
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
@@ -12,9 +13,15 @@ def setup_logging(
     level: str = "INFO",
     log_file: Optional[str] = None,
     max_size: str = "10MB",
-    backup_count: int = 5
+    backup_count: int = 5,
+    enqueue: bool = True
 ):
-    """设置日志配置"""
+    """
+    设置日志配置
+    
+    enqueue 为 True 时日志先进入队列，由后台线程写出（含文件轮转和压缩），
+    不在事件循环线程上做 I/O；退出前应调用 logger.complete() 等待队列写完。
+    """
     # 移除默认处理器
     logger.remove()
     
@@ -23,7 +30,8 @@ def setup_logging(
         sys.stderr,
         format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
         level=level,
-        colorize=True
+        colorize=True,
+        enqueue=enqueue
     )
     
     # 添加文件输出
@@ -37,10 +45,14 @@ def setup_logging(
             level=level,
             rotation=max_size,
             retention=backup_count,
-            compression="zip"
+            # 只保留一个备份时不必压缩
+            compression="zip" if backup_count > 1 else None,
+            enqueue=enqueue,
+            delay=True
         )
 
 
+@lru_cache(maxsize=256)
 def get_logger(name: str) -> logger:
-    """获取日志器"""
+    """获取日志器（同名复用同一个绑定后的日志器）"""
     return logger.bind(name=name)
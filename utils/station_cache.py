@@ -0,0 +1,106 @@
+"""车站代码缓存
+
+车站名称到 12306 车站代码的映射几乎不会变化，缓存到磁盘后进程重启也能复用，
+避免每次查询都通过 MCP 服务解析车站代码。未安装 diskcache 时退化为进程内缓存。
+"""
+
+from typing import Optional
+import asyncio
+import os
+import sqlite3
+import threading
+
+from utils.cache import TTLCache
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 尝试导入 diskcache（可选依赖）
+try:
+    import diskcache
+    DISKCACHE_AVAILABLE = True
+    _DISK_ERRORS = (sqlite3.Error, OSError, diskcache.Timeout)
+except ImportError:
+    DISKCACHE_AVAILABLE = False
+    _DISK_ERRORS = (sqlite3.Error, OSError)
+
+STATION_CODE_TTL = 86400 * 30
+_CACHE_DIR = os.path.expanduser("~/.cache/12306_stations")
+
+_disk_cache = None
+_disk_lock = threading.Lock()
+_memory_cache = TTLCache(maxsize=4096, ttl=STATION_CODE_TTL)
+
+
+def _get_disk_cache():
+    """获取（必要时打开）磁盘缓存，打开失败时返回 None（在工作线程中调用）"""
+    global _disk_cache, DISKCACHE_AVAILABLE
+    with _disk_lock:
+        if _disk_cache is None and DISKCACHE_AVAILABLE:
+            try:
+                _disk_cache = diskcache.Cache(_CACHE_DIR)
+            except Exception as e:
+                logger.warning("打开车站代码磁盘缓存失败，改用内存缓存: {}", e)
+                DISKCACHE_AVAILABLE = False
+        return _disk_cache
+
+
+def _disk_get(station_name: str) -> Optional[str]:
+    """从磁盘缓存读取车站代码（同步 SQLite I/O，在工作线程中调用）"""
+    cache = _get_disk_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.get(station_name)
+    except _DISK_ERRORS as e:
+        logger.warning("读取车站代码磁盘缓存失败: {}", e)
+        return None
+
+
+def _disk_set(station_name: str, code: str):
+    """写入磁盘缓存（同步 SQLite I/O，在工作线程中调用）"""
+    cache = _get_disk_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(station_name, code, expire=STATION_CODE_TTL)
+    except _DISK_ERRORS as e:
+        logger.warning("写入车站代码磁盘缓存失败: {}", e)
+
+
+async def get_station_code(station_name: str) -> Optional[str]:
+    """
+    读取缓存的车站代码
+
+    先查进程内缓存，未命中时再到线程中读取磁盘缓存（不阻塞事件循环），
+    读到的结果回填进程内缓存。
+
+    Args:
+        station_name: 车站名称
+
+    Returns:
+        车站代码，未缓存时返回 None
+    """
+    code = _memory_cache.get(station_name)
+    if code is not None or not DISKCACHE_AVAILABLE:
+        return code
+    
+    code = await asyncio.to_thread(_disk_get, station_name)
+    if code:
+        _memory_cache.set(station_name, code)
+    return code
+
+
+async def set_station_code(station_name: str, code: str):
+    """
+    缓存车站代码（30 天过期），同时写入进程内缓存和磁盘缓存
+
+    Args:
+        station_name: 车站名称
+        code: 车站代码
+    """
+    if not code:
+        return
+    _memory_cache.set(station_name, code)
+    if DISKCACHE_AVAILABLE:
+        await asyncio.to_thread(_disk_set, station_name, code)
@@ -1,14 +1,26 @@
 """客服工作流图 - 基于 LangGraph 的多智能体协作流程"""
 
-from typing import Dict, Any, Literal
+from typing import Dict, Any, List, Literal
 from datetime import datetime
+from functools import cached_property
+import asyncio
+import os
+import re
 import uuid
 
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langchain_core.language_models import BaseChatModel
 
-from typing import Optional
+# 尝试导入 SQLite 检查点（可选依赖 langgraph-checkpoint-sqlite）
+try:
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    SQLITE_CHECKPOINT_AVAILABLE = True
+except ImportError:
+    SQLITE_CHECKPOINT_AVAILABLE = False
+
+from typing import AsyncIterator, Optional, Tuple
 import sys
 from pathlib import Path
 
@@ -23,21 +35,142 @@ from .state import CustomerServiceState
 from agents.receptionist_agent import ReceptionistAgent
 from agents.analyst_agent import AnalystAgent
 from agents.solution_expert_agent import SolutionExpertAgent
-from tools.mcp_tools import MCPToolManager
+from tools.mcp_tools import MCPToolManager, get_shared_tool_manager
 from memory.memory_store import MemoryStore
+from memory.checkpoint import get_shared_memory_saver
+from memory.semantic_cache import SemanticCache
+from utils.intent_matcher import IntentMatcher
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# 各类工具的触发关键词（用户输入会先转成小写）
+_ADDRESS_KEYWORDS = ("地址", "位置", "在哪里", "怎么去", "导航", "地图", "address", "location", "map")
+
+# 从用户输入中提取城市名时按顺序取第一个命中的，因此用元组保持顺序
+_COMMON_CITIES = (
+    "北京", "上海", "广州", "深圳", "杭州", "南京", "武汉", "成都", "重庆", "西安",
+    "天津", "苏州", "长沙", "郑州", "青岛", "大连", "厦门", "福州", "济南", "合肥",
+    "beijing", "shanghai", "guangzhou", "shenzhen",
+)
+# 出发站/到达站：分隔符两侧各取 2-6 个汉字或一个英文单词
+_TRAIN_ROUTE_RE = re.compile(
+    r"(?P<from>[\u4e00-\u9fff]{2,6}|[a-z]{2,12})\s*(?:到|至|->|-)\s*(?P<to>[\u4e00-\u9fff]{2,6}|[a-z]{2,12})"
+)
+# 出发站/到达站中需要去除的口语和票种词
+_ROUTE_NOISE_RE = re.compile("我想|查询|查|火车票|车票|火车|高铁|动车|的")
+_WEATHER_TERMS = frozenset(("天气", "温度", "气温"))
+_LOG_KEYWORDS = frozenset(("日志", "log"))
+# 分析师判定为这些复杂度时调用工具
+_TOOL_COMPLEXITIES = frozenset(("复杂", "中等"))
+# 配置了小模型时，简单且分析师置信度不低于该值的问题由小模型直接作答
+_DRAFT_CONFIDENCE = 0.8
+# 流式输出这些节点的 LLM token
+_STREAM_NODES = frozenset(("solution_expert", "draft_expert"))
+
+# 所有关键词预编译为一个匹配器，每条消息只扫描一遍
+_INTENT_MATCHER = IntentMatcher({
+    "weather": ("天气", "温度", "气温", "下雨", "晴天", "weather", "temperature", "climate"),
+    "address": _ADDRESS_KEYWORDS,
+    "poi": ("附近", "找", "搜索", "推荐", "哪里有", "poi", "search"),
+    "train": ("火车票", "车票", "高铁", "动车", "火车", "train", "ticket", "12306"),
+    "time": ("时间", "几点", "现在几点", "今天几号", "几号", "星期", "time", "date"),
+    "date": ("几号", "日期", "date", "星期"),
+    "knowledge_base": ("常见问题", "FAQ", "帮助", "怎么", "如何", "是什么", "知识库", "文档", "说明", "help", "faq", "knowledge"),
+    "file": ("日志", "文件", "查看", "读取", "log", "file", "查看日志", "读取文件"),
+    # 简单查询（时间、日期）跳过分析师直接调用工具
+    "simple": ("时间", "几点", "现在", "今天", "日期", "几号", "星期", "time", "date"),
+})
+
+
+# 各智能体结果和工具结果，节点出口处统一为字典
+_RESULT_KEYS = ("receptionist_result", "analysis_result", "solution_result", "tool_results")
+
+# 提取最终回复时依次尝试的 (结果字段, 回复字段, 来源)
+_RESPONSE_FIELDS = (
+    ("solution_result", "final_response", "解决方案专家"),
+    ("analysis_result", "analysis_report", "分析师"),
+    ("receptionist_result", "response", "接待员"),
+)
+
+
+def _normalize_results(state: CustomerServiceState) -> CustomerServiceState:
+    """把缺失或非字典的结果字段替换为空字典，之后的路由函数无需再做类型检查"""
+    for key in _RESULT_KEYS:
+        if not isinstance(state.get(key), dict):
+            state[key] = {}
+    return state
+
+
+def _confidence(analysis_result: Dict[str, Any]) -> float:
+    """读取分析师给出的置信度（LLM 输出，缺失或无法解析时视为 0）"""
+    try:
+        return float(analysis_result.get("confidence", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _extract_city(text: str) -> Optional[str]:
+    """从文本中提取常见城市名，未命中时返回原文本（为空时返回 None）"""
+    for city in _COMMON_CITIES:
+        if city in text:
+            return city
+    return text.strip() or None
+
 
 class CustomerServiceGraph:
     """客服工作流图"""
     
+    # 工作流拓扑是静态的，定义一次供所有实例回放
+    # 智能体节点：(节点名（同智能体属性名）, 日志名称)，节点函数由 _make_agent_node 生成
+    _AGENT_NODES = (
+        ("receptionist", "接待员"),
+        ("analyst", "问题分析师"),
+        ("solution_expert", "解决方案专家"),
+        ("draft_expert", "解决方案专家（小模型）"),
+    )
+    # 其他节点：(节点名, 方法名)
+    _NODES = (
+        ("call_tools", "_call_tools_node"),
+        ("human_intervention", "_human_intervention_node"),
+    )
+    _ENTRY_POINT = "receptionist"
+    # (起点, 路由方法名, ((路由结果, 目标节点), ...))
+    _CONDITIONAL_EDGES = (
+        ("receptionist", "_route_after_receptionist", (
+            ("analyst", "analyst"),
+            ("solution_expert", "solution_expert"),
+            ("call_tools", "call_tools"),  # 简单查询直接调用工具
+            ("end", END),
+        )),
+        ("analyst", "_route_after_analyst", (
+            ("call_tools", "call_tools"),
+            ("solution_expert", "solution_expert"),
+            ("draft_expert", "draft_expert"),
+        )),
+        ("call_tools", "_route_after_tools", (
+            ("solution_expert", "solution_expert"),
+            ("human_intervention", "human_intervention"),
+        )),
+        ("solution_expert", "_route_after_solution", (
+            ("human_intervention", "human_intervention"),
+            ("end", END),
+        )),
+    )
+    _EDGES = (
+        ("human_intervention", END),
+        ("draft_expert", END),
+    )
+    
     def __init__(
         self,
         llm: BaseChatModel,
         memory_store: MemoryStore = None,
-        enable_tools: bool = True
+        enable_tools: bool = True,
+        checkpointer: Optional[BaseCheckpointSaver] = None,
+        tool_manager: Optional[MCPToolManager] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        small_llm: Optional[BaseChatModel] = None
     ):
         """
         初始化工作流图
@@ -46,138 +179,177 @@ class CustomerServiceGraph:
             llm: 语言模型
             memory_store: 记忆存储
             enable_tools: 是否启用工具
+            checkpointer: 检查点存储，默认见 _default_checkpointer
+            tool_manager: 工具管理器，默认使用进程内共享的管理器
+            semantic_cache: 语义回复缓存（可选），相似提问直接复用之前的回复
+            small_llm: 小模型（可选），用于接待员的意图分类和路由，以及分析师判定为
+                简单且有把握的问题的直接作答；其余问题仍由分析师和解决方案专家使用 llm 处理
         """
         self.llm = llm
+        self.small_llm = small_llm
         self.memory_store = memory_store or MemoryStore()
         self.enable_tools = enable_tools
+        self._tool_manager = tool_manager
+        self.semantic_cache = semantic_cache
         
-        # 初始化智能体
-        self.receptionist = ReceptionistAgent(llm)
-        self.analyst = AnalystAgent(llm)
-        self.solution_expert = SolutionExpertAgent(llm)
-        
-        # 初始化工具管理器
-        self.tool_manager = MCPToolManager() if enable_tools else None
+        # 智能体和工具管理器在对应节点首次执行时才创建（见下方 cached_property）
         
         # 构建工作流图
         self.graph = self._build_graph()
         
         # 编译图（带记忆检查点）
-        self.checkpointer = MemorySaver()
+        self._checkpoint_conn = None
+        self._checkpoint_path = None
+        self._checkpoint_opened = False
+        self._checkpoint_lock = asyncio.Lock()
+        self.checkpointer = checkpointer or self._default_checkpointer()
         self.compiled_graph = self.graph.compile(checkpointer=self.checkpointer)
     
+    @cached_property
+    def receptionist(self) -> ReceptionistAgent:
+        """接待员智能体（首次使用时创建，配置了小模型时使用小模型）"""
+        return ReceptionistAgent(self.small_llm or self.llm)
+    
+    @cached_property
+    def analyst(self) -> AnalystAgent:
+        """问题分析师智能体（首次使用时创建）"""
+        return AnalystAgent(self.llm)
+    
+    @cached_property
+    def solution_expert(self) -> SolutionExpertAgent:
+        """解决方案专家智能体（首次使用时创建）"""
+        return SolutionExpertAgent(self.llm)
+    
+    @cached_property
+    def draft_expert(self) -> SolutionExpertAgent:
+        """使用小模型的解决方案专家（仅在配置了 small_llm 时使用，首次使用时创建）"""
+        return SolutionExpertAgent(self.small_llm)
+    
+    @cached_property
+    def tool_manager(self) -> Optional[MCPToolManager]:
+        """工具管理器（首次调用工具时获取，未启用工具时为 None）"""
+        if not self.enable_tools:
+            return None
+        return self._tool_manager or get_shared_tool_manager()
+    
+    def _default_checkpointer(self) -> BaseCheckpointSaver:
+        """
+        创建默认检查点存储
+        
+        已安装 langgraph-checkpoint-sqlite 时写入 SQLite（WAL 模式），长会话的状态
+        不再常驻进程内存；CHECKPOINT_DB=memory 或未安装时使用进程内共享的有界内存存储。
+        """
+        db_path = os.getenv("CHECKPOINT_DB", "./data/checkpoints.db")
+        if not SQLITE_CHECKPOINT_AVAILABLE or db_path == "memory":
+            return get_shared_memory_saver()
+        
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        # 连接在首次处理消息时打开（见 _open_checkpointer），在 aclose() 中关闭
+        self._checkpoint_path = db_path
+        self._checkpoint_conn = aiosqlite.connect(db_path)
+        logger.info("使用 SQLite 检查点: {}", db_path)
+        return AsyncSqliteSaver(self._checkpoint_conn)
+    
+    async def _open_checkpointer(self):
+        """
+        打开默认 SQLite 检查点的连接（只执行一次）
+        
+        并发的首批请求在锁上等待同一次打开完成；打开成功后才标记为已打开。
+        """
+        if self._checkpoint_conn is None or self._checkpoint_opened:
+            return
+        
+        async with self._checkpoint_lock:
+            if self._checkpoint_opened:
+                return
+            try:
+                await self._checkpoint_conn
+            except Exception:
+                # aiosqlite 连接对象只能打开一次：换一个新连接，下次请求重试
+                self._checkpoint_conn = aiosqlite.connect(self._checkpoint_path)
+                self.checkpointer.conn = self._checkpoint_conn
+                raise
+            self._checkpoint_opened = True
+    
     def _build_graph(self) -> StateGraph:
-        """构建工作流图"""
+        """构建工作流图（按类级别的拓扑描述回放，节点绑定到当前实例）"""
         workflow = StateGraph(CustomerServiceState)
         
         # 添加节点
-        workflow.add_node("receptionist", self._receptionist_node)
-        workflow.add_node("analyst", self._analyst_node)
-        workflow.add_node("solution_expert", self._solution_expert_node)
-        workflow.add_node("call_tools", self._call_tools_node)
-        workflow.add_node("human_intervention", self._human_intervention_node)
+        for name, label in self._AGENT_NODES:
+            workflow.add_node(name, self._make_agent_node(name, label))
+        for name, method in self._NODES:
+            workflow.add_node(name, getattr(self, method))
         
         # 设置入口点
-        workflow.set_entry_point("receptionist")
+        workflow.set_entry_point(self._ENTRY_POINT)
         
         # 添加条件路由
-        workflow.add_conditional_edges(
-            "receptionist",
-            self._route_after_receptionist,
-            {
-                "analyst": "analyst",
-                "solution_expert": "solution_expert",
-                "call_tools": "call_tools",  # 简单查询直接调用工具
-                "end": END
-            }
-        )
+        for source, router, path_map in self._CONDITIONAL_EDGES:
+            workflow.add_conditional_edges(source, getattr(self, router), dict(path_map))
         
-        workflow.add_conditional_edges(
-            "analyst",
-            self._route_after_analyst,
-            {
-                "call_tools": "call_tools",
-                "solution_expert": "solution_expert"
-            }
-        )
+        for source, target in self._EDGES:
+            workflow.add_edge(source, target)
         
-        workflow.add_conditional_edges(
-            "call_tools",
-            self._route_after_tools,
-            {
-                "solution_expert": "solution_expert",
-                "human_intervention": "human_intervention"
-            }
-        )
+        return workflow
+    
+    def _make_agent_node(self, name: str, label: str):
+        """
+        生成智能体节点函数
         
-        workflow.add_conditional_edges(
-            "solution_expert",
-            self._route_after_solution,
-            {
-                "human_intervention": "human_intervention",
-                "end": END
-            }
-        )
+        智能体在节点首次执行时才创建（见 cached_property），之后按属性名直接取用。
         
-        workflow.add_edge("human_intervention", END)
+        Args:
+            name: 节点名，同时也是智能体的属性名
+            label: 日志中的智能体名称
+        """
+        async def node(state: CustomerServiceState) -> CustomerServiceState:
+            logger.trace("进入{}节点", label)
+            state = await getattr(self, name).process(state)
+            return _normalize_results(state)
         
-        return workflow
-    
-    async def _receptionist_node(self, state: CustomerServiceState) -> CustomerServiceState:
-        """接待员节点"""
-        logger.info("进入接待员节点")
-        state = await self.receptionist.process(state)
-        return state
-    
-    async def _analyst_node(self, state: CustomerServiceState) -> CustomerServiceState:
-        """问题分析师节点"""
-        logger.info("进入问题分析师节点")
-        state = await self.analyst.process(state)
-        return state
-    
-    async def _solution_expert_node(self, state: CustomerServiceState) -> CustomerServiceState:
-        """解决方案专家节点"""
-        logger.info("进入解决方案专家节点")
-        state = await self.solution_expert.process(state)
-        return state
+        node.__name__ = f"_{name}_node"
+        return node
     
     async def _call_tools_node(self, state: CustomerServiceState) -> CustomerServiceState:
         """工具调用节点"""
-        logger.info("进入工具调用节点")
+        logger.trace("进入工具调用节点")
         
         if not self.tool_manager:
             state["tool_results"] = {}
             return state
         
-        analysis_result = state.get("analysis_result", {})
-        if not isinstance(analysis_result, dict):
-            analysis_result = {}
+        # 前序节点已把结果字段统一为字典（直接调用本节点时字段可能缺失）
+        analysis_result = state.get("analysis_result") or {}
         key_parameters = analysis_result.get("key_parameters", {})
         if not isinstance(key_parameters, dict):
             key_parameters = {}
         
-        receptionist_result = state.get("receptionist_result", {})
-        if not isinstance(receptionist_result, dict):
-            receptionist_result = {}
+        receptionist_result = state.get("receptionist_result") or {}
         problem_category = receptionist_result.get("problem_category", "")
         
-        tool_results = {}
-        user_input = state.get("user_input", "").lower()
+        user_input = state["user_input_lower"]
+        intents = _INTENT_MATCHER.match(user_input)
+        
+        # 每个工具分支都要求命中对应意图，一个都没命中时直接返回
+        if not intents:
+            state["tool_results"] = {}
+            return state
+        
+        # 先收集需要调用的工具，最后并发执行：(结果键, 工具方法名, 参数, 日志描述)
+        calls = []
         
         # 根据问题类型和关键词调用相应工具
         
         # 1. 天气查询（免费API）
-        weather_keywords = ["天气", "温度", "气温", "下雨", "晴天", "weather", "temperature", "climate"]
-        if any(keyword in user_input for keyword in weather_keywords):
+        if "weather" in intents:
             city = key_parameters.get("城市") or key_parameters.get("city") or key_parameters.get("地点")
             country = key_parameters.get("国家") or key_parameters.get("country")
             
             # 如果没有从参数中提取到，尝试从用户输入中提取城市名
             if not city:
                 # 简单的城市名提取（实际应该用更智能的方式）
-                common_cities = ["北京", "上海", "广州", "深圳", "杭州", "南京", "武汉", "成都", "重庆", "西安",
-                               "beijing", "shanghai", "guangzhou", "shenzhen"]
-                for city_name in common_cities:
+                for city_name in _COMMON_CITIES:
                     if city_name in user_input:
                         city = city_name
                         break
@@ -188,27 +360,17 @@ class CustomerServiceGraph:
                         city = user_input[:idx].strip()
             
             if city:
-                try:
-                    weather_result = await self.tool_manager.query_weather(
-                        city=city,
-                        country=country
-                    )
-                    tool_results["weather"] = weather_result
-                    logger.info(f"已查询天气: {city}")
-                except Exception as e:
-                    logger.error(f"天气查询失败: {e}")
-                    tool_results["weather"] = {"error": str(e)}
+                calls.append(("weather", "query_weather", {"city": city, "country": country}, f"天气查询: {city}"))
         
         # 2. 地址查询（高德地图）
-        address_keywords = ["地址", "位置", "在哪里", "怎么去", "导航", "地图", "address", "location", "map"]
-        if any(keyword in user_input for keyword in address_keywords):
+        if "address" in intents:
             address = key_parameters.get("地址") or key_parameters.get("位置") or key_parameters.get("address")
             city = key_parameters.get("城市") or key_parameters.get("city")
             
             # 如果没有从参数中提取到，尝试从用户输入中提取
             if not address:
                 # 简单的地址提取
-                for keyword in address_keywords:
+                for keyword in _ADDRESS_KEYWORDS:
                     if keyword in user_input:
                         # 提取关键词后的内容作为地址
                         idx = user_input.find(keyword)
@@ -217,187 +379,116 @@ class CustomerServiceGraph:
                             break
             
             if address:
-                try:
-                    address_result = await self.tool_manager.query_address(
-                        address=address,
-                        city=city
-                    )
-                    tool_results["address"] = address_result
-                    logger.info(f"已查询地址: {address}")
-                except Exception as e:
-                    logger.error(f"地址查询失败: {e}")
-                    tool_results["address"] = {"error": str(e)}
+                calls.append(("address", "query_address", {"address": address, "city": city}, f"地址查询: {address}"))
         
         # 3. 地点搜索（高德地图 POI）
-        poi_keywords = ["附近", "找", "搜索", "推荐", "哪里有", "poi", "search"]
-        if any(keyword in user_input for keyword in poi_keywords):
+        if "poi" in intents:
             keywords = key_parameters.get("关键词") or key_parameters.get("keywords")
             city = key_parameters.get("城市") or key_parameters.get("city")
             
             if keywords:
-                try:
-                    poi_result = await self.tool_manager.search_location(
-                        keywords=keywords,
-                        city=city
-                    )
-                    tool_results["poi_search"] = poi_result
-                    logger.info(f"已搜索地点: {keywords}")
-                except Exception as e:
-                    logger.error(f"地点搜索失败: {e}")
-                    tool_results["poi_search"] = {"error": str(e)}
+                calls.append(("poi_search", "search_location", {"keywords": keywords, "city": city}, f"地点搜索: {keywords}"))
         
         # 3.5. 火车票查询（12306 MCP 服务）
-        train_keywords = ["火车票", "车票", "高铁", "动车", "火车", "train", "ticket", "12306"]
-        if any(keyword in user_input for keyword in train_keywords):
+        if "train" in intents:
             from_station = key_parameters.get("出发站") or key_parameters.get("from_station") or key_parameters.get("起点")
             to_station = key_parameters.get("到达站") or key_parameters.get("to_station") or key_parameters.get("终点")
             date = key_parameters.get("日期") or key_parameters.get("date")
             
-            # 尝试从用户输入中提取出发站和到达站
+            # 尝试从用户输入中提取出发站和到达站（如"北京到上海"、"beijing-shanghai"）
             if not from_station or not to_station:
-                # 查找"到"或"->"或"-"
-                separators = ["到", "->", "-", "至"]
-                for sep in separators:
-                    if sep in user_input:
-                        idx = user_input.find(sep)
-                        if idx > 0:
-                            # 提取"到"之前的部分作为出发站
-                            from_part = user_input[:idx].strip()
-                            # 提取"到"之后的部分作为到达站
-                            to_part = user_input[idx + len(sep):].strip()
-                            
-                            # 清理出发站：去除前面的"我想"、"查询"等
-                            from_part = from_part.replace("我想", "").replace("查询", "").replace("查", "").strip()
-                            # 清理到达站：去除后面的"火车票"、"车票"、"的"等
-                            to_part = to_part.replace("火车票", "").replace("车票", "").replace("的", "").strip()
-                            
-                            # 提取城市名（常见城市列表）
-                            common_cities = ["北京", "上海", "广州", "深圳", "杭州", "南京", "武汉", "成都", "重庆", "西安",
-                                           "天津", "苏州", "长沙", "郑州", "青岛", "大连", "厦门", "福州", "济南", "合肥",
-                                           "beijing", "shanghai", "guangzhou", "shenzhen"]
-                            
-                            # 从from_part中提取城市名
-                            if not from_station:
-                                for city in common_cities:
-                                    if city in from_part:
-                                        from_station = city
-                                        break
-                                # 如果没找到，使用清理后的from_part（去除常见前缀）
-                                if not from_station and from_part:
-                                    from_station = from_part
-                            
-                            # 从to_part中提取城市名
-                            if not to_station:
-                                for city in common_cities:
-                                    if city in to_part:
-                                        to_station = city
-                                        break
-                                # 如果没找到，使用清理后的to_part（去除常见后缀）
-                                if not to_station and to_part:
-                                    to_station = to_part
-                            break
+                match = _TRAIN_ROUTE_RE.search(user_input)
+                if match:
+                    if not from_station:
+                        from_station = _extract_city(_ROUTE_NOISE_RE.sub("", match["from"]))
+                    if not to_station:
+                        to_station = _extract_city(_ROUTE_NOISE_RE.sub("", match["to"]))
             
             if from_station and to_station:
-                try:
-                    train_result = await self.tool_manager.query_train_tickets(
-                        from_station=from_station,
-                        to_station=to_station,
-                        date=date
-                    )
-                    tool_results["train_tickets"] = train_result
-                    logger.info(f"已查询火车票: {from_station} -> {to_station}")
-                except Exception as e:
-                    logger.error(f"火车票查询失败: {e}")
-                    tool_results["train_tickets"] = {"error": str(e)}
+                calls.append((
+                    "train_tickets",
+                    "query_train_tickets",
+                    {"from_station": from_station, "to_station": to_station, "date": date},
+                    f"火车票查询: {from_station} -> {to_station}"
+                ))
         
         # 4. 时间查询（MCP 服务）- 只在没有天气查询时才执行
         # 避免"现在天气"这样的查询被误识别为时间查询
-        if "weather" not in tool_results and "天气" not in user_input:
-            time_keywords = ["时间", "几点", "现在几点", "今天几号", "日期", "几号", "星期", "time", "date"]
+        if not any(call[0] == "weather" for call in calls) and "天气" not in user_input:
             # 更精确的时间查询匹配：必须包含明确的时间查询关键词，且不包含天气相关词
-            is_time_query = any(keyword in user_input for keyword in ["时间", "几点", "现在几点", "今天几号", "几号", "星期", "time", "date"])
+            is_time_query = "time" in intents
             # 如果只是"现在"或"今天"但没有明确的时间查询意图，且包含天气关键词，则不查询时间
             if "现在" in user_input or "今天" in user_input:
-                if "天气" in user_input or "温度" in user_input or "气温" in user_input:
+                if any(term in user_input for term in _WEATHER_TERMS):
                     is_time_query = False
             
             if is_time_query:
                 timezone = key_parameters.get("时区") or key_parameters.get("timezone")
                 
                 # 判断是查询时间还是日期
-                if any(kw in user_input for kw in ["几号", "日期", "date", "星期"]):
-                    try:
-                        date_result = await self.tool_manager.get_date_info()
-                        tool_results["date_info"] = date_result
-                        logger.info("已查询日期信息")
-                    except Exception as e:
-                        logger.error(f"日期查询失败: {e}")
-                        tool_results["date_info"] = {"error": str(e)}
+                if "date" in intents:
+                    calls.append(("date_info", "get_date_info", {}, "日期查询"))
                 else:
-                    try:
-                        time_result = await self.tool_manager.query_time(timezone)
-                        tool_results["time_info"] = time_result
-                        logger.info("已查询时间信息")
-                    except Exception as e:
-                        logger.error(f"时间查询失败: {e}")
-                        tool_results["time_info"] = {"error": str(e)}
+                    calls.append(("time_info", "query_time", {"timezone": timezone}, "时间查询"))
         
         # 5. 知识库查询（Memory MCP）- 适合接待员和解决方案专家
-        kb_keywords = ["常见问题", "FAQ", "帮助", "怎么", "如何", "是什么", "知识库", "文档", "说明", "help", "faq", "knowledge"]
-        if any(keyword in user_input for keyword in kb_keywords):
+        if "knowledge_base" in intents:
             query = key_parameters.get("查询") or key_parameters.get("query") or user_input
-            try:
-                kb_result = await self.tool_manager.search_knowledge_base(query)
-                tool_results["knowledge_base"] = kb_result
-                logger.info(f"已搜索知识库: {query}")
-            except Exception as e:
-                logger.error(f"知识库搜索失败: {e}")
-                tool_results["knowledge_base"] = {"error": str(e)}
+            # 合并多余空白，让只差空格的重复提问命中知识库结果缓存
+            query = " ".join(str(query).split())
+            calls.append(("knowledge_base", "search_knowledge_base", {"query": query}, f"知识库搜索: {query}"))
         
         # 6. 文件系统操作（Filesystem MCP）- 适合问题分析师查看日志
-        file_keywords = ["日志", "文件", "查看", "读取", "log", "file", "查看日志", "读取文件"]
-        if any(keyword in user_input for keyword in file_keywords):
+        if "file" in intents:
             file_path = key_parameters.get("文件路径") or key_parameters.get("file_path")
             
             # 尝试从用户输入中提取文件路径
             if not file_path:
-                for keyword in ["日志", "log"]:
-                    if keyword in user_input:
-                        # 默认日志路径
-                        file_path = "/app/logs/app.log"
-                        break
+                if any(keyword in user_input for keyword in _LOG_KEYWORDS):
+                    # 默认日志路径
+                    file_path = "/app/logs/app.log"
             
             if file_path:
-                try:
-                    file_result = await self.tool_manager.read_file(file_path)
-                    tool_results["file_content"] = file_result
-                    logger.info(f"已读取文件: {file_path}")
-                except Exception as e:
-                    logger.error(f"文件读取失败: {e}")
-                    tool_results["file_content"] = {"error": str(e)}
+                calls.append(("file_content", "read_file", {"file_path": file_path}, f"文件读取: {file_path}"))
+        
+        # 各工具调用相互独立，并发执行（并发数由工具管理器的信号量限制），耗时取决于最慢的一个
+        results = await self.tool_manager.batch([(method, kwargs) for _, method, kwargs, _ in calls])
+        tool_results = {}
+        invoked = {}
+        failed = {}
+        for (key, _, _, description), result in zip(calls, results):
+            invoked[key] = description
+            if result.get("error"):
+                failed[key] = result["error"]
+            tool_results[key] = result
+        
+        # 本次所有工具调用合并为一条结构化日志（有失败时按错误级别记录）
+        if invoked:
+            logger.bind(tools=invoked, failed=failed, session_id=state.get("session_id")).log(
+                "ERROR" if failed else "DEBUG",
+                "工具调用完成: {}，失败: {}",
+                "、".join(invoked.values()),
+                failed or "无"
+            )
         
         state["tool_results"] = tool_results
         return state
     
     async def _human_intervention_node(self, state: CustomerServiceState) -> CustomerServiceState:
         """人工介入节点"""
-        logger.info("进入人工介入节点")
+        logger.trace("进入人工介入节点")
         state["needs_human_intervention"] = True
         return state
     
     def _route_after_receptionist(self, state: CustomerServiceState) -> Literal["analyst", "solution_expert", "call_tools", "end"]:
         """接待员后的路由决策"""
         next_agent = state.get("next_agent")
-        receptionist_result = state.get("receptionist_result", {})
-        if not isinstance(receptionist_result, dict):
-            receptionist_result = {}
-        needs_analysis = receptionist_result.get("needs_analysis", True)
-        user_input = state.get("user_input", "").lower()
+        needs_analysis = state["receptionist_result"].get("needs_analysis", True)
+        user_input = state["user_input_lower"]
         
         # 对于简单查询（时间、日期），直接调用工具，跳过分析师
-        simple_queries = ["时间", "几点", "现在", "今天", "日期", "几号", "星期", "time", "date"]
-        if any(keyword in user_input for keyword in simple_queries):
-            logger.info("检测到简单查询，直接调用工具")
+        if "simple" in _INTENT_MATCHER.match(user_input):
+            logger.debug("检测到简单查询，直接调用工具")
             return "call_tools"
         
         if not needs_analysis:
@@ -410,29 +501,36 @@ class CustomerServiceGraph:
         else:
             return "analyst"  # 默认路由到分析师
     
-    def _route_after_analyst(self, state: CustomerServiceState) -> Literal["call_tools", "solution_expert"]:
+    def _route_after_analyst(self, state: CustomerServiceState) -> Literal["call_tools", "solution_expert", "draft_expert"]:
         """分析师后的路由决策"""
         # 根据问题复杂度决定是否需要调用工具
-        analysis_result = state.get("analysis_result", {})
-        if not isinstance(analysis_result, dict):
-            analysis_result = {}
+        analysis_result = state["analysis_result"]
         complexity = analysis_result.get("complexity", "中等")
         has_key_params = bool(analysis_result.get("key_parameters", {}))
         
-        if self.enable_tools and (complexity in ["复杂", "中等"] or has_key_params):
-            return "call_tools"
-        else:
-            return "solution_expert"
+        if self.enable_tools and (complexity in _TOOL_COMPLEXITIES or has_key_params):
+            # 工具调用节点的每个分支都要求命中对应意图，一个都没命中时跳过该节点，
+            # 省去一次节点调度和检查点写入
+            if _INTENT_MATCHER.match(state["user_input_lower"]):
+                return "call_tools"
+            logger.debug("未命中任何工具意图，跳过工具调用")
+        
+        # 简单且分析师有把握的问题由小模型直接作答，省去大模型生成完整回复的耗时
+        if (
+            self.small_llm is not None
+            and complexity == "简单"
+            and _confidence(analysis_result) >= _DRAFT_CONFIDENCE
+        ):
+            return "draft_expert"
+        
+        return "solution_expert"
     
     def _route_after_tools(self, state: CustomerServiceState) -> Literal["solution_expert", "human_intervention"]:
         """工具调用后的路由决策"""
-        tool_results = state.get("tool_results", {})
-        if not isinstance(tool_results, dict):
-            tool_results = {}
-        
         # 如果工具调用失败且是关键信息，需要人工介入
-        order_info = tool_results.get("order_info", {})
-        if isinstance(order_info, dict) and order_info.get("error") and "订单" in state.get("user_input", ""):
+        # （tool_results 的值来自 MCPToolManager.batch，总是字典）
+        order_info = state["tool_results"].get("order_info", {})
+        if order_info.get("error") and "订单" in state["user_input"]:
             return "human_intervention"
         
         return "solution_expert"
@@ -440,16 +538,9 @@ class CustomerServiceGraph:
     def _route_after_solution(self, state: CustomerServiceState) -> Literal["human_intervention", "end"]:
         """解决方案专家后的路由决策"""
         # 如果解决方案复杂度高，可能需要人工确认
-        analysis_result = state.get("analysis_result", {})
-        if not isinstance(analysis_result, dict):
-            analysis_result = {}
-        complexity = analysis_result.get("complexity", "中等")
+        complexity = state["analysis_result"].get("complexity", "中等")
         
-        solution_result = state.get("solution_result", {})
-        if not isinstance(solution_result, dict):
-            solution_result = {}
-        
-        if complexity == "复杂" and solution_result.get("needs_confirmation", False):
+        if complexity == "复杂" and state["solution_result"].get("needs_confirmation", False):
             return "human_intervention"
         
         return "end"
@@ -471,9 +562,159 @@ class CustomerServiceGraph:
         Returns:
             处理结果
         """
+        vector, cached, session_id, initial_state, config = await self._start_run(user_id, message, session_id)
+        if cached is not None:
+            return await self._cached_run(user_id, message, session_id, cached)
+        
+        # 执行工作流
+        try:
+            await self._open_checkpointer()
+            final_state = await self.compiled_graph.ainvoke(initial_state, config)
+            return await self._finish_run(user_id, message, session_id, final_state, vector)
+        except Exception as e:
+            return await self._failed_run(user_id, message, session_id, e)
+    
+    async def process_message_stream(
+        self,
+        user_id: str,
+        message: str,
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式处理用户消息
+        
+        解决方案专家调用 LLM 生成回复时逐段产出 {"type": "token", "content": ...}，
+        工作流结束后产出 {"type": "result", ...}（内容与 process_message 的返回值相同）。
+        直接由工具结果生成回复时没有 token 事件，只有最终结果。
+        
+        Args:
+            user_id: 用户ID
+            message: 用户消息
+            session_id: 会话ID（可选）
+            
+        Yields:
+            token 事件和最终结果
+        """
+        vector, cached, session_id, initial_state, config = await self._start_run(user_id, message, session_id)
+        if cached is not None:
+            yield {"type": "result", **await self._cached_run(user_id, message, session_id, cached)}
+            return
+        
+        try:
+            await self._open_checkpointer()
+            final_state = None
+            async for event in self.compiled_graph.astream_events(initial_state, config, version="v2"):
+                kind = event["event"]
+                if kind == "on_chat_model_stream":
+                    if event.get("metadata", {}).get("langgraph_node") in _STREAM_NODES:
+                        content = event["data"]["chunk"].content
+                        if content:
+                            yield {"type": "token", "content": content}
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # 没有父节点的 chain 结束事件即整个工作流结束，输出为最终状态
+                    final_state = event["data"].get("output")
+            result = await self._finish_run(user_id, message, session_id, final_state, vector)
+        except Exception as e:
+            result = await self._failed_run(user_id, message, session_id, e)
+        
+        yield {"type": "result", **result}
+    
+    async def stream_message(
+        self,
+        user_id: str,
+        message: str,
+        session_id: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        流式处理用户消息，只产出回复文本
+        
+        回复由 LLM 逐段生成时产出各段文本；命中缓存、直接由工具结果生成回复
+        或处理失败时没有 token 事件，一次性产出完整回复。
+        
+        Args:
+            user_id: 用户ID
+            message: 用户消息
+            session_id: 会话ID（可选）
+        
+        Yields:
+            回复文本片段
+        """
+        streamed = False
+        async for event in self.process_message_stream(user_id, message, session_id):
+            if event["type"] == "token":
+                streamed = True
+                yield event["content"]
+            elif not streamed:
+                yield event["response"]
+    
+    async def _start_run(
+        self,
+        user_id: str,
+        message: str,
+        session_id: Optional[str]
+    ) -> Tuple[Optional[List[float]], Optional[str], str, CustomerServiceState, Dict[str, Any]]:
+        """
+        并发查找语义缓存和加载对话历史
+        
+        两者相互独立：向量化是一次网络请求，加载历史是一次数据库读取，
+        并发执行后耗时取两者中较长的一个。缓存命中时历史不再使用。
+        
+        Returns:
+            (提问向量, 缓存的回复, 会话ID, 初始状态, 运行配置)
+        """
+        (vector, cached), (session_id, initial_state, config) = await asyncio.gather(
+            self._semantic_lookup(user_id, message),
+            self._prepare_run(user_id, message, session_id)
+        )
+        return vector, cached, session_id, initial_state, config
+    
+    async def _semantic_lookup(
+        self,
+        user_id: str,
+        message: str
+    ) -> Tuple[Optional[List[float]], Optional[str]]:
+        """
+        向量化提问并查找语义缓存
+        
+        Returns:
+            (提问向量, 缓存的回复)；未启用缓存或向量化失败时为 (None, None)
+        """
+        if self.semantic_cache is None:
+            return None, None
+        try:
+            vector = await self.semantic_cache.embed(message)
+        except Exception as e:
+            logger.warning("提问向量化失败，跳过语义缓存: {}", e)
+            return None, None
+        return vector, self.semantic_cache.lookup(user_id, vector)
+    
+    async def _cached_run(
+        self,
+        user_id: str,
+        message: str,
+        session_id: str,
+        response: str
+    ) -> Dict[str, Any]:
+        """语义缓存命中：跳过工作流，保存对话历史后直接返回缓存的回复"""
+        await self._save_turn(user_id, message, session_id, response)
+        
+        return {
+            "session_id": session_id,
+            "response": response,
+            "needs_human_intervention": False,
+            "cached": True
+        }
+    
+    async def _prepare_run(
+        self,
+        user_id: str,
+        message: str,
+        session_id: Optional[str]
+    ) -> Tuple[str, CustomerServiceState, Dict[str, Any]]:
+        """加载对话历史并构建初始状态和运行配置"""
         # 获取或创建会话ID
         if not session_id:
-            session_id = str(uuid.uuid4())
+            session_id = uuid.uuid4().hex
         
         # 加载对话历史
         conversation_history = await self.memory_store.get_conversation_history(
@@ -482,9 +723,11 @@ class CustomerServiceGraph:
         )
         
         # 构建初始状态
+        now = datetime.now()
         initial_state: CustomerServiceState = {
             "user_id": user_id,
             "user_input": message,
+            "user_input_lower": message.lower(),
             "conversation_history": conversation_history,
             "receptionist_result": None,
             "analysis_result": None,
@@ -498,105 +741,121 @@ class CustomerServiceGraph:
             "error": None,
             "retry_count": 0,
             "session_id": session_id,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now()
+            "created_at": now,
+            "updated_at": now
         }
         
-        # 执行工作流
+        config = {"configurable": {"thread_id": session_id}}
+        return session_id, initial_state, config
+    
+    async def _save_user_message(self, user_id: str, message: str, session_id: str):
+        """只保存用户消息（工作流没有产出回复时使用，失败只记录日志）"""
         try:
-            config = {"configurable": {"thread_id": session_id}}
-            final_state = await self.compiled_graph.ainvoke(initial_state, config)
-            
-            # 检查 final_state 是否为 None
-            if final_state is None:
-                logger.error("工作流返回的状态为 None")
-                return {
-                    "session_id": session_id,
-                    "response": "抱歉，系统处理出现错误，请稍后重试。",
-                    "error": "工作流返回状态为空",
-                    "needs_human_intervention": True
-                }
-            
-            # 确保 final_state 是字典类型
-            if not isinstance(final_state, dict):
-                logger.error(f"工作流返回的状态类型错误: {type(final_state)}")
-                return {
-                    "session_id": session_id,
-                    "response": "抱歉，系统处理出现错误，请稍后重试。",
-                    "error": f"状态类型错误: {type(final_state)}",
-                    "needs_human_intervention": True
-                }
-            
-            # 保存对话历史
-            await self.memory_store.save_message(
-                user_id=user_id,
-                session_id=session_id,
-                role="user",
-                content=message
-            )
-            
-            # 获取最终回复
-            final_response = self._extract_final_response(final_state)
-            
-            await self.memory_store.save_message(
-                user_id=user_id,
-                session_id=session_id,
-                role="assistant",
-                content=final_response
-            )
-            
-            return {
-                "session_id": session_id,
-                "response": final_response,
-                "state": final_state,
-                "needs_human_intervention": final_state.get("needs_human_intervention", False) if isinstance(final_state, dict) else False
-            }
-            
+            await self.memory_store.save_message(user_id=user_id, session_id=session_id, role="user", content=message)
         except Exception as e:
-            logger.error(f"工作流执行失败: {e}", exc_info=True)
+            logger.warning("保存用户消息失败: {}", e)
+    
+    async def _save_turn(self, user_id: str, message: str, session_id: str, response: str):
+        """在一个事务中保存本轮的用户消息和助手回复"""
+        await self.memory_store.save_messages(user_id, session_id, [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": response},
+        ])
+    
+    async def _finish_run(
+        self,
+        user_id: str,
+        message: str,
+        session_id: str,
+        final_state: Optional[CustomerServiceState],
+        vector: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        """
+        保存对话历史并构建处理结果
+        
+        ainvoke 总是返回状态字典（失败时抛出异常，由调用方交给 _failed_run），
+        只有流式处理没有收到工作流结束事件时 final_state 才为 None。
+        """
+        if final_state is None:
+            logger.error("工作流返回的状态为 None")
+            await self._save_user_message(user_id, message, session_id)
             return {
                 "session_id": session_id,
-                "response": "抱歉，处理过程中出现了错误，请稍后重试。",
-                "error": str(e),
+                "response": "抱歉，系统处理出现错误，请稍后重试。",
+                "error": "工作流返回状态为空",
                 "needs_human_intervention": True
             }
+        
+        # 获取最终回复
+        final_response = self._extract_final_response(final_state)
+        
+        # 保存对话历史：用户消息和助手回复一次写入
+        await self._save_turn(user_id, message, session_id, final_response)
+        
+        needs_human_intervention = final_state.get("needs_human_intervention", False)
+        if vector is not None and self._is_cacheable(final_state):
+            self.semantic_cache.add(user_id, vector, final_response)
+        
+        return {
+            "session_id": session_id,
+            "response": final_response,
+            "state": final_state,
+            "needs_human_intervention": needs_human_intervention
+        }
     
-    def _extract_final_response(self, state: CustomerServiceState) -> str:
-        """提取最终回复"""
-        # 确保 state 是字典类型
-        if not isinstance(state, dict):
-            logger.error(f"状态类型错误: {type(state)}")
-            return "抱歉，系统处理出现错误，请稍后重试。"
-        
-        # 优先使用解决方案专家的回复
-        solution_result = state.get("solution_result")
-        if solution_result and isinstance(solution_result, dict):
-            response = solution_result.get("final_response", "")
-            if response and isinstance(response, str) and response.strip():
-                logger.info("使用解决方案专家的回复")
-                return response
+    @staticmethod
+    def _is_cacheable(final_state: CustomerServiceState) -> bool:
+        """
+        回复能否写入语义缓存
         
-        # 其次使用分析师的回复
-        analysis_result = state.get("analysis_result")
-        if analysis_result and isinstance(analysis_result, dict):
-            response = analysis_result.get("analysis_report", "")
-            if response and isinstance(response, str) and response.strip():
-                logger.info("使用分析师的回复")
-                return response
+        只缓存正常完成、无需人工介入且不依赖实时数据的回复：用到工具结果
+        （时间、天气、车票等）或命中工具意图的提问，再次提问时答案可能已经变化。
+        """
+        return not (
+            final_state.get("needs_human_intervention")
+            or final_state.get("error")
+            or final_state["tool_results"]
+            or _INTENT_MATCHER.match(final_state["user_input_lower"])
+        )
+    
+    async def _failed_run(self, user_id: str, message: str, session_id: str, e: Exception) -> Dict[str, Any]:
+        """工作流执行失败时的处理结果（仍保存用户消息）"""
+        logger.opt(exception=True).bind(user_id=user_id, session_id=session_id).error("工作流执行失败: {}", e)
+        await self._save_user_message(user_id, message, session_id)
+        return {
+            "session_id": session_id,
+            "response": "抱歉，处理过程中出现了错误，请稍后重试。",
+            "error": str(e),
+            "needs_human_intervention": True
+        }
+    
+    async def aclose(self):
+        """
+        释放检查点存储持有的连接
         
-        # 最后使用接待员的回复
-        receptionist_result = state.get("receptionist_result")
-        if receptionist_result and isinstance(receptionist_result, dict):
-            response = receptionist_result.get("response", "")
-            if response and isinstance(response, str) and response.strip():
-                logger.info("使用接待员的回复")
+        工具管理器不在这里关闭：传入的管理器由调用方负责关闭，共享管理器由多个工作流共用，
+        在应用关闭时通过 close_shared_tool_manager() 关闭。
+        """
+        if self._checkpoint_conn is not None:
+            await self._checkpoint_conn.close()
+    
+    def _extract_final_response(self, state: CustomerServiceState) -> str:
+        """提取最终回复（state 为已归一化的最终状态，结果字段均为字典）"""
+        # 依次使用解决方案专家、分析师、接待员的回复
+        for key, field, source in _RESPONSE_FIELDS:
+            response = state[key].get(field)
+            if isinstance(response, str) and response.strip():
+                logger.debug("使用{}的回复", source)
                 return response
         
         # 如果所有回复都为空，记录调试信息并返回默认消息
-        logger.warning(f"无法从状态中提取有效回复。状态键: {list(state.keys())}")
-        logger.warning(f"solution_result: {state.get('solution_result')}")
-        logger.warning(f"analysis_result: {state.get('analysis_result')}")
-        logger.warning(f"receptionist_result: {state.get('receptionist_result')}")
+        logger.warning(
+            "无法从状态中提取有效回复。状态键: {}，solution_result: {}，analysis_result: {}，receptionist_result: {}",
+            list(state.keys()),
+            state["solution_result"],
+            state["analysis_result"],
+            state["receptionist_result"]
+        )
         return "抱歉，我无法理解您的问题，请重新描述一下。"
     
     def __repr__(self) -> str:
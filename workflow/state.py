@@ -10,6 +10,7 @@ class CustomerServiceState(TypedDict):
     # 用户信息
     user_id: str
     user_input: str
+    user_input_lower: str  # 小写的用户输入，供关键词匹配和路由复用
     conversation_history: List[Dict[str, str]]
     
     # 智能体处理结果
@@ -34,6 +35,6 @@ class CustomerServiceState(TypedDict):
     retry_count: int
     
     # 元数据
-    session_id: str
+    session_id: str  # 未传入时生成 32 位十六进制（uuid4().hex，不含连字符）
     created_at: datetime
     updated_at: datetime